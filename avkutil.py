@@ -17,27 +17,38 @@
 
     ftime(seconds) - returns h:m:s or m:s if there's no hours.
 
+    screen - shared `Screen`: in-process clear / home and cached terminal size
+        screen.clear() => clear screen
+        screen.size() => height, width
+
     Term() - terminal stuff
         term.size() => height, width
         term.clear() => clear terminal
-        term.getch() => get one char at a time
+        term.getch() => get one key at a time
+        term.poll_keys() => keys pressed so far, without waiting
+        with term.raw(): ... => stay in raw mode within the block
+        Term(source) => read keys from an input source instead, see `inputs`
 
 Andrei Kulakov <ak@silmarill.org>
 """
 
 import os
-try:
-    import commands
-except:
-    pass
 import time
+import struct
+from collections import deque
+from contextlib import contextmanager
 try:
     from termios import *
 except ImportError:
-    from TERMIOS import *
+    try:
+        from TERMIOS import *
+    except ImportError:
+        pass        # no terminal control here, e.g. on Windows; `Term` then needs an input source
 from types import *
 from sys import stdin, stdout
 
+import inputs
+
 dbg = 1
 enable_color = 1
 hotkeycol = "red"
@@ -76,8 +87,9 @@ def vol(vol=None):
         Uses external mixer called aumix. One optional argument, vol, may
         be an int or a string. If a string, it can be of the form "+10".
     """
+    from subprocess import getoutput
     if vol: os.system("aumix -v%s" % vol)
-    else: return commands.getoutput("aumix -vq").split()[1][:-1]
+    else: return getoutput("aumix -vq").split()[1][:-1]
 
 def progress(ratio, length=40, col=1, cols=("yellow", None, "cyan"), nocol="=."):
     """ Text mode progress bar.
@@ -197,57 +209,257 @@ def ftime(seconds, suffixes=['y','w','d','','',''], separator=':', nosec=False):
 
 # print ftime(105, nosec=True)
 
+class Screen(object):
+    """ Terminal output shared by everything that draws: ANSI sequences to clear the screen and move the
+        cursor are written in-process, and the terminal size is cached and only queried again after the
+        terminal is resized (SIGWINCH).
+
+        If `out` isn't a terminal, clear() writes blank lines instead of escape sequences.
+    """
+    goto       = "\x1b[%d;%dH"
+    home_seq   = "\x1b[H"
+    clear_seq  = "\x1b[H\x1b[2J"
+    erase_line = "\x1b[K"
+    def_size   = 24, 80
+
+    def __init__(self, out=None):
+        self.out       = out or stdout
+        self.cached    = None
+        self.listening = False
+
+    def write(self, text):
+        self.out.write(text)
+
+    def flush(self):
+        self.out.flush()
+
+    def isatty(self):
+        try                                    : return self.out.isatty()
+        except (AttributeError, ValueError)    : return False
+
+    def clear(self):
+        """Clear screen and move the cursor to the top left corner."""
+        self.write(self.clear_seq if self.isatty() else '\n' * self.size()[0])
+        self.flush()
+
+    def home(self):
+        """Move the cursor to the top left corner, e.g. to redraw a frame over the previous one."""
+        self.write(self.home_seq)
+
+    def cline(self):
+        """Clear current line."""
+        self.write('\r' + self.erase_line)
+        self.flush()
+
+    def size(self):
+        """Return terminal size as tuple (height, width)."""
+        if self.cached is None:
+            self.listen()
+            self.cached = self.query_size()
+        return self.cached
+
+    def query_size(self):
+        try:
+            import fcntl
+            h, w = struct.unpack("hhhh", fcntl.ioctl(self.out.fileno(), TIOCGWINSZ, b"\000"*8))[0:2]
+        except (ImportError, NameError, AttributeError, ValueError, OSError):
+            h = w = 0
+        return (h, w) if h else self.def_size
+
+    def listen(self):
+        """Forget the cached size when the terminal is resized; any previous SIGWINCH handler is still called."""
+        if self.listening:
+            return
+        self.listening = True
+        try:
+            import signal
+            self.prev_handler = signal.signal(signal.SIGWINCH, self.resized)
+        except (ValueError, AttributeError):
+            self.prev_handler = None            # not in the main thread or no SIGWINCH: query every time
+            self.listening    = False
+
+    def resized(self, signum, frame):
+        self.cached = None
+        if callable(self.prev_handler):
+            self.prev_handler(signum, frame)
+
+screen = Screen()
+
+
+esc_delay = 0.05    # seconds to wait for the rest of an escape sequence or UTF-8 character split across reads
+
+
+def key_length(buf):
+    """ Length of the first key in `buf`, or 0 if it's incomplete so far; a key is an escape sequence
+        (e.g. ESC [ D for left arrow), a UTF-8 encoded character or a single byte.
+    """
+    b = buf[0]
+    if b == 0x1b:
+        if len(buf) == 1:
+            return 0
+        if buf[1] == 0x5b:                              # ESC [ - parameters, then a byte in 0x40-0x7e
+            for i in range(2, len(buf)):
+                if 0x40 <= buf[i] <= 0x7e:
+                    return i + 1
+            return 0
+        if buf[1] == 0x4f:                              # ESC O x
+            return 3 if len(buf) > 2 else 0
+        return 1 if buf[1] == 0x1b else 2               # ESC twice is two Esc keys, otherwise Alt+key
+    if b >= 0xc0:
+        n = 2 if b < 0xe0 else 3 if b < 0xf0 else 4
+        return n if len(buf) >= n else 0
+    return 1
+
+def key_name(seq):
+    """ Key from its bytes `seq`: the character itself, or for escape sequences and control keys, escaped as
+        they've always been returned by `Term.getch()`, e.g. r'\x1b[D' for left arrow.
+    """
+    seq = bytes(seq)
+    if seq[0] < 0x20 or seq[0] == 0x7f:
+        return str(seq)[2:-1]
+    return seq.decode("utf-8", "replace")
+
+
 class Term:
     """ Linux terminal management.
 
-        clear   - calls os.system("clear")
-        getch   - get one char at a time
-        size    - return height, width of the terminal
+        clear     - clear screen, see `Screen`
+        getch     - get one key at a time
+        poll_keys - get all keys pressed so far without waiting
+        raw       - context manager that keeps the terminal in raw mode
+        size      - return height, width of the terminal
+
+        Input is read into a buffer as it's available and split into keys there, so that escape sequences and
+        UTF-8 characters are returned whole even when keys arrive faster than they're read.
+
+        With a `source` (by default `inputs.source`), keys are read from it and the terminal isn't touched;
+        keys are written to `recorder` (by default `inputs.recorder`) if there is one.
     """
-    def __init__(self):
-        self.fd = stdin.fileno()
-        self.new_term, self.old_term = tcgetattr(self.fd), tcgetattr(self.fd)
+    def __init__(self, source=None, recorder=None, fd=None):
+        self.source   = source or inputs.source
+        self.recorder = recorder or inputs.recorder
+        if not self.source:
+            self.init_term(stdin.fileno() if fd is None else fd)
+
+    def init_term(self, fd):
+        import selectors
+        self.fd       = fd
+        self.buffer   = bytearray()
+        self.keys     = deque()
+        self.in_raw   = False
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(fd, selectors.EVENT_READ)
+
+        self.new_term, self.old_term = tcgetattr(fd), tcgetattr(fd)
         self.new_term[3] = (self.new_term[3] & ~ICANON & ~ECHO)
+        self.new_term[6][VMIN], self.new_term[6][VTIME] = 1, 0
 
     def normal(self):
-        """Set 'normal' terminal settings."""
-        tcsetattr(self.fd, TCSAFLUSH, self.old_term)
+        """Set 'normal' terminal settings; keys typed ahead are kept rather than flushed."""
+        tcsetattr(self.fd, TCSADRAIN, self.old_term)
 
     def clear(self):
         """Clear screen."""
-        os.system("clear")
+        screen.clear()
 
     def cline(self):
         """Clear line."""
-        stdout.write('\r' + ' '*self.size()[1])
-        stdout.flush()
+        screen.cline()
 
     def curses(self):
-        """Set 'curses' terminal settings. (noecho, something else?)"""
-        tcsetattr(self.fd, TCSAFLUSH, self.new_term)
+        """Set 'curses' terminal settings: no echo and no line buffering."""
+        tcsetattr(self.fd, TCSADRAIN, self.new_term)
 
-    def getch(self, prompt=None):
-        """ Get one character at a time.
+    @contextmanager
+    def raw(self):
+        """ Keep the terminal in raw mode within the block, instead of switching modes around each key; does
+            nothing if it's already in raw mode or there is a `source`.
+        """
+        if self.source or self.in_raw:
+            yield self
+            return
+        self.curses()
+        self.in_raw = True
+        try:
+            yield self
+        finally:
+            self.in_raw = False
+            self.normal()
+
+    def getch(self, prompt=None, timeout=None):
+        """ Get one key at a time; with a `timeout` in seconds, return None if no key was pressed by then.
 
             NOTE: if the user suspends (^Z) running program, then brings it back to foreground,
             you have to instantiate Term class again.  Otherwise getch() won't work. Even after
             that, the user has to hit 'enter' once before he can enter commands.
         """
-        if prompt:
-            stdout.write(prompt)
-            stdout.flush()
-        self.curses()
-        c = os.read(self.fd, 3)
-        self.normal()
-        try:
-            return unicode(c)[2:-1]
-        except NameError:
-            return str(c)[2:-1]
+        if self.source:
+            c = self.source.read()
+        else:
+            if prompt:
+                stdout.write(prompt)
+                stdout.flush()
+            while not self.keys:
+                if not self.read_keys(timeout) and timeout is not None:
+                    return None
+            c = self.keys.popleft()
+        if self.recorder:
+            self.recorder.write(c)
+        return c
+
+    def poll_keys(self):
+        """ Return the list of keys pressed since the last call, without waiting; e.g. a game loop can handle
+            all of them once per frame. With a `source`, return its next key.
+        """
+        if self.source:
+            keys = [self.source.read()]
+        else:
+            self.read_keys(0)
+            keys = list(self.keys)
+            self.keys.clear()
+        if self.recorder:
+            for c in keys:
+                self.recorder.write(c)
+        return keys
+
+    def read_keys(self, timeout=None):
+        """ Wait up to `timeout` seconds (None: until there is input), read all available input and add complete
+            keys to `self.keys`; return True if anything was read.
+        """
+        with self.raw():
+            if not self.fill(timeout):
+                return False
+            while self.fill(0):
+                pass
+            self.split_keys()
+            while self.buffer and self.fill(esc_delay):
+                self.split_keys()
+            if self.buffer:
+                self.split_keys(final=True)     # a lone Esc, or bytes that won't be completed
+        return True
+
+    def fill(self, timeout):
+        """Read input into the buffer if there is some within `timeout`; return True if anything was read."""
+        if not self.selector.select(timeout):
+            return False
+        data = os.read(self.fd, 1024)
+        if not data:
+            raise EOFError
+        self.buffer.extend(data)
+        return True
+
+    def split_keys(self, final=False):
+        """Move complete keys from the buffer to `self.keys`; if `final`, incomplete ones are moved as well."""
+        buf = self.buffer
+        while buf:
+            n = key_length(buf)
+            if not n:
+                if not final:
+                    break
+                n = 1 if buf[0] == 0x1b else len(buf)
+            self.keys.append(key_name(buf[:n]))
+            del buf[:n]
 
     def size(self):
         """Return terminal size as tuple (height, width)."""
-        import struct, fcntl
-        h, w = struct.unpack("hhhh", fcntl.ioctl(0, TIOCGWINSZ, "\000"*8))[0:2]
-        if not h:
-            h, w = 24, 80
-        return h, w
+        return screen.size()
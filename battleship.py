@@ -3,13 +3,16 @@
 
 # Imports {{{
 import sys
+import random
 from random import choice as rndchoice
-from time import sleep
 from itertools import cycle
 
 from utils import AttrToggles, range1, nextval, first, nl
-from board import Board, BaseTile, Loc, Dir
+from utils import pause, headless, is_headless, headless_mode, GameOver
+from board import Board, BaseTile, TrackedTile, Loc, Dir
 from avkutil import Term
+from inputs import input_from, record_session
+from render import DiffRenderer
 
 size        = 5, 5
 num_ships   = 3
@@ -40,11 +43,12 @@ commands    = {
 # }}}
 
 
-class Tile(BaseTile, AttrToggles):
+class Tile(BaseTile, TrackedTile, AttrToggles):
     """Tile that may be a ship or blank space (water)."""
     ship              = is_hit = revealed = blank = False
     hidden            = True
     attribute_toggles = [("hidden", "revealed")]
+    tracked           = ("is_hit",)
 
     def __repr__(self):
         return blank if self.hidden else self.char
@@ -65,14 +69,15 @@ class Ship(Tile):
 
 class BattleshipBoard(Board):
     def __init__(self, *a, **kw):
+        kw.setdefault("index", ("blank", "ship", "is_hit"))
         super().__init__(*a, **kw)
         self.current = Loc(0,0)
 
     def random_blank(self):
-        return rndchoice(self.tiles("blank"))
+        return self.random_tile("blank")
 
     def random_unhit(self):
-        return rndchoice(self.tiles_not("is_hit"))
+        return self.random_tile("is_hit", False)
 
     def next_validloc(self, start, dir, n):
         loc = self.nextloc(start, dir, n)
@@ -91,11 +96,13 @@ class BattleshipBoard(Board):
 
 
 class Player(object):
-    def __init__(self, num):
-        """Create player's board and randomly place `num_ships` ships on it."""
+    def __init__(self, num, ai=None):
+        """Create player's board and randomly place `num_ships` ships on it; `ai` defaults to `ai_players`."""
         self.num   = num
-        self.ai    = bool(num in ai_players)
-        self.board = BattleshipBoard(size, Blank, num_grid=False, padding=padding, pause_time=0, screen_sep=0)
+        self.ai    = bool(num in ai_players if ai is None else ai)
+        origin     = 1 + (num-1) * (size[1]*(padding[1]+1) + 1)     # second board goes below the first & divider
+        self.board = BattleshipBoard(size, Blank, num_grid=False, padding=padding, pause_time=0, screen_sep=0,
+                                     renderer=DiffRenderer(origin))
         B          = self.board
 
         for ship in range1(num_ships):
@@ -115,18 +122,22 @@ class Battleship(object):
     winmsg = "Player %s wins!"
 
     def draw(self):
+        if is_headless():
+            return
         p1, p2 = players
-        print(nl*24)
+        if not p1.board.renderer:
+            print(nl*24)
         p1.board.draw()
         print(divider)
         p2.board.draw()
-        sleep(pause_time)
+        pause(pause_time)
 
     def check_end(self, player):
         if all(ship.is_hit for ship in player.board.tiles("ship")):
             self.draw()
-            print(self.winmsg % player.enemy.num)
-            sys.exit()
+            if not is_headless():
+                print(self.winmsg % player.enemy.num)
+            raise GameOver(player.enemy.num)
 
 
 class Commands:
@@ -184,7 +195,8 @@ class Commands:
 
 class BasicInterface:
     def __init__(self):
-        self.term = Term()
+        if not all(p.ai for p in players):
+            self.term = Term()
 
     def run(self):
         # board is only used to check if location is within range (using board.valid())
@@ -199,32 +211,72 @@ class BasicInterface:
 
     def blink_tile(self, tile):
         tile.hidden = not tile.hidden
-        sleep(blink_speed)
+        pause(blink_speed)
         bship.draw()
 
     def get_move(self, player):
         """Get user command and return the tile to attack."""
         commands.player = player
-        while True:
-            cmd = self.term.getch()
-            try:
-                val = commands[cmd]()
-                if val:
-                    return val
-            except KeyError:
-                print("unknown command:", cmd)
+        with self.term.raw():
+            while True:
+                cmd = self.term.getch()
+                try:
+                    val = commands[cmd]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("unknown command:", cmd)
 
     def ai_move(self, player):
         """Very primitive 'AI', always hits a random location."""
         return player.enemy.board.random_unhit()
 
 
+def setup(ai=None):
+    """Create players with their boards and the game in module globals; `ai` overrides `ai_players` for this game."""
+    global players, bship
+    ai      = ai_players if ai is None else ai
+    players = [Player(num, num in ai) for num in range1(2)]
+    bship   = Battleship()
+
+def play(seed=None):
+    """Play an AI vs AI game in headless mode; return the number of the winning player."""
+    random.seed(seed)
+    with headless_mode():
+        setup(ai=[1, 2])
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+
+def replay(source, seed=None, ai=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return the result as in
+        `play()`, or None if the recording ends before the game does.
+    """
+    global commands
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup(ai)
+        commands = Commands()
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
+
+
 if __name__ == "__main__":
+    if headless:
+        print(play())
+        sys.exit()
+
     commands = Commands()
-    players = [Player(p) for p in players]
-    bship   = Battleship()
+    record_session("battleship")
+    setup()
 
     try:
         BasicInterface().run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         sys.exit()
@@ -2,14 +2,18 @@
 # -*- encoding: utf-8 -*-
 
 import sys
+import random
+from copy import copy
 from random import choice as rndchoice
 from random import randrange
 from itertools import cycle
-from time import sleep
 
 from utils import Loop, TextInput, range1, first, nl
+from utils import pause, headless, is_headless, headless_mode, GameOver
 from board import Board, BaseTile, Loc, Dir
 from avkutil import Term
+from inputs import input_from, record_session
+from render import DiffRenderer
 
 size             = 6
 pause_time       = 0.2
@@ -48,6 +52,11 @@ class Tile(BaseTile):
         else:
             return str(self.num)
 
+    def clone(self):
+        new     = super(Tile, self).clone()
+        new.num = copy(self.num)
+        return new
+
     def increment(self, player, initial=True):
         """ Increment tile number; if number wraps, increment neighbour tiles.
 
@@ -76,7 +85,7 @@ class Tile(BaseTile):
         for _ in range(2):
             for tile in tiles:
                 tile.blank = not tile.blank
-            sleep(blink_speed)
+            pause(blink_speed)
             board.draw()
 
     def _increment(self, player):
@@ -150,7 +159,7 @@ class Commands:
         if board.valid_move(self.player, board[loc]):
             board.hl_visible = False
             return board[loc]
-        else:
+        elif not is_headless():
             print("Invalid move")
 
     def highlight(self, loc):
@@ -168,10 +177,12 @@ class Commands:
 
 class BlockyBlocks(object):
     winmsg  = "player %s wins!"
-    counter = Loop(range(check_moves))
 
-    def __init__(self):
-        self.term = Term()
+    def __init__(self, ai=None):
+        self.counter = Loop(range(check_moves))
+        self.ai      = ai_players if ai is None else ai
+        if not all(p in self.ai for p in players):
+            self.term = Term()
 
     def check_end(self, player):
         """Check if game is finished."""
@@ -179,40 +190,79 @@ class BlockyBlocks(object):
 
     def end(self, player):
         board.draw()
-        print(nl, self.winmsg % player)
-        sleep(2)
-        sys.exit()
+        if not is_headless(board.headless):
+            print(nl, self.winmsg % player)
+        pause(2)
+        raise GameOver(player)
 
     def run(self):
         for p in cycle(players.keys()):
             board.draw()
-            tile = board.ai_move(p) if p in ai_players else self.get_move(p)
+            tile = board.ai_move(p) if p in self.ai else self.get_move(p)
             tile.increment(p)
             if self.check_end(p):
                 self.end(p)
 
     def get_move(self, player):
         commands.player = player
-        while True:
-            cmd = self.term.getch()
-            try:
-                val = commands[cmd]()
-                if val:
-                    return val
-            except KeyError:
-                print("unknown command:", cmd)
+        with self.term.raw():
+            while True:
+                cmd = self.term.getch()
+                try:
+                    val = commands[cmd]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("unknown command:", cmd)
+
+
+def setup(ai=None):
+    """Create the board and the game in module globals; `ai` overrides `ai_players` for this game."""
+    global board, bblocks
+    board   = BlocksBoard(size, Tile, num_grid=False, padding=padding, pause_time=pause_time,
+                          renderer=DiffRenderer())
+    bblocks = BlockyBlocks(ai)
+
+def play(seed=None):
+    """Play an AI vs AI game in headless mode; return the winning player."""
+    random.seed(seed)
+    with headless_mode():
+        setup(ai=list(players))
+        try:
+            bblocks.run()
+        except GameOver as e:
+            return e.result
+
+def replay(source, seed=None, ai=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return the result as in
+        `play()`, or None if the recording ends before the game does.
+    """
+    global commands
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup(ai)
+        commands = Commands()
+        try:
+            bblocks.run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
 
 
 if __name__ == "__main__":
-    arg = sys.argv[1:]
-    if arg and arg[0] == '-r':
+    if '-r' in sys.argv[1:]:
         randomize_option = True
+    if headless:
+        print(play())
+        sys.exit()
 
     commands = Commands()
-    board   = BlocksBoard(size, Tile, num_grid=False, padding=padding, pause_time=pause_time)
-    bblocks = BlockyBlocks()
+    record_session("bblocks")
+    setup()
 
     try:
         bblocks.run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         sys.exit()
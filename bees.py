@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
 from __future__ import print_function, unicode_literals, division
+import random as rnd
 from random import random, choice, randint
-from time import sleep
+
+from utils import pause, headless, is_headless, headless_mode, Container
 
 init_bees   = 100
 init_wasps  = 5
@@ -65,13 +67,29 @@ def main():
         if random() >= 0.95:
             wasps.append(Wasp())
 
-        status = "[%3s]   %6s honey   %3s bees   %d wasps"
-        print(status % (turn, hive.honey, len(hive.bees), len(wasps)))
-        sleep(0.1)
-
+        if not is_headless():
+            status = "[%3s]   %6s honey   %3s bees   %d wasps"
+            print(status % (turn, hive.honey, len(hive.bees), len(wasps)))
+            pause(0.1)
 
-if __name__ == "__main__":
+def setup():
+    global hive, flowers, wasps
     hive    = Hive()
     flowers = [Flower() for _ in range(num_flowers)]
     wasps   = [Wasp() for _ in range(init_wasps)]
-    main()
+
+def play(seed=None):
+    """Run the simulation in headless mode; return final `honey`, number of `bees` and `wasps`."""
+    rnd.seed(seed)
+    with headless_mode():
+        setup()
+        main()
+    return Container(honey=hive.honey, bees=len(hive.bees), wasps=len(wasps))
+
+
+if __name__ == "__main__":
+    if headless:
+        print(play())
+    else:
+        setup()
+        main()
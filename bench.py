@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the board library; run `python bench.py [name ...]` to run some or all of them."""
+
+import os
+import sys
+import random
+import tempfile
+import tracemalloc
+from timeit import timeit, default_timer
+from itertools import groupby
+
+from utils import TextInput, flatten, nextgroup
+from board import Loc, Board, BaseTile, StackableBoard, LayeredBoard, ArrayBoard, Codec, geometry
+
+
+class LegacyLoc(object):
+    """Location class as it was before interning, kept here for comparison."""
+    def __init__(self, x, y):
+        self.loc = x, y
+        self.x, self.y = x, y
+
+    def __eq__(self, other):
+        return self.loc == getattr(other, "loc", None)
+
+    def __hash__(self):
+        return hash(self.loc)
+
+    def moved(self, x, y):
+        return LegacyLoc(self.x + x, self.y + y)
+
+
+class LegacyAttrToggles(object):
+    """`utils.AttrToggles` as it was before toggles were compiled into descriptors, kept here for comparison."""
+    attribute_toggles = []
+
+    def __setattr__(self, attr, val):
+        object.__setattr__(self, attr, val)
+        toggles = self.attribute_toggles
+
+        if attr in flatten(toggles):
+            for attrs in toggles:
+                if attr in attrs:
+                    attrs = set(attrs) - set([attr])
+                    for attr in attrs:
+                        object.__setattr__(self, attr, not val)
+
+
+class LegacyTrackedTile(object):
+    """`board.TrackedTile` as it was before tracked attributes were compiled into descriptors."""
+    tracked = ()
+    board   = None
+
+    def __setattr__(self, attr, val):
+        board = self.board
+        if board is None or attr not in self.tracked:
+            super(LegacyTrackedTile, self).__setattr__(attr, val)
+        else:
+            old = getattr(self, attr, None)
+            super(LegacyTrackedTile, self).__setattr__(attr, val)
+            board.tile_changed(self, attr, old)
+
+
+def peak_memory(fn):
+    """Peak memory in bytes allocated while running `fn`, which should keep its objects alive."""
+    tracemalloc.start()
+    keep = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del keep
+    return peak
+
+def report(name, value, unit):
+    print("%-40s %14s %s" % (name, "{:,.0f}".format(value), unit))
+
+
+def bench_loc(size=100, boards=20, number=20):
+    """ Memory of keeping `boards` boards' worth of locations (each their own, or shared through `Geometry`),
+        and throughput of creating, moving & hashing them.
+    """
+    rng = range(size)
+    geometry(size, size).locs
+
+    for cls in (LegacyLoc, Loc):
+        name = cls.__name__
+        mem  = peak_memory(lambda: [ [cls(x, y) for y in rng for x in rng] for _ in range(boards) ])
+        report("%s memory, %d boards %dx%d" % (name, boards, size, size), mem, "bytes")
+        if cls is Loc:
+            mem = peak_memory(lambda: [ list(geometry(size, size).locs) for _ in range(boards) ])
+            report("Geometry.locs memory, %d boards" % boards, mem, "bytes")
+
+        sec = timeit(lambda: set(cls(x, y) for y in rng for x in rng), number=number)
+        report("%s create+hash" % name, size*size*number/sec, "locs/sec")
+
+        start = geometry(size, size).loc(size//2, size//2) if cls is Loc else cls(size//2, size//2)
+        sec   = timeit(lambda: [start.moved(1, 0) == start.moved(0, 1) for _ in rng], number=number*size)
+        report("%s moved+eq" % name, size*size*number/sec, "ops/sec")
+
+        locs = [start.moved(x % 3 - 1, y % 3 - 1) for y in rng for x in rng]
+        sec  = timeit(lambda: set(locs), number=number)
+        report("%s hash (set of locs)" % name, size*size*number/sec, "locs/sec")
+
+    board = Board(size, '.')
+    board.init_board()
+    loc, right = board.geom.loc(0, size//2), board.dirlist[1]
+    sec = timeit(lambda: [board.nextloc(loc, right, n) for n in rng], number=number*size)
+    report("Board.nextloc (shared locs)", size*size*number/sec, "ops/sec")
+
+
+def versi_board(size=8):
+    """Set up a `versi` game with a fresh board, which is kept in versi module globals."""
+    import versi
+    versi.board   = versi.VersiBoard(size, versi.Blank, pause_time=0)
+    versi.players = [versi.Player(c) for c in versi.player_chars]
+    versi.player1, versi.player2 = versi.players
+    versi.Versi()
+    return versi
+
+
+def bench_journal(size=8, number=2000):
+    """Make/unmake throughput: play a Versi move and roll it back with the board journal."""
+    versi = versi_board(size)
+    board = versi.board
+    board.start_journal()
+    moves = [(player, loc) for player in versi.players for loc in board.get_valid_moves(player)]
+
+    def make_unmake():
+        for player, loc in moves:
+            cp = board.checkpoint()
+            player.make_move(loc)
+            board.rollback(cp)
+
+    sec = timeit(make_unmake, number=number)
+    report("make+unmake %dx%d" % (size, size), len(moves)*number/sec, "moves/sec")
+
+
+def legacy_valid_moves(board, player):
+    """Versi move generation as it was before bitboards, with rays of tiles, kept here for comparison."""
+    def captured(start):
+        if not board[start].blank:
+            return []
+        out = []
+        for dir in board.dirlist2:
+            groups         = groupby(board.ray(start, dir))
+            group1, group2 = nextgroup(groups), nextgroup(groups)
+            if group1 and group2 and (group1.key == player.enemy() and group2.key == player):
+                out.extend(group1.group)
+        return out
+    return [loc for loc in board.locations() if captured(loc)]
+
+def bench_versi_moves(size=12, positions=20, number=5):
+    """Versi legal move generation on midgame positions: rays of tiles vs. bitboards."""
+    versi = versi_board(size)
+    board = versi.board
+    random.seed(1)
+    player, snapshots = versi.player1, []
+    while len(snapshots) < positions:
+        moves = board.get_valid_moves(player)
+        if not moves:
+            break
+        player.make_move(random.choice(moves))
+        player = player.enemy()
+        snapshots.append(board.clone())
+
+    for name, gen in (("rays", legacy_valid_moves), ("bitboards", lambda B, p: B.get_valid_moves(p))):
+        sec = timeit(lambda: [gen(B, p) for B in snapshots for p in versi.players], number=number)
+        report("%s %dx%d" % (name, size, size), len(snapshots)*2*number/sec, "move lists/sec")
+
+    geom = board.bits.geom
+    own, opp = board.bits.sides(versi.player1.char)
+    sec = timeit(lambda: geom.moves(own, opp), number=number*1000)
+    report("bitboard legal mask %dx%d" % (size, size), number*1000/sec, "masks/sec")
+
+
+def bench_versi_game(size=12, games=10):
+    """Versi per-turn overhead: score of a player (full board sum vs. counter), and whole greedy AI games."""
+    import versi
+    versi_board(size)
+    board, player = versi.board, versi.player1
+    sec = timeit(lambda: sum(tile == player for tile in board), number=1000)
+    report("board sum score %dx%d" % (size, size), sec*1e6/1000, "us")
+    sec = timeit(player.score, number=100000)
+    report("counter score", sec*1e9/100000, "ns")
+
+    old, versi.size = versi.size, size
+    sec = timeit(lambda: [versi.play(seed) for seed in range(games)], number=1)
+    versi.size = old
+    report("greedy AI games %dx%d" % (size, size), games/sec, "games/sec")
+
+
+def bench_search(size=8, depth=6, budget=1.0):
+    """Versi alpha-beta search from the starting position: to a fixed depth, and as deep as it gets in `budget`."""
+    from versi_ai import Search
+    versi    = versi_board(size)
+    own, opp = versi.board.bits.sides(versi.player1.char)
+
+    search = Search(size, size)
+    search.search(own, opp, budget=1000, max_depth=depth)
+    report("depth %d search %dx%d" % (depth, size, size), search.info.nodes, "nodes")
+    report("depth %d search speed" % depth, search.info.nps, "nodes/sec")
+
+    search = Search(size, size)
+    search.search(own, opp, budget=budget)
+    report("depth reached in %gs" % budget, search.info.depth, "plies")
+
+
+def bench_tournament(games=16, size=8):
+    """Versi self-play tournament of greedy AI games: in one worker process vs. one per CPU."""
+    from versi_tournament import tournament
+    for workers in (1, os.cpu_count()):
+        result = tournament("greedy", "greedy", games, workers, size)
+        report("tournament %dx%d, %d workers" % (size, size, workers), result.games_sec, "games/sec")
+
+
+def random_position(size, empties, rnd):
+    """Versi (own, opp) bitboards of the side to move after random moves, with `empties` empty squares left."""
+    from versi_engine import popcount
+    while True:
+        versi    = versi_board(size)
+        bits     = versi.board.bits
+        geom     = bits.geom
+        own, opp = bits.sides(versi.player1.char)
+        while own | opp != geom.full:
+            if popcount(geom.full & ~(own | opp)) == empties:
+                return own, opp
+            moves = geom.locs_of(geom.moves(own, opp))
+            if moves:
+                own, opp = geom.play(geom.bit(rnd.choice(moves)), own, opp)
+            elif not geom.moves(opp, own):
+                break
+            own, opp = opp, own
+
+def bench_endgame(size=12, empties=(8, 10, 12), number=3, plies=4, depth=3):
+    """Versi exact endgame solver at a few numbers of empty squares; opening book build and lookup."""
+    from versi_ai import Search
+    import versi_book
+    rnd = random.Random(1)
+    for empty in empties:
+        sec = nodes = 0
+        for _ in range(number):
+            own, opp = random_position(size, empty, rnd)
+            search   = Search(size, size, endgame=empty)
+            sec     += timeit(lambda: search.search(own, opp), number=1)
+            nodes   += search.info.nodes
+        report("solve %d empties %dx%d" % (empty, size, size), sec*1000/number, "ms")
+        report("solve %d empties nodes" % empty, nodes//number, "nodes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "versi.book")
+        sec  = timeit(lambda: versi_book.build(path, size, size, plies, depth), number=1)
+        with versi_book.Book(path) as book:
+            positions = versi_book.opening_positions(size, size, plies)
+            report("book of %d plies at depth %d" % (plies, depth), len(positions), "positions")
+            report("book build", sec*1000, "ms")
+            sec = timeit(lambda: [book.lookup(*pos) for pos in positions], number=1)
+            report("book lookup", sec*1e6/len(positions), "us")
+
+
+class Terrain(BaseTile) : pass
+class Item(BaseTile)    : pass
+class Unit(BaseTile)    : pass
+
+
+def bench_layers(size=60, units=400, number=20):
+    """Units moving around on terrain with items: stackable vs. layered board."""
+    layers = (("terrain", Terrain), ("item", Item), ("unit", Unit))
+    for cls, kw in ((StackableBoard, {}), (LayeredBoard, dict(layers=layers))):
+        board = cls(size, Terrain, pause_time=0, **kw)
+        locs  = list(board.geom.locs)
+        for loc in locs[::3]:
+            board[loc] = Item(loc)
+        for loc in locs[1::size*size//units][:units]:
+            board[loc] = Unit(loc)
+        mobile = [board.get_instance(Unit, loc) for loc in locs if board.get_instance(Unit, loc)]
+        name   = cls.__name__
+
+        def step():
+            for unit in mobile:
+                loc = board.nextloc(unit.loc, board.dirlist[0], wrap=True)
+                if not board.get_instance(Unit, loc):
+                    board.move(unit, loc)
+
+        sec = timeit(step, number=number)
+        report("%s move+get_instance" % name, len(mobile)*number/sec, "moves/sec")
+
+        if cls is LayeredBoard:
+            sec = timeit(lambda: board.locations_of(Unit), number=number)
+        else:
+            sec = timeit(lambda: [l for l in locs if board.get_instance(Unit, l)], number=number)
+        report("%s all cells with units" % name, number/sec, "lookups/sec")
+
+
+class Wall(Terrain): pass
+
+def open_tile(tile):
+    return not isinstance(tile, Wall)
+
+def bench_paths(size=200, walls=0.2, updates=2000, number=5):
+    """Distance field to a corner: full calculation, incremental repair after single-cell changes, and A*."""
+    random.seed(1)
+    board = Board(size, Terrain, pause_time=0)
+    locs  = board.geom.locs
+    for loc in random.sample(locs, int(len(locs)*walls)):
+        board[loc] = Wall(loc)
+    goal  = Loc(0, 0)
+    board[goal] = Terrain(goal)
+    field = board.distance_field([goal], open_tile)
+
+    sec = timeit(field.calculate, number=number)
+    report("full field %dx%d" % (size, size), sec/number*1000, "ms")
+
+    cells = [random.choice(locs[1:]) for _ in range(updates)]
+    def update():
+        for n, loc in enumerate(cells):
+            board[loc] = (Wall if n % 2 else Terrain)(loc)
+    sec = timeit(update, number=1)
+    report("incremental update", updates/sec, "updates/sec")
+
+    far = max((l for l in locs if field[l] is not None), key=lambda l: field[l])
+    sec = timeit(lambda: board.find_path(far, goal, open_tile), number=number)
+    report("A* path, length %d" % field[far], sec/number*1000, "ms")
+
+
+def bench_load(size=200, number=5):
+    """Filling a board from a string: cell by cell vs. bulk `load()`, and `dump()`."""
+    random.seed(1)
+    codec = Codec({'.': Terrain, '#': Wall})
+    data  = ''.join(random.choice(".#") for _ in range(size*size))
+
+    for cls in (Board, ArrayBoard):
+        def by_cell():
+            board = cls(size, Terrain, pause_time=0)
+            for loc, c in zip(board.geom.locs, data):
+                board[loc] = codec.make(c, loc)
+
+        board = cls(size, Terrain, pause_time=0)
+        name  = cls.__name__
+        report("%s cell by cell %dx%d" % (name, size, size), timeit(by_cell, number=number)/number*1000, "ms")
+        report("%s load" % name, timeit(lambda: board.load(data, codec), number=number)/number*1000, "ms")
+        report("%s dump" % name, timeit(lambda: board.dump(codec), number=number)/number*1000, "ms")
+
+
+def bench_records(games=100000, moves=60):
+    """Write an archive of `games` random Versi-like records, then scan it and decode all moves."""
+    from records import Record, Archive, ArchiveWriter
+    random.seed(1)
+    path = os.path.join(tempfile.mkdtemp(), "bench.sgr")
+    recs = [Record("versi", 8, 8, random.sample(range(64), moves), random.randrange(3), n) for n in range(1000)]
+
+    def write():
+        with ArchiveWriter(path) as out:
+            for n in range(games):
+                out.write(recs[n % len(recs)])
+
+    def scan():
+        with Archive(path) as archive:
+            return sum(r.result for r in archive)
+
+    def decode():
+        with Archive(path) as archive:
+            return sum(sum(r.iter_moves()) for r in archive)
+
+    report("write %d records" % games, games/timeit(write, number=1), "records/sec")
+    report("archive size", os.path.getsize(path)/games, "bytes/record")
+    report("scan headers", games/timeit(scan, number=1), "records/sec")
+    report("decode moves", games*moves/timeit(decode, number=1), "moves/sec")
+    os.remove(path)
+
+
+def bench_toggles(size=20, number=100000):
+    """ Cost per assignment on a tile of a live `mines_lib.MinesBoard` (with its attribute index): of the toggled
+        and tracked `hidden`, the tracked `marked` and the unrelated `number`; legacy vs. compiled tiles.
+    """
+    import mines_lib
+
+    class LegacyTile(BaseTile, LegacyTrackedTile, LegacyAttrToggles):
+        revealed = mine = marked = False
+        hidden   = True
+        number   = None
+        tracked  = mines_lib.Tile.tracked
+        attribute_toggles = mines_lib.Tile.attribute_toggles
+
+    class LegacyMine(LegacyTile):
+        pass
+
+    for name, tile_cls, mine_cls in (("legacy", LegacyTile, LegacyMine), ("mines_lib", mines_lib.Tile, mines_lib.Mine)):
+        board  = mines_lib.MinesBoard(size, mines_lib.Tile, num_mines=size, pause_time=0)
+        layout = board.dump(mines_lib.codec)
+        board.load(layout, Codec({'.': tile_cls, '*': mine_cls}))
+        for tile in board:
+            tile.board = board      # boards only link `TrackedTile`s themselves
+        tile   = board[Loc(size//2, size//2)]
+
+        sec = timeit("tile.hidden = not tile.hidden", globals=locals(), number=number)
+        report("%s Tile.hidden (toggled, tracked)" % name, sec/number*1e9, "ns/assignment")
+        sec = timeit("tile.marked = not tile.marked", globals=locals(), number=number)
+        report("%s Tile.marked (tracked)" % name, sec/number*1e9, "ns/assignment")
+        sec = timeit("tile.number = 3", globals=locals(), number=number)
+        report("%s Tile.number (other)" % name, sec/number*1e9, "ns/assignment")
+        sec = timeit("tile.hidden", globals=locals(), number=number)
+        report("%s Tile.hidden read" % name, sec/number*1e9, "ns/read")
+
+
+def bench_textinput(number=2000):
+    """Parse a full robots program (15 commands) with the robots input format."""
+    cmdpat  = "%d? (m|t|T|f|w|r)"
+    pattern = cmdpat + (" %s?" % cmdpat) * 14
+    inp     = TextInput(pattern, singlechar_cmds=True)
+    line    = "3m2t4w5r6f" * 3
+
+    sec = timeit(lambda: inp.parse(line), number=number)
+    report("robots program", number/sec, "lines/sec")
+
+
+def bench_replay(keys=20000, number=5):
+    """Replay throughput: a bblocks session against the AI from an in-memory key source."""
+    import bblocks
+    from inputs import KeySource
+    rng   = random.Random(1)
+    moves = [rng.choice("wasd ") for _ in range(keys)]
+    read  = []
+
+    def run():
+        source = KeySource(moves)
+        bblocks.replay(source, seed=1)
+        read.append(keys - sum(1 for _ in source))
+
+    sec = timeit(run, number=number)
+    report("bblocks replay", sum(read)/sec, "keys/sec")
+
+
+def bench_keys(keys=20000):
+    """A burst of typed keys (letters, arrows, UTF-8) read from a pseudo-terminal: legacy getch vs. buffered Term."""
+    import pty, threading
+    from avkutil import Term
+    typed    = [("a", b"a"), (r"\x1b[D", b"\x1b[D"), (u"\u0436", u"\u0436".encode("utf-8"))] * (keys // 3)
+    expected = [k for k, _ in typed]
+    data     = b''.join(seq for _, seq in typed)
+
+    def legacy(term):
+        out, left = [], len(data)
+        while left:
+            term.curses()
+            c = os.read(term.fd, 3)
+            term.normal()
+            left -= len(c)
+            out.append(str(c)[2:-1])
+        return out
+
+    def buffered(term):
+        out = []
+        with term.raw():
+            while len(out) < len(expected):
+                out.append(term.getch())
+        return out
+
+    for name, read in (("legacy getch", legacy), ("buffered getch", buffered)):
+        master, slave = pty.openpty()
+        term   = Term(fd=slave)
+        writer = threading.Thread(target=os.write, args=(master, data))
+        writer.start()
+        start  = default_timer()
+        out    = read(term)
+        sec    = default_timer() - start
+        writer.join()
+        os.close(master)
+        os.close(slave)
+        wrong  = sum(a != b for a, b in zip(out, expected)) + abs(len(out) - len(expected))
+        report(name, len(out)/sec, "keys/sec")
+        report(name + " garbled keys", wrong, "keys")
+
+
+def bench_screen(number=200):
+    """Per-frame terminal overhead: `clear` process vs. in-process escape sequences, ioctl vs. cached size."""
+    import fcntl, struct, termios
+    from avkutil import Screen
+    devnull = open(os.devnull, 'w')
+    screen  = Screen(devnull)
+    screen.isatty = lambda: True
+
+    def ioctl_size():
+        return struct.unpack("hhhh", fcntl.ioctl(devnull.fileno(), termios.TIOCGWINSZ, b"\000"*8))[0:2]
+
+    report("os.system('clear')", timeit(lambda: os.system("clear >/dev/null 2>&1"), number=number)/number*1e6, "us")
+    report("Screen.clear()", timeit(screen.clear, number=number*100)/number/100*1e6, "us")
+    try:
+        report("ioctl size", timeit(ioctl_size, number=number*100)/number/100*1e9, "ns")
+    except OSError:
+        pass        # not a terminal
+    report("Screen.size() (cached)", timeit(screen.size, number=number*100)/number/100*1e9, "ns")
+    devnull.close()
+
+
+benchmarks = dict(loc=bench_loc, journal=bench_journal, layers=bench_layers, paths=bench_paths, load=bench_load,
+                  records=bench_records, toggles=bench_toggles,
+                  textinput=bench_textinput, replay=bench_replay, keys=bench_keys,
+                  screen=bench_screen, versi_moves=bench_versi_moves,
+                  search=bench_search, versi_game=bench_versi_game,
+                  tournament=bench_tournament, endgame=bench_endgame)
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or sorted(benchmarks):
+        print("== %s" % name)
+        benchmarks[name]()
@@ -1,8 +1,22 @@
 from __future__ import print_function, unicode_literals, division
 import math
+import hashlib
+from array import array
+from copy import copy
 from time import sleep
+from heapq import heappush, heappop, heapify
+from collections import deque
+from itertools import chain
 
-from utils import ujoin, range1, enumerate1, first, nl, space
+from random import choice as rndchoice
+from random import randrange
+
+from utils import ujoin, range1, enumerate1, first, nl, space, IndexedSet, Toggle, class_attr, is_headless
+from avkutil import screen
+
+SET, PUSH, POP, INSERT, REMOVE, ATTR = range(6)     # journal entry types, see `BaseBoard.start_journal()`
+INF = float("inf")
+random_tries = 32       # random cells tried by `ChunkedBoard.random_location()` before going over matching ones
 
 
 class BaseTile(object):
@@ -13,14 +27,101 @@ class BaseTile(object):
         self.loc = loc
         setattr(self, self.__class__.__name__.lower(), True)
 
+    def clone(self):
+        """ Copy of the tile for a clone of the board it's on, see `BaseBoard.clone()`; tiles with mutable
+            members (lists, `Loop`s etc) need to override it to copy them, so that the boards stay independent.
+        """
+        return copy(self)
+
+
+class TrackedTile(object):
+    """ Tile mixin that reports changes of its `tracked` attributes to the board it's placed on; the
+        `board` attribute is set by boards that have watchers or a journal (see `BaseBoard.watch()`).
+
+        Tracked attributes are compiled into `Tracked` descriptors when a subclass is created (`utils.Toggle`
+        descriptors of `AttrToggles` become `TrackedToggle`s, so list `TrackedTile` before `AttrToggles` in the
+        bases), and class defaults of tracked attributes are copied into each new instance, so that reading
+        them and assigning to other attributes costs nothing extra. A tracked attribute without a class
+        default starts as None.
+    """
+    tracked           = ()
+    board             = None
+    _tracked_defaults = {}
+
+    def __new__(cls, *args, **kwargs):
+        tile = super(TrackedTile, cls).__new__(cls)
+        tile.__dict__.update(cls._tracked_defaults)
+        return tile
+
+    def __init_subclass__(cls, **kwargs):
+        super(TrackedTile, cls).__init_subclass__(**kwargs)
+        defaults = dict(cls._tracked_defaults)
+
+        for attr in cls.tracked:
+            value = class_attr(cls, attr, None)
+            if isinstance(value, Toggle):
+                if not isinstance(value, TrackedToggle):
+                    setattr(cls, attr, TrackedToggle(attr, value.others))
+            elif not isinstance(value, Tracked):
+                defaults[attr] = value
+                setattr(cls, attr, Tracked(attr))
+        cls._tracked_defaults = defaults
+
+
+class Tracked(object):
+    """ Data descriptor for a `tracked` attribute of a `TrackedTile`: changes are reported to the tile's board,
+        if it has one. It has no `__get__`, so reads find the value in the instance dict.
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __set__(self, tile, val):
+        d, name = tile.__dict__, self.name
+        old     = d.get(name)
+        d[name] = val
+        board   = d.get("board")
+        if board is not None:
+            board.tile_changed(tile, name, old)
+
+
+class TrackedToggle(Toggle):
+    """`utils.Toggle` for a tracked attribute: sets the other attributes of its pair and reports the change as `Tracked` does."""
+    __slots__ = ()
+
+    def __set__(self, tile, val):
+        d, name = tile.__dict__, self.name
+        old     = d.get(name)
+        d[name] = val
+        for attr in self.others:
+            d[attr] = not val
+        board = d.get("board")
+        if board is not None:
+            board.tile_changed(tile, name, old)
+
 
 class Loc(object):
     """ Location on game board; note that we should not modify the location in place to avoid many
-        hard to track errors; `moved()` creates and returns a new instance.
+        hard to track errors; `moved()` returns another instance.
+
+        Locations are small slotted objects with a precomputed hash; the locations of all cells are kept
+        once per board size in its `Geometry` (`geom.locs`, `geom.loc()`), so that boards of the same size
+        share them. Shared locations have their `geom` and flat `index` in it set; `moved()`,
+        `BaseBoard.nextloc()` and neighbour lookups return shared locations for cells on the board.
     """
-    def __init__(self, x, y):
-        self.loc = x, y
-        self.x, self.y = x, y
+    __slots__ = ("x", "y", "loc", "geom", "index", "_hash")
+
+    def __init__(self, x, y, geom=None):
+        self.x     = x
+        self.y     = y
+        self.loc   = x, y
+        self.geom  = geom
+        self.index = y*geom.width + x if geom else None
+        self._hash = hash(self.loc)
+
+    def __reduce__(self):
+        return self.__class__, self.loc
 
     def __repr__(self):
         return str(self.loc)
@@ -29,31 +130,447 @@ class Loc(object):
         return iter(self.loc)
 
     def __eq__(self, other):
-        return self.loc == getattr(other, "loc", None)
+        return self is other or self.loc == getattr(other, "loc", None)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return hash(self.loc)
+        return self._hash
 
     def moved(self, x, y):
-        """ Return a new Loc moved according to delta modifiers `x` and `y`,
-            e.g. 1,0 to move right.
+        """ Return a Loc moved according to delta modifiers `x` and `y`, e.g. 1,0 to move right; the
+            shared location if this one is shared and the new one is on the same board.
         """
-        return Loc(self.x + x, self.y + y)
+        x, y, geom = self.x + x, self.y + y, self.geom
+        if geom and 0 <= x < geom.width and 0 <= y < geom.height:
+            return geom._locs[y*geom.width + x]
+        return Loc(x, y)
 
 Dir = Loc   # Directions (e.g. 0,1=right) work the same way but should have a different name for clarity
 
+dirs8 = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))  # going from up clockwise
+dirs4 = dirs8[::2]                                                                # 'cross' directions, no diagonals
+
+
+class Geometry(object):
+    """ Tables that only depend on board size, shared by all boards of the same width and height;
+        use `geometry()` to get the shared instance. Tables are built on first use.
+
+        locs         - all locations in row order, i.e. `locs[y*width + x]`; `loc(x, y)` looks one up, and
+                       `index(loc)` returns the flat index of a location.
+        neighbours() - adjacency tables, see below.
+        ray()        - rays of locations from a cell to the edge of board, built per cell and direction.
+    """
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self._locs       = None
+        self._neighbours = {}
+        self._rays       = {}
+
+    @property
+    def locs(self):
+        if self._locs is None:
+            xrng, yrng = range(self.width), range(self.height)
+            self._locs = tuple(Loc(x, y, self) for y in yrng for x in xrng)
+        return self._locs
+
+    def loc(self, x, y):
+        """Shared location of the cell at `x`, `y`, which should be on the board."""
+        return self.locs[y*self.width + x]
+
+    def neighbours(self, dirs=dirs8, wrap=False):
+        """ Table of neighbour locations in `dirs` directions, indexed by flat index of the cell; if
+            `wrap` is set, the board wraps around at the edges (torus), as in `BaseBoard.nextloc()`.
+        """
+        key   = dirs, wrap
+        table = self._neighbours.get(key)
+
+        if table is None:
+            w, h  = self.width, self.height
+            locs  = self.locs
+            table = self._neighbours[key] = tuple(cell_neighbours(loc, dirs, w, h, wrap, locs) for loc in locs)
+        return table
+
+    def neighbour_indexes(self, dirs=dirs8, wrap=False):
+        """Same table as `neighbours()`, with flat indexes instead of locations."""
+        key   = dirs, wrap, int
+        table = self._neighbours.get(key)
+
+        if table is None:
+            table = tuple( tuple(l.index for l in nb) for nb in self.neighbours(dirs, wrap) )
+            self._neighbours[key] = table
+        return table
+
+    def ray(self, loc, d):
+        """Tuple of locations from `loc` to the edge of board in `dirs8[d]` direction, excluding `loc`."""
+        key = self.index(loc), d
+        ray = self._rays.get(key)
+
+        if ray is None:
+            w, h, locs = self.width, self.height, self.locs
+            dx, dy     = dirs8[d]
+            x, y, ray  = loc.x + dx, loc.y + dy, []
+            while 0 <= x < w and 0 <= y < h:
+                ray.append(locs[y*w + x])
+                x, y = x + dx, y + dy
+            ray = self._rays[key] = tuple(ray)
+        return ray
+
+    def index(self, loc):
+        """Flat index of `loc` in `locs`; stored in shared locations, calculated for others."""
+        return loc.index if loc.geom is self else loc.y*self.width + loc.x
+
+def cell_neighbours(loc, dirs, width, height, wrap=False, locs=None):
+    """ Tuple of neighbour locations of `loc` in `dirs` directions on a `width` x `height` board; taken
+        from `locs` (all locations in row order, see `Geometry.locs`) if given.
+    """
+    coords = [(loc.x + dx, loc.y + dy) for dx, dy in dirs]
+    if wrap:
+        coords = [(x % width, y % height) for x, y in coords]
+    coords = [(x, y) for x, y in coords if 0 <= x < width and 0 <= y < height]
+    nb     = [locs[y*width + x] for x, y in coords] if locs else [Loc(x, y) for x, y in coords]
+    return tuple(l for n, l in enumerate(nb) if l != loc and l not in nb[:n])
+
+_geometries = {}
+
+def geometry(width, height):
+    """Return the `Geometry` shared by all boards of `width` x `height` size."""
+    key = width, height
+    if key not in _geometries:
+        _geometries[key] = Geometry(width, height)
+    return _geometries[key]
+
+
+class AttrIndex(object):
+    """ Board watcher that keeps live sets of locations where each of `attrs` tile attributes is true
+        and where it's false, for O(1) counts and random choice; see `BaseBoard.watch()` for the
+        watcher interface.
+    """
+    def __init__(self, attrs):
+        self.attrs = tuple(attrs)
+        self.sets  = None
+
+    def reset(self, board):
+        self.sets = dict( ((attr, val), IndexedSet()) for attr in self.attrs for val in (True, False) )
+        for loc in board.geom.locs:
+            self.update(loc, board[loc])
+
+    def update(self, loc, tile):
+        sets = self.sets
+        for attr in self.attrs:
+            val = bool(getattr(tile, attr, False))
+            if loc not in sets[attr, val].pos:
+                sets[attr, val].add(loc)
+                sets[attr, not val].discard(loc)
+
+    def cell_changed(self, board, loc, old, new):
+        if self.sets is not None:
+            self.update(loc, new)
+
+    def tile_changed(self, board, loc, tile, attr, old):
+        if self.sets is not None:
+            self.update(loc, tile)
+
+    def locations(self, attr, value=True):
+        """Live `IndexedSet` of locations where `attr` of the tile is `value`."""
+        return self.sets[attr, bool(value)]
+
+    def clone(self, board):
+        new = AttrIndex(self.attrs)
+        if self.sets is not None:
+            new.sets = dict( (key, locs.copy()) for key, locs in self.sets.items() )
+        return new
+
+
+def tile_kind(tile):
+    """Kind of `tile` for position hashing: strings stand for themselves, tiles are keyed by class name and repr."""
+    try              : is_str = isinstance(tile, basestring)
+    except NameError : is_str = isinstance(tile, str)
+    return tile if is_str else "%s:%r" % (tile.__class__.__name__, tile)
+
+_zobrist_keys = {}
+
+def zobrist_key(loc, kind):
+    """ Random 64-bit key for `kind` of tile at `loc`; keys are derived from a hash digest rather than
+        a random generator so that they're the same across processes and runs.
+    """
+    key = _zobrist_keys.get((loc, kind))
+    if key is None:
+        digest = hashlib.blake2b(("%d,%d:%s" % (loc.x, loc.y, kind)).encode("utf-8"), digest_size=8).digest()
+        key    = _zobrist_keys[loc, kind] = int.from_bytes(digest, "little")
+    return key
+
+
+class ZobristHash(object):
+    """ Board watcher that keeps a 64-bit Zobrist hash of the position, updated incrementally as tiles
+        are replaced or their tracked attributes change; `kind(tile)` function determines which tiles
+        are considered the same. On stackable boards, only the top tiles are hashed.
+    """
+    def __init__(self, kind=tile_kind):
+        self.kind  = kind
+        self.kinds = None   # kind of tile at each flat index
+        self.value = 0
+
+    def reset(self, board):
+        self.kinds = [self.kind(board[loc]) for loc in board.geom.locs]
+        self.value = 0
+        for loc, kind in zip(board.geom.locs, self.kinds):
+            self.value ^= zobrist_key(loc, kind)
+
+    def update(self, board, loc, tile):
+        if self.kinds is None:
+            return
+        i, kind = loc.y*board.width + loc.x, self.kind(tile)
+        old     = self.kinds[i]
+        if kind != old:
+            self.value   ^= zobrist_key(loc, old) ^ zobrist_key(loc, kind)
+            self.kinds[i] = kind
+
+    def cell_changed(self, board, loc, old, new):
+        self.update(board, loc, new)
+
+    def tile_changed(self, board, loc, tile, attr, old):
+        self.update(board, loc, tile)
+
+    def clone(self, board):
+        new       = ZobristHash(self.kind)
+        new.value = self.value
+        if self.kinds is not None:
+            new.kinds = list(self.kinds)
+        return new
+
+
+class DistanceField(object):
+    """ Board watcher that keeps the distance from every cell to the nearest target, moving in `dirs` directions
+        through tiles that are `passable` (all tiles if None); see `BaseBoard.distance_field()`.
+
+        `targets` is either a sequence of locations or the name of a tile attribute that marks target tiles;
+        targets can always be entered. Entering a tile costs `cost(tile)`, which should be at least 1, or 1 if
+        `cost` is None. Distances are calculated with BFS (uniform cost) or Dijkstra, and repaired incrementally
+        when a cell changes: only cells whose shortest path went through the changed cell are recalculated.
+    """
+    def __init__(self, targets, passable=None, dirs=dirs4, cost=None):
+        try              : self.attr = targets if isinstance(targets, basestring) else None
+        except NameError : self.attr = targets if isinstance(targets, str) else None
+
+        self.targets  = None if self.attr else frozenset(targets)
+        self.passable = passable
+        self.dirs     = dirs
+        self.cost     = cost
+        self.key      = self.attr or self.targets, passable, dirs, cost
+        self.dist     = None
+
+    def __getitem__(self, loc):
+        """Distance from `loc` to the nearest target, or None if no target can be reached."""
+        d = self.dist[loc.y*self.width + loc.x]
+        return None if d == INF else d
+
+    def state(self, loc, tile):
+        """Return cost of entering the cell (None if it can't be entered) and whether it's a target."""
+        target = bool(getattr(tile, self.attr, False)) if self.attr else loc in self.targets
+        if target or self.passable is None or self.passable(tile):
+            return (self.cost(tile) if self.cost else 1), target
+        return None, target
+
+    def reset(self, board):
+        self.width = board.width
+        self.locs  = board.geom.locs
+        self.nbs   = board.geom.neighbour_indexes(self.dirs)
+        states     = [self.state(loc, board[loc]) for loc in self.locs]
+        self.costs = [c for c, t in states]
+        self.is_target = [t for c, t in states]
+        self.calculate()
+
+    def calculate(self):
+        """Calculate the whole field from scratch."""
+        costs, nbs = self.costs, self.nbs
+        dist       = self.dist = [INF] * len(costs)
+        seeds      = [i for i, t in enumerate(self.is_target) if t]
+        for i in seeds:
+            dist[i] = 0
+
+        if self.cost:
+            self.relax([(0, i) for i in seeds])
+            return
+
+        queue = deque(seeds)
+        while queue:
+            v = queue.popleft()
+            d = dist[v] + 1
+            for w in nbs[v]:
+                if dist[w] == INF and costs[w] is not None:
+                    dist[w] = d
+                    queue.append(w)
+
+    def relax(self, heap):
+        """Dijkstra: propagate improved distances of (distance, index) items in `heap`."""
+        dist, costs, nbs = self.dist, self.costs, self.nbs
+        heapify(heap)
+        while heap:
+            d, v = heappop(heap)
+            if d > dist[v]:
+                continue
+            d += costs[v]
+            for w in nbs[v]:
+                if d < dist[w] and costs[w] is not None:
+                    dist[w] = d
+                    heappush(heap, (d, w))
+
+    def update(self, loc, tile):
+        i                = loc.y*self.width + loc.x
+        cost, target     = self.state(loc, tile)
+        old, was_target  = self.costs[i], self.is_target[i]
+        if cost == old and target == was_target:
+            return
+
+        dist, costs, nbs = self.dist, self.costs, self.nbs
+        costs[i], self.is_target[i] = cost, target
+        affected = ()
+        if (was_target and not target) or (old is not None and (cost is None or cost > old)):
+            affected = self.invalidate(i, old)
+
+        # recalculate invalidated cells, the changed cell and its neighbours from their neighbours
+        heap = []
+        for v in chain(affected, (i,), nbs[i]):
+            if costs[v] is None:
+                continue
+            best = 0 if self.is_target[v] else min([dist[w] + costs[w] for w in nbs[v] if dist[w] < INF] or [INF])
+            if best < dist[v]:
+                dist[v] = best
+                heap.append((best, v))
+        self.relax(heap)
+
+    def invalidate(self, i, old_cost):
+        """ Cell `i` got more expensive to enter (was `old_cost`), or stopped being a target; set distances of cells
+            that have no other shortest path to infinity and return them.
+        """
+        dist, costs, nbs, is_target = self.dist, self.costs, self.nbs, self.is_target
+        if dist[i] == INF:
+            return ()
+
+        d        = dist[i] + old_cost
+        heap     = [(dist[i], i)] + [(d, v) for v in nbs[i] if dist[v] == d]
+        affected = set()
+        heapify(heap)
+
+        # in order of distance, so that a cell's possible supports are decided before the cell itself
+        while heap:
+            dv, v = heappop(heap)
+            if v in affected or is_target[v]:
+                continue
+            if costs[v] is not None and any(dist[w] + costs[w] == dv for w in nbs[v]
+                                            if w not in affected and dist[w] < INF):
+                continue
+
+            affected.add(v)
+            d = dv + (old_cost if v == i else costs[v])
+            for u in nbs[v]:
+                if dist[u] == d and u not in affected:
+                    heappush(heap, (d, u))
+
+        for v in affected:
+            dist[v] = INF
+        return affected
+
+    def cell_changed(self, board, loc, old, new):
+        if self.dist is not None:
+            self.update(loc, new)
+
+    def tile_changed(self, board, loc, tile, attr, old):
+        if self.dist is not None:
+            self.update(loc, tile)
+
+    def next_step(self, tile_loc):
+        """Neighbour location one step closer to the nearest target from `tile_loc`, or None if no target can be reached."""
+        loc  = tile_loc if isinstance(tile_loc, Loc) else tile_loc.loc
+        dist, costs = self.dist, self.costs
+        best = min(self.nbs[loc.y*self.width + loc.x], key=lambda w: dist[w] + (costs[w] or 0), default=None)
+        return None if best is None or dist[best] == INF else self.locs[best]
+
+    def path(self, tile_loc):
+        """Shortest path from `tile_loc` to the nearest target as a list of locations, excluding the start."""
+        loc = tile_loc if isinstance(tile_loc, Loc) else tile_loc.loc
+        if self.target_at(loc):
+            return []
+
+        path, loc = [], self.next_step(loc)
+        while loc:
+            path.append(loc)
+            if self.is_target[loc.y*self.width + loc.x]:
+                return path
+            loc = self.next_step(loc)
+
+    def target_at(self, loc):
+        return self.is_target[loc.y*self.width + loc.x]
+
+    def clone(self, board):
+        new = copy(self)
+        if self.dist is not None:
+            new.dist, new.costs, new.is_target = list(self.dist), list(self.costs), list(self.is_target)
+        return new
+
+
+class Codec(object):
+    """ Mapping between characters and tiles for `BaseBoard.load()` and `dump()`.
+
+        tiles - maps each character to a tile class or function, called with the location to make a tile, or
+                to a string tile.
+        char  - function that returns the character of a tile for `dump()`; by default tiles are mapped back
+                to characters by class (string tiles by value), and other tiles by their repr.
+    """
+    def __init__(self, tiles, char=None, encoding="utf-8"):
+        self.tiles    = dict(tiles)
+        self.chars    = dict( (t, c) for c, t in self.tiles.items() if isinstance(t, (type, str)) )
+        self.encoding = encoding
+        if char:
+            self.char = char
+
+    def make(self, char, loc):
+        try:
+            tile = self.tiles[char]
+        except KeyError:
+            raise ValueError("Unknown tile character: %r" % char)
+        return tile if isinstance(tile, str) else tile(loc)
+
+    def char(self, tile):
+        key = tile if isinstance(tile, str) else tile.__class__
+        return self.chars[key] if key in self.chars else repr(tile)
+
+    def decode(self, data):
+        """List of characters in `data`: a string or bytes (line breaks are ignored), or a sequence of rows."""
+        if isinstance(data, bytes):
+            data = data.decode(self.encoding)
+        if isinstance(data, str):
+            return [c for c in data if c not in "\r\n"]
+        return [c for row in data for c in row]
+
+    def encode(self, chars, width, as_type=str):
+        """Encode the list of characters of the board as a string, bytes, or a list of rows (strings) if `as_type` is list."""
+        if as_type is list:
+            return [ ''.join(chars[i:i+width]) for i in range(0, len(chars), width) ]
+        data = ''.join(chars)
+        return data.encode(self.encoding) if as_type is bytes else data
+
+
 class BaseBoard(object):
     """ Base Board for regular and stackable boards.
 
-        TODO: add various scrolling and visual area options.
+        Boards larger than the screen can be drawn with a `render.Viewport` renderer, which scrolls a window
+        of the board to keep `current` location in view.
     """
     stackable         = False
     board_initialized = False
-
-    def __init__(self, size, num_grid=False, padding=(0, 0), pause_time=0.2, screen_sep=24):
+    _cow              = False   # rows and/or tiles may be shared with a clone, see `clone()`
+    _own_rows         = None    # with _cow, indexes of rows that are not shared
+    _private          = None    # with _cow, flat indexes of tiles that are not shared; None if all are private
+    _copies           = None    # with a journal, {id(tile): (tile, private copy)} for tiles copied after a clone
+    _undoing          = False
+    tables            = True    # use `Geometry` tables for neighbours and rays
+    screen            = screen  # `avkutil.Screen` shared by everything that draws to the terminal
+
+    def __init__(self, size, num_grid=False, padding=(0, 0), pause_time=0.2, screen_sep=24, index=(),
+                 renderer=None, zobrist=False, headless=None):
         if isinstance(size, int):
             size = size, size   # handle square board
 
@@ -67,26 +584,322 @@ class BaseBoard(object):
         self.init_tiles  = False
         self.current     = Loc(0,0)
         self.hl_visible  = False
+        self.renderer    = renderer
+        self.headless    = headless  # None: use global headless mode setting
 
         self.tiletpl     = "%%%ds" % (padding[0] + 1)
+        self.geom        = geometry(self.width, self.height)
+        self.watchers    = []
+        self.attr_index  = None
+        self.tracking    = False     # set when there are watchers or a journal
+        self.journal     = None
+        self.zobrist     = None
+        self.fields      = {}        # cached distance fields, see `distance_field()`
         self.directions()
 
+        if index:
+            self.attr_index = AttrIndex(index)
+            self.watch(self.attr_index)
+        if zobrist:
+            self.zobrist = ZobristHash()
+            self.watch(self.zobrist)
+
     def __iter__(self):
-        return ( self[Loc(x, y)] for y in range(self.height) for x in range(self.width) )
+        return ( self[loc] for loc in self.geom.locs )
 
     def tiles(self, *attrs):
+        if self.indexed(attrs):
+            return [ self[l] for l in self.indexed_locations(attrs, True) ]
         return [ t for t in self if all(getattr(t, attr) for attr in attrs) ]
 
     def tiles_not(self, *attrs):
+        if self.indexed(attrs):
+            return [ self[l] for l in self.indexed_locations(attrs, False) ]
         return [ t for t in self if all(not getattr(t, attr) for attr in attrs) ]
 
     def locations(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(getattr(self[l], attr) for attr in attrs) ]
+        if self.indexed(attrs):
+            return self.indexed_locations(attrs, True)
+        return [ l for l in self.geom.locs if all(getattr(self[l], attr) for attr in attrs) ]
 
     def locations_not(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(not getattr(self[l], attr) for attr in attrs) ]
+        if self.indexed(attrs):
+            return self.indexed_locations(attrs, False)
+        return [ l for l in self.geom.locs if all(not getattr(self[l], attr) for attr in attrs) ]
+
+    def indexed(self, attrs):
+        """Are all of `attrs` kept in the attribute index? (Set up with `index` init argument.)"""
+        idx = self.attr_index
+        return bool(attrs and idx and all(attr in idx.attrs for attr in attrs))
+
+    def indexed_locations(self, attrs, value=True):
+        """List of locations where all `attrs` are `value`, in no particular order, using the attribute index."""
+        self.init_board()
+        sets = sorted( (self.attr_index.locations(attr, value) for attr in attrs), key=len )
+        return [ l for l in sets[0] if all(l in s for s in sets[1:]) ]
+
+    def count(self, attr, value=True):
+        """Number of tiles where `attr` is `value`; O(1) if `attr` is indexed."""
+        if self.indexed([attr]):
+            self.init_board()
+            return len(self.attr_index.locations(attr, value))
+        return len(self.locations(attr) if value else self.locations_not(attr))
+
+    def random_location(self, attr, value=True):
+        """Random location where `attr` of the tile is `value`; O(1) if `attr` is indexed."""
+        if self.indexed([attr]):
+            self.init_board()
+            return self.attr_index.locations(attr, value).choice()
+        return rndchoice(self.locations(attr) if value else self.locations_not(attr))
+
+    def random_tile(self, attr, value=True):
+        return self[self.random_location(attr, value)]
+
+    def clone(self):
+        """ Return a copy of the board that shares rows with this board until they are written to, and
+            tiles until they are first accessed, so that cloning takes O(rows) time. Either board copies a
+            shared tile on its first access with the tile's `clone()` method (a shallow copy for tiles
+            that aren't `BaseTile`s), so tiles modified in place on one board don't show up in the other.
+
+            Note that this invalidates tile references across the clone: a tile taken from this board
+            before `clone()` is no longer this board's tile (nor the clone's), so tiles need to be looked
+            up again by location afterwards.
+
+            Watchers that have a `clone(board)` method are carried over to the clone, others are dropped.
+        """
+        self.init_board()
+        new            = copy(self)
+        new.renderer   = None
+        new.watchers   = []
+        new.attr_index = None
+        new.journal    = None
+        new._copies    = None
+        new.zobrist    = None
+        new.fields     = {}
+
+        for watcher in self.watchers:
+            if hasattr(watcher, "clone"):
+                new.watchers.append(watcher.clone(new))
+                if watcher is self.attr_index : new.attr_index = new.watchers[-1]
+                if watcher is self.zobrist    : new.zobrist    = new.watchers[-1]
+                if isinstance(watcher, DistanceField):
+                    new.fields[watcher.key] = new.watchers[-1]
+        new.tracking = bool(new.watchers)
+        return new
+
+    def share_rows(self, new):
+        """Mark rows and tiles as shared between this board and its clone `new`."""
+        new.board      = list(self.board)
+        new._private   = set()
+        new._own_rows  = set()
+        new._cow       = True
+        self._private  = set()
+        self._own_rows = set()
+        self._cow      = True
+
+    def own_row(self, y):
+        """Return row `y`, copying it first if it is shared with a clone."""
+        if y not in self._own_rows:
+            self.board[y] = list(self.board[y])
+            self._own_rows.add(y)
+            self.check_cow()
+        return self.board[y]
+
+    def own_tile(self, tile):
+        """Return a private copy of shared `tile`; with a journal, the copy is noted for `current_tile()`."""
+        new = tile.clone() if isinstance(tile, BaseTile) else copy(tile)
+        if new is not tile:
+            if self.tracking and isinstance(new, TrackedTile):
+                new.board = self
+            if self.journal is not None:
+                self._copies[id(tile)] = tile, new
+        return new
+
+    def current_tile(self, tile):
+        """Return the private copy that replaced `tile` of the journal after a clone, or `tile` itself."""
+        copies = self._copies
+        while copies and id(tile) in copies:
+            tile = copies[id(tile)][1]
+        return tile
+
+    def check_cow(self):
+        """Turn off copy-on-write checks once all rows and tiles are private."""
+        private = self._private
+        if len(self._own_rows) == self.height and (private is None or len(private) == self.width*self.height):
+            self._cow      = False
+            self._private  = None
+            self._own_rows = None
+
+    @property
+    def position_hash(self):
+        """ 64-bit Zobrist hash of the position; kept up to date incrementally if the board was created
+            with `zobrist=True`, otherwise calculated from scratch.
+        """
+        self.init_board()
+        if self.zobrist:
+            return self.zobrist.value
+
+        zobrist = ZobristHash()
+        zobrist.reset(self)
+        return zobrist.value
+
+    def watch(self, watcher):
+        """ Add a `watcher` that is notified of board changes; a watcher needs to have three methods:
+
+            reset(board)                             - board was (re)initialized or loaded in bulk
+            cell_changed(board, loc, old, new)       - tile at `loc` was replaced, `new` is the top tile
+            tile_changed(board, loc, tile, attr, old)- `tracked` attribute of a TrackedTile was changed
+
+            Tiles are linked to the board (for `tile_changed` calls) on `reset`.
+        """
+        self.watchers.append(watcher)
+        self.tracking = True
+        if self.board_initialized:
+            self.link_tiles()
+            watcher.reset(self)
+
+    def link_tiles(self):
+        for tile in self:
+            if isinstance(tile, TrackedTile):
+                tile.board = self
+
+    def watchers_reset(self):
+        """Reset watchers after board was (re)initialized; journal is restarted as undo entries no longer apply."""
+        if self.tracking:
+            self.link_tiles()
+            for watcher in self.watchers:
+                watcher.reset(self)
+            if self.journal is not None:
+                self.start_journal()
+
+    def changed(self, loc, old, new):
+        """Notify watchers that `old` tile at `loc` was replaced by `new` one."""
+        if isinstance(new, TrackedTile):
+            new.board = self
+        for watcher in self.watchers:
+            watcher.cell_changed(self, loc, old, new)
+
+    def tile_changed(self, tile, attr, old):
+        """Called by TrackedTile `tile` when its `attr` changes from `old`; ignored if tile is no longer on the board."""
+        loc = tile.loc
+        if loc is not None and self.valid(loc) and self[loc] is tile:
+            self.record(ATTR, tile, attr, old)
+            for watcher in self.watchers:
+                watcher.tile_changed(self, loc, tile, attr, old)
+
+    # ==== Journal ========================================================
+
+    def start_journal(self):
+        """ Start recording undo entries for all changes to the board and to tracked attributes of its tiles;
+            a position can then be saved with `checkpoint()` and restored with `rollback()` in time
+            proportional to the number of changes. `undo()` and `redo()` work on top of checkpoints.
+        """
+        self.init_board()
+        self.journal    = []
+        self._copies    = {}
+        self.undo_marks = []
+        self.redo_log   = []
+        self.tracking   = True
+        self.link_tiles()
+
+    def record(self, *entry):
+        if self.journal is not None:
+            self.journal.append(entry)
+            if self.redo_log and not self._undoing:
+                self.redo_log = []
+
+    def checkpoint(self):
+        """Save current position in the journal and return it."""
+        self.undo_marks.append(len(self.journal))
+        return len(self.journal)
+
+    def rollback(self, checkpoint):
+        """Undo all changes made after `checkpoint`; return the list of journal entries that would redo them."""
+        journal, redo = self.journal, []
+        self.journal, self._undoing = redo, True
+        try:
+            while len(journal) > checkpoint:
+                self.undo_entry(journal.pop())
+        finally:
+            self.journal, self._undoing = journal, False
+
+        self.undo_marks = [m for m in self.undo_marks if m <= checkpoint]
+        return redo
+
+    def undo(self):
+        """Undo changes back to the last checkpoint that has changes after it; return False if there is none."""
+        marks = self.undo_marks
+        while marks and marks[-1] >= len(self.journal):
+            marks.pop()
+        if not marks:
+            return False
+
+        self.redo_log.append( self.rollback(marks.pop()) )
+        return True
+
+    def redo(self):
+        """Redo the last undone changes; return False if there is nothing to redo."""
+        if not self.redo_log:
+            return False
+
+        entries = self.redo_log.pop()
+        self.checkpoint()
+        self._undoing = True
+        try:
+            for entry in reversed(entries):
+                self.undo_entry(entry)
+        finally:
+            self._undoing = False
+        return True
+
+    def undo_entry(self, entry):
+        """Revert the change recorded as journal `entry`; the revert is recorded in turn."""
+        op = entry[0]
+        if   op == SET    : self[entry[1]] = self.current_tile(entry[2])
+        elif op == PUSH   : self[entry[1]] = self.current_tile(entry[2])
+        elif op == POP    : del self[entry[1]]
+        elif op == INSERT : self.insert_at(*entry[1:])
+        elif op == REMOVE : self.remove_at(*entry[1:])
+        elif op == ATTR   : self.undo_attr(*entry[1:])
+
+    def undo_attr(self, tile, attr, old):
+        loc = getattr(tile, "loc", None)
+        if self._cow and loc is not None and self.valid(loc):
+            self[loc]                       # copy the tile first if it's still shared with a clone
+        setattr(self.current_tile(tile), attr, old)
+
+    # ==== Bulk load / dump =================================================
+
+    def load(self, data, codec):
+        """ Replace all tiles with ones decoded from `data` by `codec` (see `Codec.decode()` for formats) in one
+            pass; as after initialization, watchers are reset and the journal is restarted. Returns the board.
+        """
+        chars = codec.decode(data)
+        if len(chars) != self.width * self.height:
+            raise ValueError("Expected %d tiles, got %d" % (self.width * self.height, len(chars)))
+
+        self.fill(chars, codec)
+        self.board_initialized = True
+        self.watchers_reset()
+        return self
+
+    def fill(self, chars, codec):
+        """Set all tiles from the list of `chars`; boards override this to build their storage directly."""
+        tracking, self.tracking = self.tracking, False
+        try:
+            for loc, char in zip(self.geom.locs, chars):
+                self[loc] = codec.make(char, loc)
+        finally:
+            self.tracking = tracking
+
+    def dump(self, codec, as_type=str):
+        """Encode all tiles with `codec`, as a string, bytes, or a list of rows if `as_type` is list."""
+        self.init_board()
+        return codec.encode([codec.char(tile) for tile in self], self.width, as_type)
+
+    def index(self, tile_loc):
+        """Flat index of `tile_loc` location, i.e. position of its Loc in `self.geom.locs`."""
+        return self.geom.index(self.ploc(tile_loc))
 
     def ploc(self, tile_loc):
         """Parse location out of tile-or-loc `tile_loc`."""
@@ -94,19 +907,33 @@ class BaseBoard(object):
         else                         : return tile_loc.loc
 
     def draw(self, pause=None):
+        """Draw the board; if board has a renderer (e.g. `render.DiffRenderer`), drawing is delegated to it."""
         pause = pause or self.pause_time
-        print(nl * self.screen_sep)
+        if is_headless(self.headless):
+            return
+        if self.renderer:
+            self.renderer.draw(self, pause)
+            return
+
+        def line(*args):
+            return space.join(args) + nl
 
+        out = []
         if self.num_grid:
-            print(space, space*(self.xpad + 1), ujoin( range1(self.width), space, self.tiletpl ), nl * self.ypad)
+            out.append(line(space, space*(self.xpad + 1), ujoin( range1(self.width), space, self.tiletpl ), nl * self.ypad))
 
         for n, row in enumerate1(self.board):
             args = [self.tiletpl % n] if self.num_grid else []
             if self.stackable:
                 row = (tile[-1] for tile in row)
             args = [space] + args + [ujoin(row, space, self.tiletpl), nl * self.ypad]
-            print(*args)
+            out.append(line(*args))
 
+        screen = self.screen
+        if self.screen_sep:
+            screen.clear()
+        screen.write(''.join(out))
+        screen.flush()
         self.status()
         sleep(pause)
 
@@ -118,31 +945,32 @@ class BaseBoard(object):
 
     def directions(self):
         """Create list and dict of eight directions, going from up clockwise."""
-        dirs          = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
-        self.dirlist  = [Dir(*d) for d in (dirs[0], dirs[2], dirs[4], dirs[6])]
-        self.dirlist2 = [Dir(*d) for d in dirs]
+        self.dirlist  = [Dir(*d) for d in dirs4]
+        self.dirlist2 = [Dir(*d) for d in dirs8]
         self.dirnames = dict(zip(self.dirlist2, "up ru right rd down ld left lu".split()))
+        self.dirindex = dict((dir, n) for n, dir in enumerate(self.dirlist2))
 
-    def neighbour_locs(self, tile_loc):
-        """Return the list of neighbour locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        coords = (-1,0,1)
-        locs = set((x+n, y+m) for n in coords for m in coords) - set( [(x,y)] )
-        return [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
+    def neighbour_locs(self, tile_loc, wrap=False):
+        """Return the sequence of neighbour locations of `tile`, looked up in the shared adjacency table."""
+        loc = self.ploc(tile_loc)
+        if not self.tables:
+            return cell_neighbours(loc, dirs8, self.width, self.height, wrap)
+        return self.geom.neighbours(dirs8, wrap)[self.geom.index(loc)]
 
-    def neighbours(self, tile_loc):
+    def neighbours(self, tile_loc, wrap=False):
         """Return the list of neighbours of `tile`."""
-        return [self[loc] for loc in self.neighbour_locs(tile_loc)]
+        return [self[loc] for loc in self.neighbour_locs(tile_loc, wrap)]
 
-    def neighbour_cross_locs(self, tile_loc):
-        """Return a generator of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        locs = ((x-1, y), (x+1, y), (x, y-1), (x, y+1))
-        return [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
+    def neighbour_cross_locs(self, tile_loc, wrap=False):
+        """Return the sequence of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
+        loc = self.ploc(tile_loc)
+        if not self.tables:
+            return cell_neighbours(loc, dirs4, self.width, self.height, wrap)
+        return self.geom.neighbours(dirs4, wrap)[self.geom.index(loc)]
 
-    def cross_neighbours(self, tile_loc):
+    def cross_neighbours(self, tile_loc, wrap=False):
         """Return the generator of 'cross' (i.e. no diagonal) neighbours of `tile`."""
-        return (self[loc] for loc in self.neighbour_cross_locs(tile_loc))
+        return (self[loc] for loc in self.neighbour_cross_locs(tile_loc, wrap))
 
     def make_tile(self, loc):
         """Make a tile using `self.def_tile`. If def_tile is simply a string, return it, otherwise instantiate with x, y as arguments."""
@@ -155,25 +983,23 @@ class BaseBoard(object):
         self[loc]    = self.make_tile(loc)
 
         if hasattr(item, "loc"):
+            if self.tracking:
+                self.record(ATTR, item, "loc", item.loc)
             item.loc = newloc
 
     def nextloc(self, tile_loc, dir, n=1, wrap=False):
-        """Return location next to `tile_loc` point in direction `dir`."""
+        """Return location next to `tile_loc` point in direction `dir`; the shared one from `geom` if the board uses tables."""
         loc = self.ploc(tile_loc)
-
         x   = loc.x + dir.x*n
         y   = loc.y + dir.y*n
 
         if wrap:
-            while not self.valid(Loc(x,y)):
-                if x > (self.width - 1)  : x -= self.width
-                elif x < 0               : x += self.width
+            x %= self.width
+            y %= self.height
 
-                if y > (self.height - 1) : y -= self.height
-                elif y < 0               : y += self.height
-
-        loc = Loc(x, y)
-        return loc if self.valid(loc) else None
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        return self.geom.loc(x, y) if self.tables else Loc(x, y)
 
     def next_tile(self, tile_loc, dir, n=1):
         loc = self.nextloc(tile_loc, dir, n)
@@ -183,16 +1009,79 @@ class BaseBoard(object):
         l1, l2 = self.ploc(tile_loc1), self.ploc(tile_loc2)
         return math.sqrt( abs(l2.x - l1.x)**2 + abs(l2.y - l1.y)**2  )
 
+    def distance_field(self, targets, passable=None, dirs=dirs4, cost=None):
+        """ Return the `DistanceField` to `targets` (locations, or name of a tile attribute); fields are cached by
+            arguments and kept up to date as the board changes, so `passable` and `cost` functions should be
+            the same objects on each call rather than new lambdas.
+        """
+        self.init_board()
+        field = DistanceField(targets, passable, dirs, cost)
+        if field.key not in self.fields:
+            self.fields[field.key] = field
+            self.watch(field)
+        return self.fields[field.key]
+
+    def find_path(self, start, goal, passable=None, dirs=dirs4, cost=None):
+        """ Return the shortest path from `start` to `goal` as a list of locations excluding the start, or None
+            if there is none; uses A*. Only `passable` tiles (all if None) and the goal can be entered; entering
+            a tile costs `cost(tile)`, which should be at least 1, or 1 if `cost` is None.
+        """
+        start, goal = self.ploc(start), self.ploc(goal)
+        locs, nbs   = self.geom.locs, self.geom.neighbour_indexes(dirs)
+        w, gx, gy   = self.width, goal.x, goal.y
+        s, g        = start.y*w + start.x, goal.y*w + goal.x
+        diagonal    = any(dx and dy for dx, dy in dirs)
+
+        def estimate(i):
+            dx, dy = abs(locs[i].x - gx), abs(locs[i].y - gy)
+            return max(dx, dy) if diagonal else dx + dy
+
+        came, costs = {s: None}, {s: 0}
+        heap        = [(estimate(s), 0, s)]
+
+        while heap:
+            f, d, v = heappop(heap)
+            if v == g:
+                path = []
+                while v != s:
+                    path.append(locs[v])
+                    v = came[v]
+                return path[::-1]
+            if d > costs[v]:
+                continue
+
+            for u in nbs[v]:
+                tile = self[locs[u]]
+                if u != g and passable and not passable(tile):
+                    continue
+                du = d + (cost(tile) if cost else 1)
+                if du < costs.get(u, INF):
+                    costs[u], came[u] = du, v
+                    heappush(heap, (du + estimate(u), du, u))
+
+    def ray_locs(self, tile_loc, dir, n=0):
+        """ Return the sequence of locations from `tile_loc` in `dir` direction for `n` locations; if
+            n is 0, to the end of board, excluding the start.
+        """
+        loc = self.ploc(tile_loc)
+        d   = self.dirindex.get(dir)
+
+        if not self.tables or d is None or not self.valid(loc):
+            locs = []
+            loc  = self.nextloc(loc, dir)
+            while loc and not (n and len(locs) == n):
+                locs.append(loc)
+                loc = self.nextloc(loc, dir)
+            return locs
+
+        ray = self.geom.ray(loc, d)
+        return ray[:n] if n else ray
+
     def ray(self, tile, dir, n=0):
         """ Generate a 'ray' of tiles from `tile` start in `dir` direction for `n` tiles; if n is
             0, to the end of board, excluding `start`.
         """
-        while True:
-            tile = self.next_tile(tile, dir)
-            if tile   : yield tile
-            else      : break
-            if n == 1 : break
-            if n: n -= 1
+        return ( self[loc] for loc in self.ray_locs(tile, dir, n) )
 
     def reset(self):
         self.board_initialized = False
@@ -212,16 +1101,47 @@ class Board(BaseBoard):
 
     def __getitem__(self, loc):
         self.init_board()
+        if self._cow:
+            return self.private_tile(loc)
         return self.board[loc.y][loc.x]
 
     def __setitem__(self, tile_loc, item):
         self.init_board()
         loc = self.ploc(tile_loc)
-        self.board[loc.y][loc.x] = item
+        if self._cow:
+            if self.journal is not None:
+                self.private_tile(loc)      # so that the journal keeps a private copy of the old tile
+            row = self.own_row(loc.y)
+            if self._private is not None:
+                self._private.add(loc.y*self.width + loc.x)
+        else:
+            row = self.board[loc.y]
+
+        old, row[loc.x] = row[loc.x], item
+        if self.tracking:
+            self.record(SET, loc, old)
+            self.changed(loc, old, item)
+
+    def clone(self):
+        new = super(Board, self).clone()
+        self.share_rows(new)
+        return new
+
+    def private_tile(self, loc):
+        """Return tile at `loc`, copying it first if it's shared with the board this board was cloned from."""
+        tile, private = self.board[loc.y][loc.x], self._private
+        i = loc.y*self.width + loc.x
+
+        if private is not None and i not in private:
+            private.add(i)
+            new = self.own_tile(tile)
+            if new is not tile:
+                tile = self.own_row(loc.y)[loc.x] = new
+            self.check_cow()
+        return tile
 
     def __delitem__(self, tile_loc):
-        loc = self.ploc(tile_loc)
-        self.board[loc.y][loc.x] = self.make_tile(loc)
+        self[tile_loc] = self.make_tile(self.ploc(tile_loc))
 
     def empty(self, tile_loc):
         loc = self.ploc(tile_loc)
@@ -230,6 +1150,12 @@ class Board(BaseBoard):
         else:
             return isinstance(self[loc], self.def_tile)
 
+    def fill(self, chars, codec):
+        w, make    = self.width, codec.make
+        tiles      = [make(c, loc) for loc, c in zip(self.geom.locs, chars)]
+        self.board = [ tiles[y*w:(y+1)*w] for y in range(self.height) ]
+        self._cow, self._own_rows, self._private = False, None, None
+
     def init_board(self):
         """ To allow tiles that place themselves on the board, board is first initialized with None values in __init__,
             then on the first __setitem__ or __getitem__, init_board() runs; self.board_initialized needs to be set
@@ -237,8 +1163,9 @@ class Board(BaseBoard):
         """
         if not self.board_initialized:
             self.board_initialized = True
-            xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [self.make_tile(Loc(x, y)) for x in xrng] for y in yrng ]
+            locs, w    = self.geom.locs, self.width
+            self.board = [ [self.make_tile(loc) for loc in locs[y*w:(y+1)*w]] for y in range(self.height) ]
+            self.watchers_reset()
 
 
 class StackableBoard(BaseBoard):
@@ -256,16 +1183,24 @@ class StackableBoard(BaseBoard):
 
     def __getitem__(self, loc):
         self.init_board()
-        return self.board[loc.y][loc.x][-1]
+        return self.stack(loc)[-1]
 
     def __setitem__(self, tile_loc, item):
         self.init_board()
-        loc = self.ploc(tile_loc)
-        self.board[loc.y][loc.x].append(item)
+        loc   = self.ploc(tile_loc)
+        stack = self.stack(loc)
+        stack.append(item)
+        if self.tracking:
+            self.record(POP, loc)
+            self.changed(loc, stack[-2], item)
 
     def __delitem__(self, tile_loc):
-        loc = self.ploc(tile_loc)
-        del self.board[loc.y][loc.x][-1]
+        loc   = self.ploc(tile_loc)
+        stack = self.stack(loc)
+        old   = stack.pop()
+        if self.tracking:
+            self.record(PUSH, loc, old)
+            self.changed(loc, old, stack[-1])
 
     def empty(self, tile_loc):
         return len( self.items(self.ploc(tile_loc)) ) == 1
@@ -273,12 +1208,37 @@ class StackableBoard(BaseBoard):
     def init_board(self):
         if not self.board_initialized:
             self.board_initialized = True
-            xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [ [self.make_tile( Loc(x, y) )] for x in xrng] for y in yrng ]
+            locs, w    = self.geom.locs, self.width
+            self.board = [ [ [self.make_tile(loc)] for loc in locs[y*w:(y+1)*w] ] for y in range(self.height) ]
+            self.watchers_reset()
+
+    def fill(self, chars, codec):
+        w, make    = self.width, codec.make
+        stacks     = [ [make(c, loc)] for loc, c in zip(self.geom.locs, chars) ]
+        self.board = [ stacks[y*w:(y+1)*w] for y in range(self.height) ]
+        self._cow, self._own_rows, self._private = False, None, None
 
     def items(self, tile_loc):
-        loc = self.ploc(tile_loc)
-        return self.board[loc.y][loc.x]
+        return self.stack(self.ploc(tile_loc))
+
+    def stack(self, loc):
+        """Return the list of items at `loc`, copying it (with its tiles) first if it's shared with a clone."""
+        if not self._cow:
+            return self.board[loc.y][loc.x]
+
+        row, private = self.own_row(loc.y), self._private
+        i = loc.y*self.width + loc.x
+
+        if private is not None and i not in private:
+            private.add(i)
+            row[loc.x] = [self.own_tile(tile) for tile in row[loc.x]]
+            self.check_cow()
+        return row[loc.x]
+
+    def clone(self):
+        new = super(StackableBoard, self).clone()
+        self.share_rows(new)
+        return new
 
     def get_instance(self, cls, tile_loc, default=None):
         """Get first instance of `cls` from `tile_loc` location."""
@@ -289,7 +1249,523 @@ class StackableBoard(BaseBoard):
 
         loc = self.ploc(tile_loc)
         self[newloc] = item
-        self.items(loc).remove(item)
+        self.remove_at(loc, self.items(loc).index(item))
 
         if hasattr(item, "loc"):
+            if self.tracking:
+                self.record(ATTR, item, "loc", item.loc)
             item.loc = newloc
+
+    def remove_at(self, loc, i):
+        """Remove item at index `i` of the stack at `loc`."""
+        stack = self.stack(loc)
+        item  = stack.pop(i)
+        if self.tracking:
+            self.record(INSERT, loc, i, item)
+            if i == len(stack):
+                self.changed(loc, item, stack[-1])
+
+    def insert_at(self, loc, i, item):
+        """Insert `item` at index `i` of the stack at `loc`."""
+        stack = self.stack(loc)
+        stack.insert(i, item)
+        if self.tracking:
+            self.record(REMOVE, loc, i)
+            if i == len(stack) - 1:
+                self.changed(loc, stack[-2], item)
+
+
+class LayeredBoard(BaseBoard):
+    """ Board with a fixed number of typed layers, e.g. terrain, items and units; a cell holds at most one
+        item per layer. `layers` is a sequence of (name, class) pairs, bottom layer first; an item goes to the
+        first layer whose class it's an instance of. The bottom layer is filled with `def_tile`.
+
+        Each layer is a flat list indexed by `y*width + x`, and occupied locations are indexed by the class
+        of the item, so `get_instance()`, `items()` and `move()` take constant time and `locations_of()`
+        doesn't need to scan the board. As on a stackable board, `board[loc]` is the top item.
+    """
+    def __init__(self, size, def_tile, layers, **kwargs):
+        super(LayeredBoard, self).__init__(size, **kwargs)
+
+        try              : self._def_tile_str = isinstance(def_tile, basestring)
+        except NameError : self._def_tile_str = isinstance(def_tile, str)
+
+        self.def_tile     = def_tile
+        self.layer_names  = [name for name, cls in layers]
+        self.layer_types  = [cls for name, cls in layers]
+        self.layers       = [ [None] * (self.width * self.height) for _ in layers ]
+        self.by_class     = {}      # class of item => IndexedSet of locations
+        self._type_layers = {}      # class => layer number (or None), see `layer_of_class()`
+
+    def __iter__(self):
+        self.init_board()
+        return ( self.top(i) for i in range(self.width * self.height) )
+
+    def __getitem__(self, loc):
+        self.init_board()
+        return self.top(loc.y*self.width + loc.x)
+
+    def __setitem__(self, tile_loc, item):
+        """Put `item` into its layer at `tile_loc`, replacing the item that was there in that layer."""
+        self.insert_at(self.ploc(tile_loc), self.layer_of(item), item)
+
+    def __delitem__(self, tile_loc):
+        """Remove the top item; the bottom layer can't be empty so it's reset to the default tile."""
+        loc = self.ploc(tile_loc)
+        n   = self.top_layer(loc.y*self.width + loc.x)
+        if n : self.remove_at(loc, n)
+        else : self.insert_at(loc, 0, self.make_tile(loc))
+
+    @property
+    def board(self):
+        """List of rows of top items, same layout as `Board.board`."""
+        self.init_board()
+        w = self.width
+        return [ [self.top(i) for i in range(y*w, (y+1)*w)] for y in range(self.height) ]
+
+    def top(self, i):
+        """Top item at flat index `i`."""
+        for layer in reversed(self.layers):
+            if layer[i] is not None:
+                return layer[i]
+
+    def top_layer(self, i):
+        """Number of the top occupied layer at flat index `i`."""
+        for n in range(len(self.layers) - 1, -1, -1):
+            if self.layers[n][i] is not None:
+                return n
+
+    def layer_of_class(self, cls):
+        """Number of the layer that instances of `cls` go to, or None if `cls` is not a subclass of any layer class."""
+        try:
+            return self._type_layers[cls]
+        except KeyError:
+            n = first(n for n, t in enumerate(self.layer_types) if issubclass(cls, t))
+            self._type_layers[cls] = n
+            return n
+
+    def layer_of(self, item):
+        n = self.layer_of_class(item.__class__)
+        if n is None:
+            raise ValueError("No layer for %r" % (item,))
+        return n
+
+    def layer(self, name):
+        """Layer list by its `name`."""
+        return self.layers[self.layer_names.index(name)]
+
+    def empty(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        i   = loc.y*self.width + loc.x
+        return all(layer[i] is None for layer in self.layers[1:])
+
+    def init_board(self):
+        if not self.board_initialized:
+            self.board_initialized = True
+            self.layers[0] = [self.make_tile(loc) for loc in self.geom.locs]
+            for layer in self.layers[1:]:
+                layer[:] = [None] * len(layer)
+
+            self.by_class = {}
+            for layer in self.layers:
+                for loc, item in zip(self.geom.locs, layer):
+                    if item is not None:
+                        self.by_class.setdefault(item.__class__, IndexedSet()).add(loc)
+            self.watchers_reset()
+
+    def items(self, tile_loc):
+        """List of items at `tile_loc`, bottom layer first."""
+        self.init_board()
+        loc = self.ploc(tile_loc)
+        i   = loc.y*self.width + loc.x
+        return [layer[i] for layer in self.layers if layer[i] is not None]
+
+    def get_instance(self, cls, tile_loc, default=None):
+        """Get first instance of `cls` from `tile_loc` location; looks in a single layer if `cls` belongs to one."""
+        self.init_board()
+        loc = tile_loc if isinstance(tile_loc, Loc) else tile_loc.loc
+        n   = self._type_layers[cls] if cls in self._type_layers else self.layer_of_class(cls)
+
+        if n is None:
+            return first((i for i in self.items(loc) if isinstance(i, cls)), default)
+        item = self.layers[n][loc.y*self.width + loc.x]
+        return item if isinstance(item, cls) else default
+
+    def locations_of(self, cls):
+        """List of locations of all cells that contain an instance of `cls`."""
+        self.init_board()
+        sets = [locs for c, locs in self.by_class.items() if locs and issubclass(c, cls)]
+        if len(sets) == 1:
+            return list(sets[0])
+        return list(dict.fromkeys(loc for locs in sets for loc in locs))
+
+    def move(self, tile_loc, newloc):
+        item = self[tile_loc] if isinstance(tile_loc, Loc) else tile_loc
+        n    = self.layer_of(item)
+
+        self.remove_at(self.ploc(tile_loc), n)
+        self.insert_at(newloc, n, item)
+
+        if hasattr(item, "loc"):
+            if self.tracking:
+                self.record(ATTR, item, "loc", item.loc)
+            item.loc = newloc
+
+    def remove_at(self, loc, n):
+        """Remove the item in layer `n` at `loc`."""
+        i, layer = loc.y*self.width + loc.x, self.layers[n]
+        item     = layer[i]
+        self.by_class[item.__class__].discard(loc)
+
+        if self.tracking:
+            covered  = self.top_layer(i) != n
+            layer[i] = None
+            self.record(INSERT, loc, n, item)
+            if not covered:
+                self.changed(loc, item, self.top(i))
+        else:
+            layer[i] = None
+
+    def insert_at(self, loc, n, item):
+        """Put `item` into layer `n` at `loc`, replacing the item that was there in that layer."""
+        self.init_board()
+        i, layer = loc.y*self.width + loc.x, self.layers[n]
+        old      = layer[i]
+        top      = self.top(i) if self.tracking else None
+
+        if old is not None:
+            self.by_class[old.__class__].discard(loc)
+        layer[i] = item
+        try             : self.by_class[item.__class__].add(loc)
+        except KeyError : self.by_class[item.__class__] = IndexedSet([loc])
+
+        if self.tracking:
+            if old is not None:
+                self.record(INSERT, loc, n, old)
+            self.record(REMOVE, loc, n)
+            if self.top(i) is item:
+                self.changed(loc, top, item)
+
+    def clone(self):
+        """Return a copy of the board; layers are copied along with their items."""
+        new          = super(LayeredBoard, self).clone()
+        new.layers   = [ [None if t is None else new.own_tile(t) for t in layer] for layer in self.layers ]
+        new.by_class = dict( (cls, locs.copy()) for cls, locs in self.by_class.items() )
+        return new
+
+
+class ChunkedBoard(BaseBoard):
+    """ Sparse board for very large maps: cells are stored in square chunks of `chunk` x `chunk` cells, and a
+        chunk is allocated when one of its cells is first written; until then its cells hold the shared default
+        tile, so memory use is proportional to the area written to. Draw it with a `render.Viewport` renderer,
+        which only renders the part of the board around `current` location.
+
+        Note that the default tile is shared, so it should not be modified in place -- assign a different tile
+        to the location, or get a tile of its own with `private_tile()`; for the same reason, locations need to
+        be passed as `Loc` rather than as tiles. `Geometry` tables are not used, as they'd be as large as the
+        board; iterating over the board takes time proportional to its full size.
+
+        For the same reason, `locations()`, `tiles()` and their `_not` versions only list the cells of written
+        chunks and raise ValueError if the default tile matches, as the list would have a location per cell;
+        `scan_locations()` goes over all cells lazily instead. `count()` and `random_location()` work either way.
+        Watchers that keep a value per cell -- the attribute index (`index`), position hash (`zobrist`) and
+        distance fields -- are not supported either.
+    """
+    tables = False
+
+    def __init__(self, size, def_tile, chunk=64, **kwargs):
+        super(ChunkedBoard, self).__init__(size, **kwargs)
+
+        try              : self._def_tile_str = isinstance(def_tile, basestring)
+        except NameError : self._def_tile_str = isinstance(def_tile, str)
+
+        self.def_tile = def_tile
+        self.chunk    = chunk
+        self.chunks   = {}      # (chunk x, chunk y) => list of tiles indexed by `y*chunk + x` within the chunk
+        self.default  = self.make_tile(None)
+        self.board_initialized = True
+        self.watchers_reset()
+
+    def __iter__(self):
+        n, default = self.chunk, self.default
+        for y in range(self.height):
+            cy, row = divmod(y, n)
+            for cx in range((self.width - 1)//n + 1):
+                chunk = self.chunks.get((cx, cy))
+                width = min(n, self.width - cx*n)
+                if chunk is None:
+                    for _ in range(width):
+                        yield default
+                else:
+                    for tile in chunk[row*n : row*n + width]:
+                        yield tile
+
+    def __getitem__(self, loc):
+        cx, x = divmod(loc.x, self.chunk)
+        cy, y = divmod(loc.y, self.chunk)
+        chunk = self.chunks.get((cx, cy))
+        return self.default if chunk is None else chunk[y*self.chunk + x]
+
+    def __setitem__(self, tile_loc, item):
+        loc   = self.ploc(tile_loc)
+        cx, x = divmod(loc.x, self.chunk)
+        cy, y = divmod(loc.y, self.chunk)
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = self.chunks[cx, cy] = [self.default] * (self.chunk * self.chunk)
+
+        i = y*self.chunk + x
+        old, chunk[i] = chunk[i], item
+        if self.tracking:
+            self.record(SET, loc, old)
+            self.changed(loc, old, item)
+
+    def __delitem__(self, tile_loc):
+        self[tile_loc] = self.default
+
+    @property
+    def board(self):
+        """List of rows of tiles, same layout as `Board.board`; only practical for small boards."""
+        tiles = iter(self)
+        return [ [next(tiles) for x in range(self.width)] for y in range(self.height) ]
+
+    def private_tile(self, loc):
+        """Return tile at `loc`, first replacing the shared default tile with a new tile if needed."""
+        tile = self[loc]
+        if tile is self.default and not self._def_tile_str:
+            tile = self[loc] = self.make_tile(loc)
+        return tile
+
+    def empty(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        if self._def_tile_str:
+            return bool(self[loc] == self.def_tile)
+        else:
+            return isinstance(self[loc], self.def_tile)
+
+    def init_board(self):
+        if not self.board_initialized:
+            self.board_initialized = True
+            self.chunks = {}
+            self.watchers_reset()
+
+    def link_tiles(self):
+        for loc in self.written_locations():
+            if isinstance(self[loc], TrackedTile):
+                self[loc].board = self
+
+    def written_locations(self):
+        """Generate locations of cells that hold a tile other than the shared default tile."""
+        n, default = self.chunk, self.default
+        for (cx, cy), chunk in self.chunks.items():
+            for i, tile in enumerate(chunk):
+                if tile is not default:
+                    y, x = divmod(i, n)
+                    yield Loc(cx*n + x, cy*n + y)
+
+    def move(self, tile_loc, newloc):
+        loc          = self.ploc(tile_loc)
+        item         = self[loc]
+        self[newloc] = item
+        del self[loc]
+
+        if hasattr(item, "loc"):
+            if self.tracking:
+                self.record(ATTR, item, "loc", item.loc)
+            item.loc = newloc
+
+    def clone(self):
+        """Return a copy of the board; chunks are copied, tiles are shared."""
+        new        = super(ChunkedBoard, self).clone()
+        new.chunks = dict( (key, list(chunk)) for key, chunk in self.chunks.items() )
+        return new
+
+    def watch(self, watcher):
+        if isinstance(watcher, (AttrIndex, ZobristHash, DistanceField)):
+            name = watcher.__class__.__name__
+            raise ValueError("ChunkedBoard does not support %s, which keeps a value per cell" % name)
+        super(ChunkedBoard, self).watch(watcher)
+
+    @property
+    def position_hash(self):
+        raise ValueError("ChunkedBoard does not support position hashing, which keeps a value per cell")
+
+    def _locations(self, attrs, test):
+        """Generate matching locations: of all cells if the default tile matches, otherwise of written cells."""
+        match = lambda tile: all(test(getattr(tile, attr)) for attr in attrs)
+        if match(self.default):
+            return self.scan_locations(match)
+        return (l for l in self.written_locations() if match(self[l]))
+
+    def written_matches(self, attrs, test):
+        """List of matching locations, which are all in written chunks unless the default tile matches."""
+        if all(test(getattr(self.default, attr)) for attr in attrs):
+            raise ValueError("Default tile of ChunkedBoard matches, use scan_locations() to go over all cells")
+        return list(self._locations(attrs, test))
+
+    def scan_locations(self, match):
+        """ Generate locations of all cells whose tiles `match`, in row order; the default tile is assumed to match,
+            so unwritten cells are not tested.
+        """
+        n, w = self.chunk, self.width
+        for y in range(self.height):
+            cy, row = divmod(y, n)
+            for cx in range((w - 1)//n + 1):
+                chunk, x0 = self.chunks.get((cx, cy)), cx*n
+                width     = min(n, w - x0)
+                if chunk is None:
+                    for x in range(x0, x0 + width):
+                        yield Loc(x, y)
+                else:
+                    for x, tile in enumerate(chunk[row*n : row*n + width], x0):
+                        if match(tile):
+                            yield Loc(x, y)
+
+    def count(self, attr, value=True):
+        """Number of tiles where `attr` is `value`; only written chunks are scanned."""
+        match   = lambda tile: bool(getattr(tile, attr)) == bool(value)
+        written = sum(1 for l in self.written_locations() if match(self[l]) != match(self.default))
+        return self.width*self.height - written if match(self.default) else written
+
+    def random_location(self, attr, value=True):
+        """ Random location where `attr` of the tile is `value`: a few random cells are tried first, then one of
+            the matching locations is picked in a single pass over them, without listing them.
+        """
+        test = bool if value else (lambda v: not v)
+        for _ in range(random_tries):
+            loc = Loc(randrange(self.width), randrange(self.height))
+            if test(getattr(self[loc], attr)):
+                return loc
+
+        choice = None
+        for n, loc in enumerate(self._locations((attr,), test), 1):
+            if not randrange(n):
+                choice = loc
+        if choice is None:
+            raise IndexError("No location where %s is %s" % (attr, bool(value)))
+        return choice
+
+    def tiles(self, *attrs):
+        return [self[l] for l in self.written_matches(attrs, bool)]
+
+    def tiles_not(self, *attrs):
+        return [self[l] for l in self.written_matches(attrs, lambda v: not v)]
+
+    def locations(self, *attrs):
+        return self.written_matches(attrs, bool)
+
+    def locations_not(self, *attrs):
+        return self.written_matches(attrs, lambda v: not v)
+
+
+class ArrayBoard(BaseBoard):
+    """ Compact board that stores tile kinds as small integer codes in a flat array indexed by
+        `y*width + x`; kinds are registered on first use, code 0 is the default tile.
+
+        Note that tiles are shared by all cells of the same kind (`kind_key()`), so they should
+        not be modified in place -- assign a different tile to the location instead; for the same
+        reason, locations need to be passed as `Loc` rather than as tiles.
+    """
+    def __init__(self, size, def_tile, **kwargs):
+        super(ArrayBoard, self).__init__(size, **kwargs)
+
+        try              : self._def_tile_str = isinstance(def_tile, basestring)
+        except NameError : self._def_tile_str = isinstance(def_tile, str)
+
+        self.def_tile = def_tile
+        self.kinds    = []      # code => tile
+        self.codes    = {}      # kind key => code
+        self.cells    = array('B', bytes(self.width * self.height))
+        self.code(self.make_tile(None))
+        self.board_initialized = True
+        self.watchers_reset()
+
+    def __iter__(self):
+        kinds = self.kinds
+        return ( kinds[c] for c in self.cells )
+
+    def __getitem__(self, loc):
+        return self.kinds[ self.cells[loc.y*self.width + loc.x] ]
+
+    def __setitem__(self, tile_loc, item):
+        loc = self.ploc(tile_loc)
+        i   = loc.y*self.width + loc.x
+        old, self.cells[i] = self.cells[i], self.code(item)
+        if self.tracking:
+            self.record(SET, loc, self.kinds[old])
+            self.changed(loc, self.kinds[old], item)
+
+    def __delitem__(self, tile_loc):
+        self[tile_loc] = self.kinds[0]
+
+    @property
+    def board(self):
+        """List of rows of tiles, same layout as `Board.board`."""
+        w, kinds = self.width, self.kinds
+        return [ [kinds[c] for c in self.cells[y*w:(y+1)*w]] for y in range(self.height) ]
+
+    def clone(self):
+        """Return a copy of the board; the cells array is copied, tiles are shared as usual for this board."""
+        new       = super(ArrayBoard, self).clone()
+        new.cells = array(self.cells.typecode, self.cells)
+        new.kinds = list(self.kinds)
+        new.codes = dict(self.codes)
+        return new
+
+    def kind_key(self, item):
+        """Key that identifies the kind of `item`: strings stand for themselves, tiles are keyed by class and repr."""
+        try              : is_str = isinstance(item, basestring)
+        except NameError : is_str = isinstance(item, str)
+        return item if is_str else (item.__class__, repr(item))
+
+    def code(self, item):
+        """Return the code of `item`'s kind, registering it if it's a new kind."""
+        key  = self.kind_key(item)
+        code = self.codes.get(key)
+
+        if code is None:
+            code = self.codes[key] = len(self.kinds)
+            self.kinds.append(item)
+            if code > 255 and self.cells.typecode == 'B':
+                self.cells = array('H', self.cells)
+        return code
+
+    def empty(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        return self.cells[loc.y*self.width + loc.x] == 0
+
+    def init_board(self):
+        if not self.board_initialized:
+            self.board_initialized = True
+            self.cells = array(self.cells.typecode, [0]) * (self.width * self.height)
+            self.watchers_reset()
+
+    def fill(self, chars, codec):
+        """Tiles are shared by kind, so a tile is only made for the first cell of each character."""
+        codes = {}
+        for c in dict.fromkeys(chars):
+            codes[c] = self.code(codec.make(c, None))
+        self.cells = array(self.cells.typecode, [codes[c] for c in chars])
+
+    def move(self, tile_loc, newloc):
+        loc = self.ploc(tile_loc)
+        self[newloc] = self[loc]
+        del self[loc]
+
+    def _kind_locations(self, attrs, test):
+        """Locations of cells whose kind passes `test` for all `attrs`; each kind is checked only once."""
+        match = [ all(test(getattr(k, attr)) for attr in attrs) for k in self.kinds ]
+        locs  = self.geom.locs
+        return [ locs[i] for i, c in enumerate(self.cells) if match[c] ]
+
+    def tiles(self, *attrs):
+        return [self[l] for l in self._kind_locations(attrs, bool)]
+
+    def tiles_not(self, *attrs):
+        return [self[l] for l in self._kind_locations(attrs, lambda v: not v)]
+
+    def locations(self, *attrs):
+        return self._kind_locations(attrs, bool)
+
+    def locations_not(self, *attrs):
+        return self._kind_locations(attrs, lambda v: not v)
@@ -2,8 +2,10 @@ import sys
 from board import Dir
 
 class BaseCommands:
-    def __init__(self, board, commands):
-        self.commands = commands
+    commands = None
+
+    def __init__(self, board, commands=None):
+        self.commands = commands or self.commands
         self.board = board
 
     def __getitem__(self, cmd):
@@ -78,15 +78,17 @@ def game1():
     """Play game."""
     board[loc] = player     # place player at original location
 
-    while True:             # loop continuously
-        display()           # show playing board
-        c = term.getch()    # get user input
-
-        if c == 'q':       # Quit game
-            break
-
-        if c == 'a': left()    # if key is 'a', move left
-        if c == 'd': right()
-        if c == 't': teleport()
+    with term.raw():            # keep terminal in raw mode while playing
+        while True:             # loop continuously
+            display()           # show playing board
+
+            # wait for user input, then also handle all keys pressed in the meantime (e.g. when holding a key)
+            for c in [term.getch()] + term.poll_keys():
+                if c == 'q':       # Quit game
+                    return
+
+                if c == 'a': left()    # if key is 'a', move left
+                if c == 'd': right()
+                if c == 't': teleport()
 
 game1()
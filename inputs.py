@@ -0,0 +1,132 @@
+# -*- encoding: utf-8 -*-
+""" Pluggable input sources for `avkutil.Term` and `utils.TextInput`.
+
+    By default both read from the terminal. A source replaces the terminal with a stream of entries, where an
+    entry is a keystroke (as returned by `Term.getch()`, e.g. 'a' or r'\\x1b[D') or a line of text input:
+
+        KeySource(keys)     - entries from an iterator or list, optionally as (delay, entry) pairs
+        FileSource(path)    - entries from a recording file or a pipe ('-' is stdin)
+
+    A `Recorder` writes entries read from any source, including the terminal, to a recording file. Term and
+    TextInput use the module-level `source` and `recorder` unless given their own, see `input_from()`.
+
+    Recording file format, one entry per line:
+
+        #! game versi       - header lines at the start of the file, available as `FileSource.meta`
+        #! seed 1234
+        0.512<TAB>d         - delay in seconds since the previous entry, then the entry
+        s                   - entry without recorded timing
+"""
+
+import sys
+import time
+import random
+from contextlib import contextmanager
+
+source   = None     # used by Term and TextInput when they don't have their own source
+recorder = None
+header   = "#! "
+
+
+class KeySource(object):
+    """ Entries from `keys`, which may be an iterator; with `timed`, `keys` are (delay, entry) pairs and
+        `realtime` replays the delays, otherwise entries are returned at full speed.
+    """
+    def __init__(self, keys, timed=False, realtime=False):
+        self.keys     = iter(keys)
+        self.timed    = timed
+        self.realtime = realtime
+        self.meta     = {}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        entry = next(self.keys)
+        if not self.timed:
+            return entry
+        delay, entry = entry
+        if self.realtime and delay:
+            time.sleep(delay)
+        return entry
+
+    def read(self, prompt=None):
+        """Next entry; raise EOFError when the source is exhausted, like `input()` does at the end of a pipe."""
+        try                  : return next(self)
+        except StopIteration : raise EOFError
+
+
+class FileSource(KeySource):
+    """Entries from a recording file (a path, '-' for stdin or an open file, e.g. a pipe) read as they're needed."""
+    def __init__(self, f, realtime=False):
+        if f == '-'               : f = sys.stdin
+        elif isinstance(f, str)   : f = open(f)
+        super(FileSource, self).__init__(self.entries(), timed=True, realtime=realtime)
+        self.file = f
+        self.line = f.readline()
+
+        while self.line.startswith(header):
+            name, _, value = self.line[len(header):].rstrip('\n').partition(' ')
+            self.meta[name] = value
+            self.line       = f.readline()
+
+    def entries(self):
+        line = self.line
+        while line:
+            yield parse_line(line.rstrip('\n'))
+            line = self.file.readline()
+
+    def close(self):
+        if self.file is not sys.stdin:
+            self.file.close()
+
+
+def parse_line(line):
+    """Return (delay, entry) from a line of a recording file; delay is 0 if the line has no timing."""
+    delay, tab, entry = line.partition('\t')
+    if tab:
+        try               : return float(delay), entry
+        except ValueError : pass
+    return 0, line
+
+
+class Recorder(object):
+    """Write entries to a recording file (a path or an open file), with the delay since the previous entry."""
+    def __init__(self, f, **meta):
+        self.file = open(f, 'w') if isinstance(f, str) else f
+        self.last = time.time()
+        for name, value in sorted(meta.items()):
+            self.file.write("%s%s %s\n" % (header, name, value))
+
+    def write(self, entry):
+        now, last = time.time(), self.last
+        self.last = now
+        self.file.write("%.3f\t%s\n" % (now - last, entry))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+@contextmanager
+def input_from(src, rec=None):
+    """Use `src` (and `rec`) as the default input source (and recorder) within the block."""
+    global source, recorder
+    old, source, recorder = (source, recorder), src, rec
+    try     : yield src
+    finally : source, recorder = old
+
+def record_session(game, argv=None):
+    """ Start recording if `--record FILE` is on the command line (`argv`, by default `sys.argv`): pick a
+        random seed, seed `random` with it and record to FILE with `game` and the seed in the header.
+        Return the seed, or None if not recording.
+    """
+    global recorder
+    argv = sys.argv[1:] if argv is None else argv
+    if "--record" not in argv[:-1]:
+        return None
+
+    seed     = random.randrange(2**31)
+    recorder = Recorder(argv[argv.index("--record") + 1], game=game, seed=seed)
+    random.seed(seed)
+    return seed
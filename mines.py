@@ -4,15 +4,19 @@
 # TODO: calc # of mines based on board size?
 #   generate map after first click?
 import sys
+import random
 from random import randint
-from time import sleep
 
+from utils import pause, headless, is_headless, headless_mode, GameOver
 from board import Dir
-from mines_lib import MinesBoard, Mines, Tile
+from mines_lib import MinesBoard, Mines, Tile, codec
+from records import Record
 from avkutil import Term
+from inputs import input_from, record_session
+from render import DiffRenderer
 
 size        = 12
-num_mines   = randint(8, 16)
+num_mines   = None            # random 8-16 per game
 padding     = 2, 1
 blink_speed = 0.1
 
@@ -70,7 +74,7 @@ class Commands:
 
     def blink_tile(self, tile):
         tile.hidden = not tile.hidden
-        sleep(blink_speed)
+        pause(blink_speed)
         board.draw()
 
     def mark(self):
@@ -102,21 +106,77 @@ class BasicInterface:
 
     def get_move(self):
         """Get user command and return the tile to reveal."""
+        with self.term.raw():
+            while True:
+                cmd = self.term.getch()
+                try:
+                    val = commands[cmd]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("unknown command:", cmd)
+
+
+class AIInterface:
+    def run(self):
+        """Very primitive 'AI', always reveals a random hidden tile."""
         while True:
-            cmd = self.term.getch()
-            try:
-                val = commands[cmd]()
-                if val:
-                    return val
-            except KeyError:
-                print("unknown command:", cmd)
+            tile = board[board.random_hidden()]
+            moves.append(tile.loc)
+            board.reveal(tile)
+            mines.check_end(tile)
+
+
+def setup():
+    """Create the board and the game in module globals."""
+    global board, mines, moves
+    nmines = num_mines or randint(8, 16)
+    board  = MinesBoard(size, Tile, num_mines=nmines, num_grid=False, padding=padding, renderer=DiffRenderer())
+    mines  = Mines(board)
+    moves  = []
+
+def play(seed=None):
+    """Play a game with random reveals in headless mode; return True if all mines were cleared."""
+    random.seed(seed)
+    with headless_mode():
+        setup()
+        try:
+            AIInterface().run()
+        except GameOver as e:
+            return e.result
+
+def replay(source, seed=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return the result as in
+        `play()`, or None if the recording ends before the game does.
+    """
+    global commands
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup()
+        commands = Commands()
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
+
+def record(seed=None):
+    """Play a game as in `play()` and return it as a `records.Record`, with the mines layout as the snapshot."""
+    result = play(seed)
+    return Record("mines", board.width, board.height, moves, int(result), seed, board.dump(codec, bytes))
 
 
 if __name__ == "__main__":
-    board = MinesBoard(size, Tile, num_mines=num_mines, num_grid=False, padding=padding)
-    mines = Mines(board)
+    if headless:
+        print(play())
+        sys.exit()
+
+    record_session("mines")
+    setup()
     commands = Commands()
     try:
         BasicInterface().run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         pass
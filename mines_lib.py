@@ -1,11 +1,10 @@
 # -*- encoding: utf-8 -*-
 
-import sys
-from random import choice as rndchoice
-from time import time, sleep
+from random import sample
+from time import time
 
-from utils import AttrToggles, timefmt
-from board import Board, BaseTile, Loc
+from utils import AttrToggles, timefmt, pause, is_headless, GameOver
+from board import Board, BaseTile, TrackedTile, Loc, Codec
 
 blank      = ' '
 hiddenchar = '.'
@@ -14,10 +13,11 @@ flag       = '⚑'
 numbers    = "①②③④⑤⑥⑦⑧"
 
 
-class Tile(BaseTile, AttrToggles):
+class Tile(BaseTile, TrackedTile, AttrToggles):
     revealed = mine = marked = False
     hidden   = True
     number   = None
+    tracked  = ("mine", "hidden", "revealed", "marked")
 
     attribute_toggles = [("hidden", "revealed")]
 
@@ -38,17 +38,27 @@ class Tile(BaseTile, AttrToggles):
         self.hidden = not self.hidden
 
 
+class Mine(Tile):
+    pass
+
+# mines layout, e.g. for saving and loading boards
+codec = Codec({'.': Tile, '*': Mine})
+
+
 class MinesBoard(Board):
     def __init__(self, *args, **kwargs):
         num_mines = kwargs.pop("num_mines")
+        kwargs.setdefault("index", ("mine", "hidden"))
 
         super(MinesBoard, self).__init__(*args, **kwargs)
         self.divider = '-' * (self.width * 4 + 4)
         self.current = Loc(0,0)
         self.hl_visible = False
 
-        for _ in range(num_mines):
-            self.random_empty().mine = True
+        layout = ['.'] * (self.width * self.height)
+        for i in sample(range(len(layout)), num_mines):
+            layout[i] = '*'
+        self.load(layout, codec)
 
         for tile in self:
             tile.number = sum( nbtile.mine for nbtile in self.neighbours(tile) )
@@ -60,10 +70,10 @@ class MinesBoard(Board):
         return bool(tile.revealed or tile.mine and tile.marked)
 
     def random_hidden(self):
-        return rndchoice(self.locations("hidden"))
+        return self.random_location("hidden")
 
     def random_empty(self):
-        return rndchoice(self.tiles_not("mine"))
+        return self.random_tile("mine", False)
 
     def reveal(self, tile):
         """ Reveal all empty (number=0) tiles adjacent to starting tile `loc` and subsequent unhidden tiles.
@@ -99,12 +109,14 @@ class Mines(object):
         for tile in B:
             B.reveal(tile)
         B.draw()
-        print(self.lose_msg)
-        sleep(1)
-        sys.exit()
+        if not is_headless(B.headless):
+            print(self.lose_msg)
+        pause(1)
+        raise GameOver(False)
 
     def game_won(self):
         self.board.draw()
-        print( self.win_msg % timefmt(time() - self.start) )
-        sleep(1)
-        sys.exit()
+        if not is_headless(self.board.headless):
+            print( self.win_msg % timefmt(time() - self.start) )
+        pause(1)
+        raise GameOver(True)
@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+""" Compact binary game records, and archive files of records that are read through a memory map.
+
+    Record layout (little-endian):
+
+        header   - fixed size, see `header` below
+        moves    - varint stream, a location is stored as its flat index `y*width + x`
+        snapshot - optional bytes of the final board, e.g. from `board.dump(codec, bytes)`
+
+    An archive file is `file_magic` followed by records.
+"""
+
+import os
+import mmap
+import struct
+
+from board import Loc
+
+games      = ("versi", "mines", "sudoku", "battleship", "bblocks", "tictactoe", "simplerace", "robots")
+file_magic = b"SGRA\x01"    # archive magic and format version
+
+# magic, game, flags, width, height, result, seed, number of moves, moves size, snapshot size
+header     = struct.Struct("<2sBBHHbqIII")
+rec_magic  = b"GR"
+HAS_SEED   = 1
+
+
+def encode_varints(values, width):
+    """Encode locations (as flat indexes on a board of `width`) and non-negative ints as varints."""
+    out = bytearray()
+    for n in values:
+        if isinstance(n, Loc):
+            n = n.y*width + n.x
+        while n > 0x7f:
+            out.append(n & 0x7f | 0x80)
+            n >>= 7
+        out.append(n)
+    return out
+
+def decode_varints(buf):
+    """Generate ints from the varint stream in `buf`, which can be a memoryview."""
+    n = shift = 0
+    for b in buf:
+        n |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            yield n
+            n = shift = 0
+
+
+class Record(object):
+    """ Finished game: `moves` are locations or non-negative ints, `result` is a small int, e.g. number of the
+        winning player or 0 for a tie, and `snapshot` is optional bytes of the final board.
+    """
+    def __init__(self, game, width, height, moves=(), result=0, seed=None, snapshot=b''):
+        self.game     = game
+        self.width    = width
+        self.height   = height
+        self.moves    = list(moves)
+        self.result   = result
+        self.seed     = seed
+        self.snapshot = snapshot
+
+    def __repr__(self):
+        return "<Record %s %dx%d: %d moves, result %d>" % (self.game, self.width, self.height, len(self.moves), self.result)
+
+    def encode(self):
+        moves = encode_varints(self.moves, self.width)
+        flags = HAS_SEED if self.seed is not None else 0
+        head  = header.pack(rec_magic, games.index(self.game), flags, self.width, self.height, self.result,
+                            self.seed or 0, len(self.moves), len(moves), len(self.snapshot))
+        return head + bytes(moves) + bytes(self.snapshot)
+
+    def locs(self):
+        """Moves as locations."""
+        w = self.width
+        return [ m if isinstance(m, Loc) else Loc(m % w, m // w) for m in self.moves ]
+
+    def load_snapshot(self, board, codec):
+        """Load the final position into `board` with `codec`; see `board.BaseBoard.load()`."""
+        return board.load(bytes(self.snapshot), codec)
+
+
+class RecordView(Record):
+    """ Record in a buffer such as an archive's memory map; header fields are unpacked on creation, moves are
+        decoded as they're iterated over and the snapshot is a memoryview, so nothing else is copied.
+    """
+    def __init__(self, buf, offset=0):
+        magic, game, flags, w, h, result, seed, nmoves, msize, ssize = header.unpack_from(buf, offset)
+        if magic != rec_magic:
+            raise ValueError("Not a game record at offset %d" % offset)
+
+        self.buf       = buf
+        self.game      = games[game]
+        self.width     = w
+        self.height    = h
+        self.result    = result
+        self.seed      = seed if flags & HAS_SEED else None
+        self.num_moves = nmoves
+        self.offset    = offset
+        self.start     = offset + header.size
+        self.snap      = self.start + msize
+        self.end       = self.snap + ssize
+        self.size      = self.end - offset
+
+    def __repr__(self):
+        return "<RecordView %s %dx%d: %d moves, result %d>" % (self.game, self.width, self.height, self.num_moves, self.result)
+
+    def iter_moves(self):
+        return decode_varints(self.buf[self.start:self.snap])
+
+    @property
+    def moves(self):
+        return list(self.iter_moves())
+
+    @property
+    def snapshot(self):
+        return self.buf[self.snap:self.end]
+
+    def encode(self):
+        return bytes(self.buf[self.offset:self.end])
+
+    def record(self):
+        """Copy of the record that doesn't refer to the buffer."""
+        return Record(self.game, self.width, self.height, self.moves, self.result, self.seed, bytes(self.snapshot))
+
+
+class Archive(object):
+    """ Archive file of records opened for reading; iterating over it yields a `RecordView` of each record in
+        the memory-mapped file. Snapshots and move iterators still in use when the archive is closed keep
+        working; the map is then unmapped once the last of them is gone.
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map  = None
+        self.buf  = memoryview(b'')
+
+        if os.fstat(self.file.fileno()).st_size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buf = memoryview(self.map)
+        if self.buf[:len(file_magic)] != file_magic:
+            self.close()
+            raise ValueError("Not a game record archive: %s" % path)
+
+    def __iter__(self):
+        buf, offset = self.buf, len(file_magic)
+        while offset < len(buf):
+            view = RecordView(buf, offset)
+            offset += view.size
+            yield view
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.buf.release()
+        if self.map is not None:
+            try                : self.map.close()
+            except BufferError : pass               # slices of the map are still alive; leave it to them
+            self.map = None
+        self.file.close()
+
+
+class ArchiveWriter(object):
+    """Write records to an archive file; with `append`, records are added to an existing archive."""
+    def __init__(self, path, append=False):
+        exists    = append and os.path.exists(path) and os.path.getsize(path)
+        self.file = open(path, "ab" if exists else "wb")
+        if exists:
+            with open(path, "rb") as f:
+                if f.read(len(file_magic)) != file_magic:
+                    self.file.close()
+                    raise ValueError("Not a game record archive: %s" % path)
+        else:
+            self.file.write(file_magic)
+
+    def write(self, record):
+        self.file.write(record.encode())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8 -*-
+
+from time import sleep, time
+
+from utils import ujoin, range1, space
+from board import Loc
+from avkutil import Screen, screen
+
+
+class DiffRenderer(object):
+    """ Terminal renderer for `BaseBoard.draw()` that keeps the previously drawn frame and only
+        rewrites changed cells using ANSI cursor addressing; each frame is sent with a single write.
+
+        origin  - terminal row (1-based) of the top of the board, to allow several boards on screen.
+        max_fps - if set, frames are paced to this rate instead of sleeping for the board's pause time.
+        out     - output stream, by default the shared `avkutil.screen`.
+
+        Call `reset()` to force a full redraw, e.g. after other output has scrolled the screen.
+    """
+    goto       = Screen.goto
+    erase_line = Screen.erase_line
+    clear      = "\x1b[2J"
+
+    def __init__(self, origin=1, max_fps=None, out=None):
+        self.origin    = origin
+        self.max_fps   = max_fps
+        self.out       = out or screen
+        self.frame     = None
+        self.last_time = 0
+
+    def reset(self):
+        self.frame = None
+
+    def draw(self, board, pause):
+        self.out.write(self.render(board))
+        self.out.flush()
+        board.status()
+        self.out.flush()
+        self.wait(pause)
+
+    def wait(self, pause):
+        if self.max_fps:
+            delay = self.last_time + 1.0/self.max_fps - time()
+            if delay > 0:
+                sleep(delay)
+        elif pause:
+            sleep(pause)
+        self.last_time = time()
+
+    def cells(self, board):
+        """Formatted cells of `board` as a list of rows."""
+        board.init_board()
+        tpl  = board.tiletpl
+        rows = board.board
+        if board.stackable:
+            rows = ( [stack[-1] for stack in row] for row in rows )
+        return [ [tpl % str(tile) for tile in row] for row in rows ]
+
+    def prefix(self, board, n):
+        return space*2 + (board.tiletpl % n + space if board.num_grid else '')
+
+    def render(self, board):
+        """Return the output needed to update the screen from the previous frame to `board`."""
+        frame, old = self.cells(board), self.frame
+        step       = 1 + board.ypad
+        top        = self.origin + (step if board.num_grid else 0)
+        out        = []
+
+        if old is None or len(old) != len(frame):
+            if self.origin == 1:
+                out.append(self.clear)
+            if board.num_grid:
+                header = space*(board.xpad + 4) + ujoin(range1(board.width), space, board.tiletpl)
+                out.append(self.goto % (self.origin, 1) + header + self.erase_line)
+            old = [None] * len(frame)
+
+        for n, (row, oldrow) in enumerate(zip(frame, old)):
+            line   = top + n*step
+            prefix = self.prefix(board, n+1)
+
+            if oldrow is None or [len(c) for c in row] != [len(c) for c in oldrow]:
+                out.append(self.goto % (line, 1) + prefix + space.join(row) + self.erase_line)
+                for extra in range(1, step):
+                    out.append(self.goto % (line + extra, 1) + self.erase_line)
+                continue
+
+            col = len(prefix) + 1
+            for cell, oldcell in zip(row, oldrow):
+                if cell != oldcell:
+                    out.append(self.goto % (line, col) + cell)
+                col += len(cell) + 1
+
+        self.frame = frame
+        out.append(self.goto % (top + len(frame)*step, 1) + self.erase_line)
+        return ''.join(out)
+
+
+class Window(object):
+    """ View of a `width` x `height` part of `board` starting at `x`, `y`, that can be drawn by renderers in
+        place of the board; other attributes are looked up on the board.
+    """
+    stackable = False
+
+    def __init__(self, board, x, y, width, height):
+        self.view          = board
+        self.x, self.y     = x, y
+        self.width         = width
+        self.height        = height
+
+    def __getattr__(self, attr):
+        return getattr(self.view, attr)
+
+    def init_board(self):
+        self.view.init_board()
+
+    @property
+    def board(self):
+        B, xrng = self.view, range(self.x, self.x + self.width)
+        return [ [B[Loc(x, y)] for x in xrng] for y in range(self.y, self.y + self.height) ]
+
+
+class Viewport(object):
+    """ Renderer that only draws a `width` x `height` window of the board, scrolled as needed to keep
+        `board.current` at least `margin` cells away from the window edges (except at the edges of the
+        board); drawing of the window is delegated to `renderer`, a `DiffRenderer` by default.
+
+        Use it for boards that are larger than the screen, such as `board.ChunkedBoard`; only the cells in
+        the window are accessed.
+    """
+    def __init__(self, width=40, height=20, margin=2, renderer=None):
+        self.width    = width
+        self.height   = height
+        self.margin   = margin
+        self.renderer = renderer or DiffRenderer()
+        self.x        = self.y = 0      # top left corner of the window
+
+    def reset(self):
+        self.renderer.reset()
+
+    def scroll(self, board):
+        """Move the window to keep `board.current` in view; return the window."""
+        width, height = min(self.width, board.width), min(self.height, board.height)
+        cur           = board.current
+        self.x        = self.scroll_axis(self.x, cur.x, width, board.width)
+        self.y        = self.scroll_axis(self.y, cur.y, height, board.height)
+        return Window(board, self.x, self.y, width, height)
+
+    def scroll_axis(self, start, pos, size, total):
+        margin = min(self.margin, (size - 1)//2)
+        start  = min(start, pos - margin)
+        start  = max(start, pos + margin - size + 1)
+        return max(0, min(start, total - size))
+
+    def draw(self, board, pause):
+        self.renderer.draw(self.scroll(board), pause)
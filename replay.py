@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+""" Replay sessions recorded with `--record FILE` at full speed, without a terminal.
+
+    python replay.py [--realtime] [--game NAME] [--seed N] FILE ...
+
+    FILE can be '-' to read a recording from a pipe. Game and seed are taken from the recording's header
+    unless given on the command line; with `--realtime`, recorded delays between keys are kept.
+"""
+
+import sys
+from importlib import import_module
+
+from utils import option
+from inputs import FileSource
+
+games = ("versi", "mines", "sudoku", "battleship", "bblocks", "words", "robots")
+
+
+def replay(f, game=None, seed=None, realtime=False):
+    """Replay the recording `f` (a path, '-' or an open file) and return the game's result."""
+    source = FileSource(f, realtime)
+    game   = game or source.meta.get("game")
+    seed   = seed if seed is not None else source.meta.get("seed")
+
+    try:
+        if game not in games:
+            raise ValueError("Unknown game %r in %s" % (game, f))
+        return import_module(game).replay(source, None if seed is None else int(seed))
+    finally:
+        source.close()
+
+
+if __name__ == "__main__":
+    args     = sys.argv[1:]
+    realtime = "--realtime" in args
+    args     = [a for a in args if a != "--realtime"]
+    game     = option(args, "--game")
+    seed     = option(args, "--seed")
+
+    if not args:
+        sys.exit(__doc__)
+    for f in args:
+        print("%s: %s" % (f, replay(f, game, seed, realtime)))
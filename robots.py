@@ -3,11 +3,15 @@
 
 # Imports {{{
 import sys
+import random
+from copy import copy
 from random import choice as rndchoice
 from random import randint
 
 from utils import Loop, TextInput, sjoin, nl
-from board import Board, BaseTile
+from utils import headless, is_headless, headless_mode, GameOver
+from board import Board, BaseTile, Dir, dirs8
+from inputs import input_from, record_session
 
 
 size          = 15, 10
@@ -78,6 +82,12 @@ class Mobile(Tile):
         self.direction = direction or Loop(board.dirlist2, name="dir")
         self.program   = []
 
+    def clone(self):
+        new           = super(Mobile, self).clone()
+        new.direction = copy(self.direction)
+        new.program   = list(self.program)
+        return new
+
     def go(self):
         self.program = self.program or self.create_program()
         cmd = getattr(self, self.program.pop(0))
@@ -116,10 +126,32 @@ class Mobile(Tile):
     def create_program(self):
         return [rndchoice(fullcmds)] * randint(1, 6)
 
+    def path_program(self, targets, attack=False):
+        """ Program to turn towards the next step on the shortest path to `targets` and move there; if `attack`
+            is set, fire instead of moving into the target. Returns None if no target can be reached.
+        """
+        field = board.distance_field(targets, passable, dirs8)
+        loc   = field.next_step(self)
+        if not loc:
+            return None
+
+        dirs  = board.dirlist2
+        turns = (dirs.index(Dir(loc.x - self.loc.x, loc.y - self.loc.y)) - dirs.index(self.direction.dir)) % len(dirs)
+        turns = ["turn_cw"] * turns if turns <= len(dirs)//2 else ["turn_ccw"] * (len(dirs) - turns)
+        return turns + ["fire" if attack and field.target_at(loc) else "move"]
+
+
+def passable(tile):
+    return tile.blank
+
 
 class Robot(Mobile):
     # def __repr__(self): return str(self.health)
 
+    def create_program(self):
+        """Chase the nearest player and fire when next to it."""
+        return self.path_program("player", attack=True) or super(Robot, self).create_program()
+
     def destroy(self):
         del board[self]
         robots.remove(self)
@@ -141,6 +173,10 @@ class Player(Mobile):
     def status(self):
         return self.status_msg % (self.health, board.dirnames[self.direction.dir])
 
+    def create_program(self):
+        """Auto-solver: follow the shortest path to the goal."""
+        return self.path_program("goal") or super(Player, self).create_program()
+
     def destroy(self):
         del board[self]
         players.remove(self)
@@ -173,8 +209,12 @@ class Missile(Mobile):
 class RBoard(Board):
     stat_sep = " | "
 
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("index", ("blank",))
+        super(RBoard, self).__init__(*args, **kwargs)
+
     def random_blank(self):
-        return rndchoice(self.locations("blank"))
+        return self.random_location("blank")
 
     def status(self):
         print( nl, self.stat_sep.join(p.status() for p in players) )
@@ -186,8 +226,9 @@ class RobotsGame(object):
 
     def game_end(self, win):
         board.draw()
-        print( nl, self.winmsg if win else (self.losemsg % max_turns) )
-        sys.exit()
+        if not is_headless(board.headless):
+            print( nl, self.winmsg if win else (self.losemsg % max_turns) )
+        raise GameOver(win)
 
     def expand_program(self, cmds):
         L = []
@@ -204,18 +245,31 @@ class RobotsGame(object):
 
 
 class BasicInterface(object):
+    ai = False
+
+    def __init__(self, script=None):
+        """`script` is a file with player programs, one per line, used instead of asking for them."""
+        self.script   = script
+        self.programs = None
+
     def run(self):
         cmdpat  = "%d?"
         cmdpat  = cmdpat + " (%s)" % sjoin(commands.keys(), '|')
         pattern = cmdpat + (" %s?" % cmdpat) * (max_cmds - 1)
 
-        self.textinput = TextInput(pattern, board, accept_blank=True, singlechar_cmds=True)
+        if not self.ai:
+            self.textinput = TextInput(pattern, board, accept_blank=True, singlechar_cmds=True)
+        if self.script:
+            self.programs = iter(self.textinput.parse_file(self.script))
 
         while True:
+            if not players:
+                rgame.game_end(False)
             board.draw()
-            print(", ".join("%s: %s" % (k,v) for k,v in commands.items()))
+            if not is_headless(board.headless):
+                print(", ".join("%s: %s" % (k,v) for k,v in commands.items()))
             for unit in players + robots:
-                if unit.player:
+                if unit.player and not self.ai:
                     cprog = self.create_program
                 else:
                     cprog = unit.create_program
@@ -223,15 +277,26 @@ class BasicInterface(object):
                 unit.go()
 
     def create_program(self):
+        if self.programs:
+            return rgame.expand_program( next(self.programs, None) or ['r'] )
+
         while True:
             try:
                 program = self.textinput.getinput() or ['r']
                 return rgame.expand_program(program)
             except (KeyError, IndexError):
-                print(self.textinput.invalid_inp)
+                if not is_headless():
+                    print(self.textinput.invalid_inp)
 
 
-if __name__ == "__main__":
+class AIInterface(BasicInterface):
+    """Players follow the shortest path to the goal."""
+    ai = True
+
+
+def setup():
+    """Create the board, units and the game in module globals."""
+    global board, rgame, players, robots, rocks
     board = RBoard(size, Blank, pause_time=pause_time)
 
     rgame   = RobotsGame()
@@ -242,5 +307,41 @@ if __name__ == "__main__":
 
     Goal(randloc())
 
-    try                      : BasicInterface().run()
-    except KeyboardInterrupt : sys.exit()
+def play(seed=None):
+    """Play a game with auto-solving players in headless mode; return True if the goal was reached."""
+    random.seed(seed)
+    with headless_mode():
+        setup()
+        try:
+            AIInterface().run()
+        except GameOver as e:
+            return e.result
+
+def replay(source, seed=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return the result as in
+        `play()`, or None if the recording ends before the game does.
+    """
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup()
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
+
+
+if __name__ == "__main__":
+    if headless:
+        print(play())
+        sys.exit()
+
+    script = None
+    if "--script" in sys.argv[1:-1]:
+        script = sys.argv[sys.argv.index("--script") + 1]
+
+    record_session("robots")
+    setup()
+    try                                 : BasicInterface(script).run()
+    except (KeyboardInterrupt, GameOver): sys.exit()
@@ -2,13 +2,14 @@
 # -*- encoding: utf-8 -*-
 
 import sys
+import random
 from random import choice as rndchoice
 from random import shuffle
-from time import sleep
 from itertools import cycle
 
 from utils import Dice, sjoin, lastind, first, enumerate1, getitem, nl, space, grouper
-from avkutil import Term
+from utils import pause, headless, is_headless, headless_mode, GameOver
+from avkutil import Term, screen
 
 length       = 35
 num_pieces   = 3
@@ -45,8 +46,11 @@ class Piece(object):
 
 class SimpleRace(object):
     def draw(self):
-        print(nl*5 + sjoin(track))
-        sleep(pause_time)
+        if not is_headless():
+            screen.clear()
+            screen.write(sjoin(track) + nl)
+            screen.flush()
+            pause(pause_time)
 
     def valid(self, piece, loc):
         """Valid move: any move that does not land on your other piece (beyond track is ok)."""
@@ -76,9 +80,9 @@ class SimpleRace(object):
 class Player(object):
     winmsg = "\n %s wins the race!"
 
-    def __init__(self, char):
+    def __init__(self, char, ai=None):
         self.char   = char
-        self.ai     = char in ai_players
+        self.ai     = char in ai_players if ai is None else ai
         self.pieces = [Piece(char) for _ in range(num_pieces)]
 
     def __repr__(self):
@@ -90,8 +94,9 @@ class Player(object):
     def check_end(self):
         if all(piece.done for piece in self):
             race.draw()
-            print(self.winmsg % self)
-            sys.exit()
+            if not is_headless():
+                print(self.winmsg % self)
+            raise GameOver(self.char)
 
 
 class BasicInterface(object):
@@ -104,9 +109,9 @@ class BasicInterface(object):
         def offer_choice():
             return not player.ai and len(valid_moves) > 1
 
-        self.term = Term()
-        pchar          = first(p for p in player_chars if p not in ai_players)
+        pchar          = first(p.char for p in players if not p.ai)
         if pchar:
+            self.term = Term()
             print("You are playing:", pchar)
 
         for player in cycle(players):
@@ -115,7 +120,8 @@ class BasicInterface(object):
             valid_moves = race.valid_moves(player, movedist)
             getmove     = self.get_move if offer_choice() else rndchoice
 
-            race.move(*getmove(valid_moves))
+            if valid_moves:
+                race.move(*getmove(valid_moves))
             player.check_end()
 
     def get_move(self, valid_moves):
@@ -132,17 +138,38 @@ class BasicInterface(object):
             try:
                 return valid_moves[int(val)-1]
             except (ValueError, IndexError):
-                print("Invalid move")
+                if not is_headless():
+                    print("Invalid move")
 
 
-if __name__ == "__main__":
+def setup(ai=None):
+    """Create the track, players and the game in module globals; `ai` overrides `ai_players` for this game."""
+    global track, players, race, dice
+    ai      = ai_players if ai is None else ai
     track   = [blank] * length
-    players = [Player(c) for c in player_chars]
+    players = [Player(c, c in ai) for c in player_chars]
     race    = SimpleRace()
     dice    = Dice(num=1)     # one 6-sided dice
     shuffle(players)
 
+def play(seed=None):
+    """Play an AI vs AI race in headless mode; return the winning player's char."""
+    random.seed(seed)
+    with headless_mode():
+        setup(ai=player_chars)
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+
+
+if __name__ == "__main__":
+    if headless:
+        print(play())
+        sys.exit()
+
+    setup()
     try:
         BasicInterface().run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         pass
@@ -2,11 +2,14 @@
 
 # Imports {{{
 import sys
+import random
 from random import choice as rndchoice
 
 from utils import enumerate1, sjoin, TextInput, space, nl
-from board import Board, Loc, BaseTile, Dir
+from utils import is_headless, headless_mode, GameOver
+from board import ArrayBoard, Loc, BaseTile, Dir, Codec
 from avkutil import Term
+from inputs import input_from, record_session
 
 size    = 9
 blank   = '.'
@@ -54,15 +57,17 @@ class Initial(Number):
     pass
 
 
-class SudokuBoard(Board):
+# QQwing format: initial numbers and blanks
+codec = Codec( [(blank, Blank)] + [(str(n), lambda loc, n=n: Initial(n)) for n in range(1, 10)] )
+
+
+class SudokuBoard(ArrayBoard):
     def __init__(self, size, def_tile, puzzle):
         super(SudokuBoard, self).__init__(size, def_tile)
         self.hl_visible = False
         self.current = Loc(0,0)
 
-        for tile, val in zip(self, puzzle):
-            if val != blank:
-                self[tile] = Initial(val)
+        self.load(puzzle, codec)
 
         self.regions = [self.make_region(xo, yo) for xo in offsets for yo in offsets]
 
@@ -76,6 +81,8 @@ class SudokuBoard(Board):
         return [ Loc(xo + x, yo + y) for x in rng3 for y in rng3 ]
 
     def draw(self):
+        if is_headless(self.headless):
+            return
         print(nl*5)
         def ljoin(L):
             return sjoin(L, space, tiletpl)
@@ -106,8 +113,9 @@ class Sudoku(object):
 
     def check_end(self):
         if not any(t.blank for t in board):
-            print(nl, self.winmsg)
-            sys.exit()
+            if not is_headless(board.headless):
+                print(nl, self.winmsg)
+            raise GameOver(True)
 
 class Commands:
     player = None
@@ -146,7 +154,7 @@ class Commands:
             board[loc] = val
             board.hl_visible = False
             return loc, val
-        else:
+        elif not is_headless():
             print("Invalid move")
 
     def highlight(self, loc):
@@ -178,29 +186,51 @@ class BasicInterface(object):
             cmd = self.textinput.getinput()
             if sudoku.valid_move(*cmd):
                 return cmd
-            else:
+            elif not is_headless():
                 print(self.textinput.invalid_move)
 
     def get_move(self):
-        while True:
-            cmd = self.term.getch()
-            try:
-                if cmd.isdigit():
-                    val = commands.move(int(cmd))
-                else:
-                    val = commands[cmd]()
-                if val:
-                    return val
-            except KeyError:
-                print("invalid command:", cmd)
+        with self.term.raw():
+            while True:
+                cmd = self.term.getch()
+                try:
+                    if cmd.isdigit():
+                        val = commands.move(int(cmd))
+                    else:
+                        val = commands[cmd]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("invalid command:", cmd)
+
+def setup(puzzle=None):
+    """Create the board with `puzzle` (a random one by default), the game and commands in module globals."""
+    global board, sudoku, commands
+    board    = SudokuBoard(size, Blank, puzzle or rndchoice(puzzles))
+    sudoku   = Sudoku()
+    commands = Commands()
+
+def replay(source, seed=None, puzzle=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return True if the
+        puzzle was solved, or None if the recording ends before the game does.
+    """
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup(puzzle)
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
 
 
 if __name__ == "__main__":
-    board    = SudokuBoard(size, Blank, rndchoice(puzzles))
-    sudoku   = Sudoku()
-    commands = Commands()
+    record_session("sudoku")
+    setup()
 
     try:
         BasicInterface().run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         sys.exit()
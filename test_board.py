@@ -0,0 +1,103 @@
+""" Tests of board cloning; run with `python -m pytest`. """
+
+import random
+
+import pytest
+
+import robots
+import bblocks
+from board import Board, ChunkedBoard, BaseTile, Loc
+
+
+class Bag(BaseTile):
+    """Tile with a mutable member."""
+    def __init__(self, loc=None):
+        super(Bag, self).__init__(loc)
+        self.items = []
+
+    def clone(self):
+        new       = super(Bag, self).clone()
+        new.items = list(self.items)
+        return new
+
+
+def test_clone_copies_mutable_members():
+    board = Board(3, Bag)
+    loc   = Loc(1, 1)
+    board[loc].items.append("old")
+
+    new = board.clone()
+    new[loc].items.append("clone")
+    board[loc].items.append("source")
+
+    assert new[loc].items   == ["old", "clone"]
+    assert board[loc].items == ["old", "source"]
+
+
+def test_clone_invalidates_tile_references():
+    board = Board(3, Bag)
+    loc   = Loc(0, 2)
+    tile  = board[loc]
+
+    new = board.clone()
+    assert board[loc] is not tile and new[loc] is not tile
+
+    tile.items.append("stale")
+    assert board[loc].items == new[loc].items == []
+
+
+def test_clone_copies_robot_direction_and_program():
+    random.seed(0)
+    robots.setup()
+    robot = robots.robots[0]
+    loc   = robot.loc
+    robot.program = ["move", "fire"]
+    direction     = robot.direction.dir
+
+    new = robots.board.clone()
+    new[loc].turn_cw()
+    new[loc].program.pop()
+
+    assert robots.board[loc].direction.dir == direction
+    assert new[loc].direction.dir != direction
+    assert robots.board[loc].program == ["move", "fire"]
+
+
+def test_clone_copies_bblocks_counters():
+    random.seed(0)
+    bblocks.setup(ai=list(bblocks.players))
+    board, loc = bblocks.board, Loc(0, 0)
+    num        = board[loc].num.item
+
+    new = board.clone()
+    new[loc].num.next()
+    assert board[loc].num.item == num
+    assert new[loc].num.item   != num
+
+
+class Rock(BaseTile):
+    rock = True
+
+class Ground(BaseTile):
+    rock = False
+
+
+def test_chunked_board_lists_written_cells_only():
+    board = ChunkedBoard((10000, 10000), Ground)
+    board[Loc(5, 9000)] = Rock(Loc(5, 9000))
+
+    assert board.locations("rock") == [Loc(5, 9000)]
+    assert [t.loc for t in board.tiles("rock")] == [Loc(5, 9000)]
+    assert board.count("rock", False) == 10000*10000 - 1
+    with pytest.raises(ValueError):
+        board.locations_not("rock")
+    assert next(board.scan_locations(lambda tile: not tile.rock)) == Loc(0, 0)
+
+
+def test_chunked_board_refuses_per_cell_watchers():
+    with pytest.raises(ValueError):
+        ChunkedBoard(1000, Ground, index=["rock"])
+    with pytest.raises(ValueError):
+        ChunkedBoard(1000, Ground, zobrist=True)
+    with pytest.raises(ValueError):
+        ChunkedBoard(1000, Ground).distance_field("rock")
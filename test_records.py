@@ -0,0 +1,23 @@
+""" Tests of game records; run with `python -m pytest`. """
+
+import versi
+from records import Archive, ArchiveWriter
+
+
+def test_versi_record_round_trip(tmp_path):
+    rec   = versi.record(seed=1)
+    final = versi.board.dump(versi.codec)
+    assert len(rec.snapshot) == rec.width * rec.height
+
+    path = str(tmp_path / "games.sga")
+    with ArchiveWriter(path) as w:
+        w.write(rec)
+
+    with Archive(path) as archive:
+        view, = list(archive)
+        assert (view.game, view.seed, view.result) == ("versi", 1, rec.result)
+        assert view.record().locs() == rec.moves
+        board = versi.VersiBoard(view.width, versi.Blank)
+        view.load_snapshot(board, versi.record_codec)
+        assert board.dump(versi.codec) == final
+        assert board.bits.count(versi.player_chars[0]) == versi.player1.score()
@@ -0,0 +1,45 @@
+""" Tests of text input parsing; run with `python -m pytest`. """
+
+import pytest
+
+import robots
+from board import Board, Loc
+from utils import TextInput, sjoin
+
+
+def robots_input():
+    """TextInput with the format of `robots.BasicInterface` programs."""
+    cmdpat  = "%d? (" + sjoin(robots.commands.keys(), '|') + ")"
+    pattern = cmdpat + (" %s?" % cmdpat) * (robots.max_cmds - 1)
+    return TextInput(pattern, Board(9, '.'), accept_blank=True, singlechar_cmds=True)
+
+
+def test_robots_program():
+    inp = robots_input()
+    assert inp.parse("81mf4")    == [81, 'm', 'f', 4]
+    assert inp.parse("8m 1f 4t") == [8, 'm', 1, 'f', 4, 't']
+    assert inp.parse("")         is None
+
+
+def test_robots_program_spaces_are_removed_after_selecting_the_format():
+    with pytest.raises(ValueError):
+        robots_input().parse("8 1mf4")
+
+
+def test_first_selected_format_is_used():
+    inp = TextInput(["loc", "%d"], Board(9, '.'))
+    assert inp.parse("85")  == [Loc(7, 4)]
+    assert inp.parse("8 5") == [Loc(7, 4)]
+    with pytest.raises(ValueError):
+        inp.parse("805")        # looks like a location, so it isn't parsed as a number
+    with pytest.raises(ValueError):
+        inp.parse("8 0 5")
+
+    assert TextInput(["%d", "loc"]).parse("85") == [85]
+
+
+def test_parse_lines():
+    inp = TextInput("loc %d?")
+    assert inp.parse_lines(["# comment", "3 3 2", "", "45"]) == [[Loc(2, 2), 2], [Loc(3, 4)]]
+    with pytest.raises(ValueError):
+        inp.parse_lines(["3 3", "x"])
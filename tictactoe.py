@@ -2,17 +2,19 @@
 # -*- encoding: utf-8 -*-
 
 import sys
+import random
 from random import choice as randchoice
 from itertools import cycle
 
-from board import Loc, Board
+from board import Loc, ArrayBoard
+from utils import headless, is_headless, headless_mode, GameOver
 
 size    = 3
 blank   = '.'
 players = 'XO'
 
 
-class TictactoeBoard(Board):
+class TictactoeBoard(ArrayBoard):
     def filled(self):
         return not any(tile==blank for tile in self)
 
@@ -51,8 +53,9 @@ class Tictactoe(object):
             self.game_won(None)
 
     def game_won(self, player):
-        print(self.winmsg % player if player else self.drawmsg)
-        sys.exit()
+        if not is_headless():
+            print(self.winmsg % player if player else self.drawmsg)
+        raise GameOver(player)
 
     def run(self):
         """Main loop."""
@@ -64,6 +67,25 @@ class Tictactoe(object):
             self.check_end(player)
 
 
+def play(seed=None):
+    """Play a game in headless mode; return the winner or None for a draw."""
+    global board
+    random.seed(seed)
+    with headless_mode():
+        board = TictactoeBoard(size, blank)
+        try:
+            Tictactoe().run()
+        except GameOver as e:
+            return e.result
+
+
 if __name__ == "__main__":
+    if headless:
+        print(play())
+        sys.exit()
+
     board = TictactoeBoard(size, blank)
-    Tictactoe().run()
+    try:
+        Tictactoe().run()
+    except GameOver:
+        sys.exit()
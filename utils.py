@@ -1,22 +1,37 @@
 #!/usr/bin/env python3
 # -*- encoding: utf-8 -*-
 
+import os
 import sys
 import re
-from copy import copy
-from random import randint, shuffle
-from itertools import zip_longest, takewhile
+from time import sleep
+from contextlib import contextmanager
+from random import randint, shuffle, choice
+from itertools import zip_longest
+
+import inputs
 
 sentinel = object()
 space    = ' '
 nl       = '\n'
 
+# headless mode: skip drawing, pauses and messages, to run AI games at full speed; turned on by the `--headless`
+# flag or by setting SIMPLE_GAMES_HEADLESS environment variable to 1, true or yes
+headless = (os.environ.get("SIMPLE_GAMES_HEADLESS", '').strip().lower() in ("1", "true", "yes")
+            or "--headless" in sys.argv[1:])
+
 
 class InvalidCode(Exception):
     def __init__(self, val) : self.val = val
     def __str__(self)       : return repr(self.val)
 
 
+class GameOver(Exception):
+    """Raised when the game ends; `result` is game-specific, e.g. the winner."""
+    def __init__(self, result=None) : self.result = result
+    def __str__(self)               : return repr(self.result)
+
+
 class Loop(object):
     """ Loop over a sequence of items in forward / backward direction, keeping track of current item,
         which is available as `item` attribute by default, and under a custom `name` provided to init.
@@ -85,22 +100,67 @@ class Loop(object):
         return other - self.item
 
 
+class Toggle(object):
+    """ Data descriptor for an attribute of `AttrToggles`: setting it also sets the `others` attributes to
+        the inverse value. It has no `__get__`, so reads find the value in the instance dict, where
+        `AttrToggles` puts class defaults when an instance is created.
+    """
+    __slots__ = ("name", "others")
+
+    def __init__(self, name, others):
+        self.name   = name
+        self.others = others
+
+    def __set__(self, obj, val):
+        d = obj.__dict__
+        d[self.name] = val
+        for attr in self.others:
+            d[attr] = not val
+
+
 class AttrToggles(object):
     """ Inverse-toggle two boolean attributes when one of a pair is toggled; `attribute_toggles`
         is a list of tuples.
+
+        The pairs are compiled into `Toggle` descriptors when a subclass is created, and class defaults of
+        toggled attributes are copied into each new instance, so reading them and assigning to other
+        attributes are not affected at all; an attribute without a class default starts as the inverse of
+        the other one of its pair, or False.
     """
     attribute_toggles = []
+    _toggle_defaults  = {}
+
+    def __new__(cls, *args, **kwargs):
+        obj = super(AttrToggles, cls).__new__(cls)
+        obj.__dict__.update(cls._toggle_defaults)
+        return obj
+
+    def __init_subclass__(cls, **kwargs):
+        super(AttrToggles, cls).__init_subclass__(**kwargs)
+        toggles  = cls.attribute_toggles
+        defaults = dict(cls._toggle_defaults)
+
+        for attr in dict.fromkeys(flatten(toggles)):
+            others = tuple(a for attrs in toggles if attr in attrs for a in attrs if a != attr)
+            value  = class_attr(cls, attr)
+            if not isinstance(value, Toggle):
+                if value is not sentinel:
+                    defaults[attr] = value
+                setattr(cls, attr, Toggle(attr, others))
+
+        for attrs in toggles:
+            known = [defaults[a] for a in attrs if a in defaults]
+            for attr in attrs:
+                defaults.setdefault(attr, not known[0] if known else False)
+        cls._toggle_defaults = defaults
 
-    def __setattr__(self, attr, val):
-        object.__setattr__(self, attr, val)
-        toggles = self.attribute_toggles
 
-        if attr in flatten(toggles):
-            for attrs in toggles:
-                if attr in attrs:
-                    attrs = set(attrs) - set([attr])
-                    for attr in attrs:
-                        object.__setattr__(self, attr, not val)
+def class_attr(cls, attr, default=sentinel):
+    """Value of `attr` in the dict of `cls` or of its bases, without calling descriptors; `default` if there's none."""
+    for klass in cls.__mro__:
+        if attr in vars(klass):
+            return vars(klass)[attr]
+    return default
 
 
 class Dice(object):
@@ -116,6 +176,105 @@ class Dice(object):
         return sum(self.roll())
 
 
+class InputFormat(object):
+    """ `TextInput` format compiled into two regexes, for input with values separated by spaces and for input
+        without spaces, where each value is captured by a named group and converted by the token's handler;
+        a line is parsed with a single match. Use `compile_format()` to get the cached instance.
+
+        `selects()` tells if `TextInput` should pick this format for an input line; it uses a looser regex,
+        where spaces are optional, so that a line selects the first format it looks like even if it then
+        fails to parse with it.
+    """
+    # token: (regex of the value when values are separated by spaces, regex without spaces)
+    tokens   = {
+                "loc" : (r"(?P<%sx>\d+)\s+(?P<%sy>\d+)", r"(?P<%sx>\d)(?P<%sy>\d)"),
+                "%s"  : (r"\w+", r"\w+"),
+                "%d"  : (r"\d+", r"\d+"),
+                "%hd" : (r"\d+", r"\d+"),
+                "%f"  : (r"\d+\.?\d*|\.\d+", r"\d+\.?\d*|\.\d+"),
+                }
+    handlers = {"%d": int, "%hd": lambda v: int(v) - 1, "%f": float}
+
+    # replacements that turn a format into the regex of `selects()`, in order
+    select_tokens = (
+                     ("loc?" , r"(\d+ \d+)?"),
+                     ("%s?"  , r"\w*"),
+                     ("%d?"  , r"\d*"),
+                     ("%hd?" , r"\d*"),
+                     ("%f?"  , r"\d*\.?\d*"),
+                     ("loc"  , r"\d+ \d+"),
+                     ("%s"   , r"\w+"),
+                     ("%d"   , r"\d+"),
+                     ("%hd"  , r"\d+"),
+                     ("%f"   , r"\d\.?\d?"),
+                     (" "    , " *"),
+                     )
+
+    def __init__(self, fmt):
+        self.fmt    = fmt
+        self.fields = []        # (group name, token)
+        split, joined = [], []
+
+        for n, code in enumerate(fmt.split()):
+            optional = code.endswith('?')
+            if optional: code = code[:-1]
+            name = "t%d" % n
+            self.fields.append((name, code))
+
+            if code == "loc":
+                sregex, jregex = (r % (name, name) for r in self.tokens[code])
+            else:
+                sregex, jregex = ("(?P<%s>%s)" % (name, r) for r in self.tokens.get(code, (code, code)))
+
+            opt = '?' if optional else ''
+            split.append( r"(?:\s+%s)%s" % (sregex, opt) )
+            joined.append( "(?:%s)%s" % (jregex, opt) )
+
+        self.split  = re.compile(''.join(split) + r"\Z")
+        self.joined = re.compile(''.join(joined) + r"\Z")
+
+        select = fmt
+        for token, regex in self.select_tokens:
+            select = select.replace(token, regex)
+        self.select = re.compile("^%s$" % select)
+
+    def selects(self, inp):
+        return bool(self.select.match(inp))
+
+    def parse(self, inp, board=None):
+        """ Return the list of values parsed from `inp`, or None if it doesn't match; locations are checked
+            with `board.valid()` if `board` is given, raising IndexError if not valid.
+        """
+        from board import Loc
+
+        m = self.split.match(space + inp) if space in inp else self.joined.match(inp)
+        if not m:
+            return None
+
+        values, group = [], m.group
+        for name, code in self.fields:
+            if code == "loc":
+                x = group(name + 'x')
+                if x is None: continue
+                loc = Loc( int(x)-1, int(group(name + 'y'))-1 )
+                if board and not board.valid(loc):
+                    raise IndexError
+                values.append(loc)
+            else:
+                val = group(name)
+                if val is None: continue
+                values.append( self.handlers.get(code, str)(val) )
+        return values
+
+_input_formats = {}
+
+def compile_format(fmt):
+    """Return the compiled `InputFormat` for `fmt` format string, shared by all inputs."""
+    if fmt not in _input_formats:
+        _input_formats[fmt] = InputFormat(fmt)
+    return _input_formats[fmt]
+
+
 class TextInput(object):
     """ Get text input from user in a specified format `fmt`.
         Given format "loc %d", both inputs are valid: "332", "3 3 2"; when input is ambiguous, values
@@ -124,10 +283,18 @@ class TextInput(object):
         Supported format codes:
             loc - location in X Y format; will be checked using board.valid() method.
             %d  - integer
+            %hd - integer in "human format", i.e. 1-indexed
             %f  - float
             %s  - string
 
+        Other codes are used as regexes; a code followed by '?' is optional. Formats are compiled once,
+        see `InputFormat`.
+
         getloc() - convenience method to get a single location irrespective of `self.fmt`.
+        parse_lines() - batch mode, to parse a file of input lines.
+
+        Lines are read with `input()` unless there's a `source` (by default `inputs.source`); they're written
+        to `recorder` (by default `inputs.recorder`) if there is one.
 
         Note: location is accepted in "human format", i.e. it's adjusted from 1-indexed to 0-indexed.
     """
@@ -135,26 +302,9 @@ class TextInput(object):
     invalid_move   = "Invalid move"
     formats        = ("loc",)
     choice_tpl     = "%2d) %s"
-    explicit_split = True       # input contained spaces & it was possible to explicitly split values
-
-    # needs to be in precise order for matchfmt() method
-    regexes     = (
-                   ("loc?" , "(\d+ \d+)?"),
-                   ("%s?"  , "\w*"),
-                   ("%d?"  , "\d*"),
-                   ("%hd?" , "\d*"),
-                   ("%f?"  , "\d*\.?\d*"),  # TODO: this one needs more work..
-
-                   ("loc"  , "\d+ \d+"),
-                   ("%s"   , "\w+"),
-                   ("%d"   , "\d+"),
-                   ("%hd"  , "\d+"),
-                   ("%f"   , "\d\.?\d?"),
-                   (" "    , " *"),
-                    )
 
     def __init__(self, formats=None, board=None, prompt="> ", quit_key='q', accept_blank=False,
-                 invalid_inp=None, singlechar_cmds=False):
+                 invalid_inp=None, singlechar_cmds=False, source=None, recorder=None):
         try              : is_str = isinstance(formats, basestring)
         except NameError : is_str = isinstance(formats, str)
 
@@ -167,6 +317,8 @@ class TextInput(object):
         self.accept_blank    = accept_blank
         self.singlechar_cmds = singlechar_cmds
         self.invalid_inp     = invalid_inp or self.invalid_inp
+        self.source          = source or inputs.source
+        self.recorder        = recorder or inputs.recorder
 
     def getloc(self):
         return first( self.getinput(formats=["loc"]) )
@@ -195,105 +347,51 @@ class TextInput(object):
             try: return self.parse_input(formats)
             except (IndexError, ValueError, TypeError, KeyError) as e: print(self.invalid_inp)
 
-    def matchfmt(self, fmt, inp):
-        for init, repl in self.regexes:
-            fmt = fmt.replace(init, repl)
-        return re.match("^%s$" % fmt, inp)
-
-    def parse_fmt(self, inp, fmt):
-        """Attempt to parse `inp` using `fmt` format; return False if there is mismatch."""
-        from board import Loc
-
-        fmt      = fmt.split()
-        inp      = copy(inp)
-        commands = []
-        handlers = {"%d": int, "%f": float, "%s": str}
-        regexes  = dict(self.regexes)
-        isdigit  = lambda x: x.isdigit()
-
-        def nomatch(val): return bool( optional and not re.match(regex, val) )
-
-        for n, code in enumerate(fmt):
-            optional = code.endswith('?')
-            if optional: code = code[:-1]
-            regex    = "^%s$" % regexes.get(code, code)
-
-            if not inp:
-                if optional: continue
-                else: raise ValueError
-
-            if code == "loc":
-
-                if nomatch( ujoin(inp[:2]) ):
-                    continue
-                else:
-                    # print("inp", inp)
-                    x, y = inp.pop(0), inp.pop(0)
-                    loc = Loc( int(x)-1, int(y)-1 )
-                    if self.board and not self.board.valid(loc):
-                        raise IndexError
-                    commands.append(loc)
-
-            # int and 'human format' (1-indexed) int
-            elif code in ("%d", "%hd"):
-                if nomatch(first(inp)):
-                    continue
-                else:
-                    if self.explicit_split:
-                        n = inp.pop(0)
-                    else:
-                        n = list(takewhile(isdigit, iter(inp)))
-                        n = sjoin(n, '')
-                        inp = inp[len(n):]
-                    n = int(n) if code=="%d" else int(n)-1
-                    commands.append(n)
-
-            else:
-                if nomatch(first(inp)) :
-                    continue
-                else:
-                    if self.explicit_split:
-                        val = inp.pop(0)
-                    else:
-                        val = []
-
-                        def match(x):
-                            pat = sjoin(val, sep='') + x
-                            if re.match(regex, pat):
-                                val.append(x)
-                                return True
-
-                        val = list(takewhile(match, iter(inp)))
-                        val = sjoin(val, '')
-                        inp = inp[len(val):]
-
-                    commands.append( handlers.get(code, str)(val) )
-
-        if inp: raise ValueError
-        return commands
-
     def parse_input(self, formats):
-        inp = input(self.prompt).strip()
+        inp = self.source.read(self.prompt) if self.source else input(self.prompt)
+        if self.recorder:
+            self.recorder.write(inp)
+        inp = inp.strip()
         if inp == self.quit_key: sys.exit()
+        return self.parse(inp, formats)
+
+    def parse(self, inp, formats=None):
+        """ Parse `inp` line with the first of `formats` that it looks like (see `InputFormat.selects()`); raise
+            ValueError if there's none or if the line doesn't parse with it. With `singlechar_cmds`, spaces are
+            removed after the format is selected.
+        """
         if self.accept_blank and not inp:
             return None
 
-        formats = [fmt for fmt in formats if self.matchfmt(fmt, inp)]
-        if not formats:
+        fmt = first(f for f in map(compile_format, formats or self.formats) if f.selects(inp))
+        if not fmt:
             raise ValueError
-
-        fmt = first(formats)
         if self.singlechar_cmds:
             inp = inp.replace(space, '')
 
-        if space in inp:
-            inp = inp.split()
-        else:
-            inp = list(inp)
-            self.explicit_split = False
-
-        commands = self.parse_fmt(inp, fmt)
-        return commands
+        values = fmt.parse(inp, self.board)
+        if values is None:
+            raise ValueError
+        return values
+
+    def parse_lines(self, lines, formats=None):
+        """ Batch mode: parse each of `lines` (e.g. an open file) and return the list of results; blank lines
+            and lines starting with '#' are skipped. Invalid lines raise ValueError with the line number.
+        """
+        results = []
+        for n, line in enumerate1(lines):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                results.append(self.parse(line, formats))
+            except (IndexError, ValueError) as e:
+                raise ValueError("line %d: %s: %r" % (n, self.invalid_inp, line))
+        return results
+
+    def parse_file(self, path, formats=None):
+        with open(path) as f:
+            return self.parse_lines(f, formats)
 
     def menu(self, choices):
         for n, (title, _) in enumerate1(choices):
@@ -305,6 +403,42 @@ class TextInput(object):
         return choices[i][1]
 
 
+class IndexedSet(object):
+    """Set that also supports O(1) uniform random choice of an item."""
+    def __init__(self, items=()):
+        self.items = []
+        self.pos   = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self)            : return len(self.items)
+    def __iter__(self)           : return iter(self.items)
+    def __contains__(self, item) : return item in self.pos
+
+    def add(self, item):
+        if item not in self.pos:
+            self.pos[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        """Remove `item` if present by moving the last item into its place."""
+        i = self.pos.pop(item, None)
+        if i is not None:
+            last = self.items.pop()
+            if i < len(self.items):
+                self.items[i]  = last
+                self.pos[last] = i
+
+    def choice(self):
+        return choice(self.items)
+
+    def copy(self):
+        new       = IndexedSet()
+        new.items = list(self.items)
+        new.pos   = dict(self.pos)
+        return new
+
+
 class Container:
     def __init__(self, **kwargs)   : self.__dict__.update(kwargs)
     def __setitem__(self, k, v)    : self.__dict__[k] = v
@@ -319,6 +453,7 @@ class Container:
     def items(self)                : return self.__dict__.items()
     def keys(self)                 : return self.__dict__.keys()
     def values(self)               : return self.__dict__.values()
+    def __repr__(self)             : return "Container(%s)" % sjoin(("%s=%r" % kv for kv in sorted(self.items())), ", ")
 
 
 class BufferedIterator(object):
@@ -475,6 +610,35 @@ def multi_replace(text, tuples):
         text = text.replace(s1, s2)
     return text
 
+def is_headless(override=None):
+    """Is headless mode on? `override` (e.g. board's own setting) takes precedence if it's not None."""
+    return headless if override is None else override
+
+def set_headless(value=True):
+    global headless
+    headless = value
+
+@contextmanager
+def headless_mode(value=True):
+    """Turn headless mode on (or off) within the block."""
+    global headless
+    old, headless = headless, value
+    try     : yield
+    finally : headless = old
+
+def pause(sec):
+    """Sleep for `sec` seconds unless in headless mode."""
+    if not headless:
+        sleep(sec)
+
+def option(args, name, default=None, type=str):
+    """Remove option `name` and its value from `args` and return the value, or `default` if it's not there."""
+    if name not in args[:-1]:
+        return default
+    i = args.index(name)
+    del args[i]
+    return type(args.pop(i))
+
 def getter(fn, is_at_end=lambda v: not v):
   while True:
     val = fn()
@@ -3,20 +3,31 @@
 
 # Imports {{{
 import sys
+import random
 from random import choice as rndchoice
 from random import shuffle
-from itertools import groupby
-from time import sleep
 
-from utils import nextval, first, cmp, iround, nextgroup, flatten
-from board import Board, Loc, BaseTile
+from utils import nextval, first, cmp, iround, Container
+from utils import pause, headless, is_headless, headless_mode, GameOver
+from board import Board, Loc, BaseTile, TrackedTile, Codec
+from records import Record
+from versi_engine import VersiBits
+from versi_ai import Search
+from versi_book import find_book
 from commands import BaseCommands
+from inputs import input_from, record_session
 from avkutil import Term
+from render import DiffRenderer
 
 size         = 12
 player_chars = '▣⎔'
 # ai_players   = '▣⎔'
 ai_players   = ''
+ai_search    = ''           # AI players that search ahead with `versi_ai.Search` rather than pick a greedy move
+search_time  = 0.5          # seconds per searched move
+search_depth = None         # depth limit; with a limit and a generous time, searched games are reproducible
+endgame      = 10           # searching players solve the game exactly with this many empty squares left
+book_file    = "versi.book" # opening book for searching players, built with `versi_book.py`; used if it exists
 blank        = '.'
 padding      = 4, 2
 pause_time   = 0.3
@@ -37,13 +48,15 @@ commands     = {
 # }}}
 
 class Commands(BaseCommands):
+    commands = commands
+
     def move(self):
         board = self.board
         loc = board.current
         if board.valid_move(self.player, loc):
             board.hl_visible = False
             return loc
-        else:
+        elif not is_headless():
             print("Invalid move")
 
 
@@ -55,8 +68,9 @@ class PlayerBase(object):
         return not self==other
 
 
-class Tile(BaseTile, PlayerBase):
+class Tile(BaseTile, TrackedTile, PlayerBase):
     blank = piece = False
+    tracked = ("char",)
 
     def __repr__(self):
         return blank if self.blank else self.char
@@ -67,16 +81,25 @@ class Blank(Tile):
 
 
 class Piece(Tile):
-    def __init__(self, loc=None, char=None):
+    def __init__(self, loc=None, char=None, place=True):
         super(Piece, self).__init__(loc)
         self.char = char
-        if loc:
+        if loc and place:
             board[loc] = self
 
     def flip(self):
         self.char = nextval(player_chars, self.char)
 
 
+codec = Codec( [(blank, Blank)] + [(c, lambda loc, c=c: Piece(loc, c, place=False)) for c in player_chars] )
+
+# ASCII characters of board snapshots in game records, so that a snapshot takes a byte per cell
+record_chars = dict(zip(blank + player_chars, ".xo"))
+record_codec = Codec( [(record_chars[blank], Blank)] +
+                      [(record_chars[c], lambda loc, c=c: Piece(loc, c, place=False)) for c in player_chars],
+                      char=lambda tile: record_chars[repr(tile)], encoding="ascii" )
+
+
 class VersiBoard(Board):
     scores_msg = "%s  score: %3s    %s  score: %3s  "
 
@@ -84,35 +107,35 @@ class VersiBoard(Board):
         super().__init__(*a, **kw)
         self.current = Loc(0,0)
         self.hl_visible = False
+        self.bits = VersiBits(self.width, self.height, player_chars)     # pieces as bitboards, see `versi_engine`
+        self.watch(self.bits)
+
+    def clone(self):
+        new      = super().clone()
+        new.bits = first(w for w in new.watchers if isinstance(w, VersiBits))
+        return new
 
     def get_valid_moves(self, player):
-        return [loc for loc in self.locations() if self.valid_move(player, loc)]
+        bits = self.bits
+        return bits.geom.locs_of(bits.moves(player.char))
 
     def valid_move(self, player, loc):
-        return bool(self.get_captured(player, loc))
+        bits = self.bits
+        return bool(bits.moves(player.char) & bits.geom.bit(loc))
 
     def get_captured(self, player, start_loc):
-        """If `start_loc` is a valid move, returns a list of locations of captured pieces."""
-        if not self[start_loc].blank:
-            return []
-
-        getdir = self.capture_direction
-        return flatten( [getdir(player, start_loc, dir) for dir in self.dirlist2] )
-
-    def capture_direction(self, player, start, dir):
-        """Return the list of enemy tiles to capture in the `dir` direction from `start` location."""
-        groups = groupby(self.ray(start, dir))
-        group1, group2 = nextgroup(groups), nextgroup(groups)
-        if group1 and group2 and (group1.key == player.enemy() and group2.key == player):
-            return group1.group
-        else:
-            return []
+        """If `start_loc` is a valid move, returns the list of captured pieces."""
+        bits = self.bits
+        return [self[loc] for loc in bits.geom.locs_of(bits.flips(player.char, start_loc))]
 
     def is_corner(self, loc):
         return loc.x in (0, self.width-1) and loc.y in (0, self.height-1)
 
     def status(self):
         print(self.scores_msg % (player1, player1.score(), player2, player2.score()), end='')
+        for p in players:
+            if p.search and p.search.info:
+                print("  %s: %s" % (p, p.search.report()), end='')
         sys.stdout.flush()
 
     def middle(self):
@@ -120,15 +143,20 @@ class VersiBoard(Board):
 
 
 class Player(PlayerBase):
-    def __init__(self, char):
-        self.char = char
-        self.ai   = char in ai_players
+    """ Player with `char`; `ai` and `searching` default to the player being in `ai_players` and `ai_search`.
+        `search` is the `versi_ai.Search` of a searching player, created on its first move unless given.
+    """
+    def __init__(self, char, ai=None, searching=None):
+        self.char      = char
+        self.ai        = char in ai_players if ai is None else ai
+        self.searching = char in ai_search if searching is None else searching
+        self.search    = None
 
     def __repr__(self):
         return self.char
 
     def score(self):
-        return sum(tile==self for tile in board)
+        return board.bits.count(self.char)
 
     def enemy(self):
         return nextval(players, self)
@@ -140,6 +168,15 @@ class Player(PlayerBase):
         Piece(loc, self.char)
         return [board[loc]] + tiles
 
+    def get_ai_move(self):
+        """Return location of a move from the opening book, solved or searched if `searching`, otherwise greedy."""
+        if not self.searching:
+            return self.get_random_move()
+        if not self.search:
+            self.search = Search(board.width, board.height, search_time, search_depth, endgame=endgame,
+                                 book=find_book(book_file, board.width, board.height))
+        return self.search.search_loc(*board.bits.sides(self.char))
+
     def get_random_move(self):
         """Return location of best move."""
         def by_corner_score(loc):
@@ -155,6 +192,7 @@ class Versi(object):
     tiemsg     = "The game was a tie!"
 
     def __init__(self):
+        self.moves = []
         x, y = board.middle()
         Piece(Loc(x,y), player1.char)
         Piece(Loc(x+1, y+1), player1.char)
@@ -163,24 +201,27 @@ class Versi(object):
 
     def game_end(self):
         board.draw()
-        winner = cmp(player1.score(), player2.score())
-        if not winner:
-            print(nl, self.tiemsg)
-        else:
-            print(nl, self.winmsg % (player1 if winner>0 else player2))
-        sys.exit()
+        scores = player1.score(), player2.score()
+        winner = cmp(*scores)
+        winner = (player1 if winner>0 else player2) if winner else None
+
+        if not is_headless(board.headless):
+            print(nl, (self.winmsg % winner) if winner else self.tiemsg)
+        raise GameOver( Container(winner=winner and winner.char, scores=scores) )
 
 class BasicInterface(object):
     def run(self):
-        self.term      = Term()
+        if not all(p.ai for p in players):
+            self.term  = Term()
         moves          = board.get_valid_moves
         player         = rndchoice(players)
         player         = first(players)
 
         while True:
             board.draw()
-            move = player.get_random_move() if player.ai else self.get_move(player)
+            move = player.get_ai_move() if player.ai else self.get_move(player)
             tiles = player.make_move(move)
+            versi.moves.append(move)
             self.blink_tiles(tiles)
 
             # give next turn to enemy OR end game if no turns left, FALLTHRU: current player keeps the turn
@@ -191,31 +232,92 @@ class BasicInterface(object):
 
     def get_move(self, player):
         commands.player = player
-        while True:
-            val = self.term.getch()
-            try:
-                val = commands[val]()
-                if val:
-                    return val
-            except KeyError:
-                print("Invalid move")
+        with self.term.raw():
+            while True:
+                val = self.term.getch()
+                try:
+                    val = commands[val]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("Invalid move")
 
     def blink_tiles(self, tiles):
         for _ in range(2):
             for tile in tiles:
                 tile.blank = not tile.blank
-            sleep(blink_speed)
+            pause(blink_speed)
             board.draw()
 
 
-if __name__ == "__main__":
-    board            = VersiBoard(size, Blank, num_grid=False, padding=padding, pause_time=pause_time)
-    players          = [Player(c) for c in player_chars]
+def setup(ai=None, search=None):
+    """ Create the board, players and the game in module globals; `ai` (player chars) overrides `ai_players`
+        and `search` overrides `ai_search` for this game.
+    """
+    global board, players, player1, player2, versi
+    ai     = ai_players if ai is None else ai
+    search = ai_search if search is None else search
+
+    board            = VersiBoard(size, Blank, num_grid=False, padding=padding, pause_time=pause_time,
+                                  renderer=DiffRenderer())
+    players          = [Player(c, c in ai, c in search) for c in player_chars]
     player1, player2 = players
     versi            = Versi()
-    commands         = Commands(board, commands)
+
+def play(seed=None, search=None, searchers=None):
+    """ Play an AI vs AI game in headless mode; return the result with `winner` and `scores`. `searchers` can
+        give each player in turn order a `versi_ai.Search` to use, or None for a greedy player.
+    """
+    random.seed(seed)
+    with headless_mode():
+        if searchers:
+            search = ''.join(c for c, s in zip(player_chars, searchers) if s)
+        setup(ai=player_chars, search=search)
+        for player, searcher in zip(players, searchers or ()):
+            player.search = searcher
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+
+def replay(source, seed=None, ai=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return the result as in
+        `play()`, or None if the recording ends before the game does.
+    """
+    global commands
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup(ai)
+        commands = Commands(board)
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
+
+def record(seed=None):
+    """ Play an AI vs AI game as in `play()` and return it as a `records.Record` with the final board, which
+        can be loaded back with `record_codec`.
+    """
+    result = play(seed)
+    winner = player_chars.index(result.winner) + 1 if result.winner else 0
+    return Record("versi", board.width, board.height, versi.moves, winner, seed, board.dump(record_codec, bytes))
+
+
+if __name__ == "__main__":
+    if "--search" in sys.argv[1:]:
+        ai_search = player_chars
+    if headless:
+        print(play())
+        sys.exit()
+
+    record_session("versi")
+    setup()
+    commands = Commands(board)
 
     try:
         BasicInterface().run()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, GameOver):
         sys.exit()
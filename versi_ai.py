@@ -0,0 +1,284 @@
+# -*- encoding: utf-8 -*-
+""" Search player for Versi: negamax alpha-beta with iterative deepening under a time budget.
+
+    Search runs on a pair of bitboards (see `versi_engine`) detached from the live board: `own` pieces of the
+    side to move and `opp` pieces of the other side. Scores are from the point of view of the side to move.
+
+    Evaluation is a weighted count of squares (corners are good, squares next to corners are bad, edges
+    are better than inner squares) plus mobility, the difference in the number of legal moves. Finished games
+    score `WIN` plus the piece difference.
+
+    With few enough empty squares left, the game is solved exactly instead: the score is then the final piece
+    margin with perfect play by both sides. Moves from an opening book (see `versi_book`) are played without a
+    search.
+"""
+
+from time import time
+
+from utils import Container
+from versi_engine import bit_geometry, popcount
+
+WIN = 100000
+INF = 10 * WIN
+EXACT, LOWER, UPPER = range(3)      # transposition table entry bounds
+
+corner_weight = 25
+x_weight      = -10     # diagonally next to a corner
+c_weight      = -4      # next to a corner along the edge
+edge_weight   = 3
+mobility      = 4       # per legal move
+sort_empties  = 4       # endgame moves are ordered by the opponent's mobility with more empty squares than this
+
+
+class Timeout(Exception):
+    pass
+
+
+class Search(object):
+    """ Alpha-beta searcher for a `width` x `height` board.
+
+        budget     - default wall-clock seconds per `search()`; depth 1 is always completed.
+        max_depth  - default depth limit; None to search until the time is up or the game is solved.
+        table_size - the transposition table is cleared before a search once it has more entries.
+        endgame    - solve the game exactly when there are this many empty squares or fewer; None to not solve.
+        book       - `versi_book.Book` to play moves from when the position is in it.
+
+        After a search, `info` has the chosen `move` bit, its `score`, the completed `depth`, the number of
+        `nodes` searched, `time` taken and `nps` (nodes per second); `source` is "book", "solved" (the score
+        is the final piece margin) or "search".
+    """
+    def __init__(self, width, height, budget=1.0, max_depth=None, table_size=1000000, endgame=None, book=None):
+        self.geom       = bit_geometry(width, height)
+        self.budget     = budget
+        self.max_depth  = max_depth
+        self.table_size = table_size
+        self.endgame    = endgame
+        self.book       = book
+        self.table      = {}
+        self.end_table  = {}
+        self.info       = None
+        self.nodes      = 0
+        self.deadline   = None
+        self.squares    = square_weights(width, height)
+        self.weights    = dict.fromkeys(bits_of(self.geom.full), 0)       # weight of each square's bit
+        self.weights.update( (bit, w) for mask, w in self.squares for bit in bits_of(mask) )
+
+    def search(self, own, opp, budget=None, max_depth=None):
+        """Return the best move bit for the side to move with `own` pieces, or 0 if it has no legal move."""
+        budget, max_depth = budget or self.budget, max_depth or self.max_depth
+        start, self.nodes = time(), 0
+        self.deadline     = None            # no time limit until depth 1 is done
+        if len(self.table) > self.table_size:
+            self.table.clear()
+
+        empty    = popcount(self.geom.full & ~(own | opp))
+        best     = score = depth = 0
+        source   = "search"
+        entry    = self.book and self.book.lookup(own, opp)
+        if entry:
+            (best, score), source = entry, "book"
+        elif self.endgame and empty <= self.endgame:
+            best, score = self.solve(own, opp)
+            depth, source = empty, "solved"
+        elif self.geom.moves(own, opp):
+            for d in range(1, min(max_depth or empty, empty) + 1):
+                try:
+                    score, best = self.root(own, opp, d, best)
+                except Timeout:
+                    break
+                depth         = d
+                self.deadline = start + budget
+                if abs(score) >= WIN or time() > self.deadline:
+                    break
+
+        elapsed   = time() - start
+        self.info = Container(move=best, score=score, depth=depth, nodes=self.nodes, time=elapsed,
+                              nps=self.nodes / elapsed if elapsed else 0, source=source)
+        return best
+
+    def search_loc(self, own, opp, budget=None, max_depth=None):
+        """Return the location of the best move as in `search()`, or None if there's no legal move."""
+        move = self.search(own, opp, budget, max_depth)
+        return self.geom.locs_of(move)[0] if move else None
+
+    def report(self):
+        info = self.info
+        if info.source == "book":
+            return "book move"
+        if info.source == "solved":
+            return "solved, margin %+d, %s nodes" % (info.score, "{:,}".format(info.nodes))
+        return "depth %d, %s nodes, %s nodes/sec" % (info.depth, "{:,}".format(info.nodes), "{:,.0f}".format(info.nps))
+
+    def root(self, own, opp, depth, first):
+        """Search all moves to `depth`, trying `first` move first; return (score, best move)."""
+        alpha, best = -INF, 0
+        for move, new_own, new_opp in self.children(own, opp, self.geom.moves(own, opp), first, depth):
+            score = -self.negamax(new_opp, new_own, depth - 1, -INF, -alpha)
+            if score > alpha or not best:
+                alpha, best = score, move
+        self.table[own, opp] = (depth, EXACT, alpha, best)
+        return alpha, best
+
+    def negamax(self, own, opp, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 1023 and self.deadline and time() > self.deadline:
+            raise Timeout
+
+        key, first = (own, opp), 0
+        entry      = self.table.get(key)
+        if entry:
+            edepth, bound, value, first = entry
+            if edepth >= depth:
+                if bound == EXACT                   : return value
+                if bound == LOWER and value >= beta : return value
+                if bound == UPPER and value <= alpha: return value
+
+        geom  = self.geom
+        moves = geom.moves(own, opp)
+        if not moves:
+            if not geom.moves(opp, own):
+                return self.final_score(own, opp)
+            return -self.negamax(opp, own, depth, -beta, -alpha)      # pass
+        if depth <= 0:
+            return self.evaluate(own, opp, moves)
+
+        orig_alpha, best, best_move = alpha, -INF, 0
+        for move, new_own, new_opp in self.children(own, opp, moves, first, depth):
+            score = -self.negamax(new_opp, new_own, depth - 1, -beta, -alpha)
+            if score > best:
+                best, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        bound = UPPER if best <= orig_alpha else LOWER if best >= beta else EXACT
+        self.table[key] = (depth, bound, best, best_move)
+        return best
+
+    def children(self, own, opp, moves, first, depth):
+        """ Positions after each of `moves` as (move, own, opp), ordered: `first` (best move from the table or
+            the previous iteration), then by square weight and, when there's enough depth left to pay for it,
+            by the opponent's mobility.
+        """
+        geom, weights, out = self.geom, self.weights, []
+        while moves:
+            move   = moves & -moves
+            moves ^= move
+            flips  = geom.flips(move, own, opp)
+            out.append((move, own | move | flips, opp & ~flips))
+
+        if depth > 2:
+            key = lambda c: (c[0] != first, -weights[c[0]], popcount(geom.moves(c[2], c[1])))
+        else:
+            key = lambda c: (c[0] != first, -weights[c[0]])
+        out.sort(key=key)
+        return out
+
+    def evaluate(self, own, opp, own_moves=None):
+        """Static score of a position for the side to move with `own` pieces."""
+        geom  = self.geom
+        score = 0
+        for mask, weight in self.squares:
+            score += weight * (popcount(own & mask) - popcount(opp & mask))
+        if own_moves is None:
+            own_moves = geom.moves(own, opp)
+        return score + mobility * (popcount(own_moves) - popcount(geom.moves(opp, own)))
+
+    def final_score(self, own, opp):
+        diff = popcount(own) - popcount(opp)
+        return WIN + diff if diff > 0 else -WIN + diff if diff < 0 else 0
+
+    def solve(self, own, opp):
+        """ Search to the end of the game; return (best move bit, final piece margin of the side to move) with
+            perfect play by both sides; the move is 0 if the side to move has to pass.
+        """
+        self.end_table.clear()
+        moves = self.geom.moves(own, opp)
+        if not moves:
+            return 0, self.exact(own, opp, -INF, INF)
+
+        alpha, best = -INF, 0
+        for move, new_own, new_opp in self.end_children(own, opp, moves):
+            score = -self.exact(new_opp, new_own, -INF, -alpha)
+            if score > alpha:
+                alpha, best = score, move
+        return best, alpha
+
+    def exact(self, own, opp, alpha, beta):
+        """Final piece margin of the side to move with perfect play, within the alpha-beta window."""
+        self.nodes += 1
+        geom  = self.geom
+        moves = geom.moves(own, opp)
+        if not moves:
+            if not geom.moves(opp, own):
+                return popcount(own) - popcount(opp)
+            return -self.exact(opp, own, -beta, -alpha)         # pass
+
+        key, table = (own, opp), self.end_table
+        entry      = table.get(key)
+        if entry:
+            bound, value = entry
+            if bound == EXACT                   : return value
+            if bound == LOWER and value >= beta : return value
+            if bound == UPPER and value <= alpha: return value
+
+        orig_alpha, best = alpha, -INF
+        if popcount(geom.full & ~(own | opp)) > sort_empties:
+            children = self.end_children(own, opp, moves)
+        else:
+            children = self.children(own, opp, moves, 0, 0)
+        for move, new_own, new_opp in children:
+            score = -self.exact(new_opp, new_own, -beta, -alpha)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if popcount(moves) > 1:
+            table[key] = (UPPER if best <= orig_alpha else LOWER if best >= beta else EXACT, best)
+        return best
+
+    def end_children(self, own, opp, moves):
+        """Positions after each of `moves` as in `children()`, the ones leaving the opponent fewest moves first."""
+        geom, out = self.geom, []
+        while moves:
+            move   = moves & -moves
+            moves ^= move
+            flips  = geom.flips(move, own, opp)
+            new    = own | move | flips, opp & ~flips
+            out.append((popcount(geom.moves(new[1], new[0])), move) + new)
+        out.sort()
+        return [c[1:] for c in out]
+
+
+def bits_of(mask):
+    while mask:
+        bit   = mask & -mask
+        mask ^= bit
+        yield bit
+
+def square_weights(width, height):
+    """ Return a list of (mask, weight) for squares of a `width` x `height` board that aren't worth 0: corners,
+        squares next to corners and edges.
+    """
+    geom    = bit_geometry(width, height)
+    masks   = dict.fromkeys((corner_weight, x_weight, c_weight, edge_weight), 0)
+    last    = width - 1, height - 1
+    corners = [(x, y) for x in (0, last[0]) for y in (0, last[1])]
+
+    def near(x, y, corner, diagonal):
+        dx, dy = abs(x - corner[0]), abs(y - corner[1])
+        return (dx, dy) == (1, 1) if diagonal else sorted((dx, dy)) == [0, 1]
+
+    for loc in geom.locs:
+        x, y = loc.x, loc.y
+        if (x, y) in corners                              : w = corner_weight
+        elif any(near(x, y, c, True) for c in corners)    : w = x_weight
+        elif any(near(x, y, c, False) for c in corners)   : w = c_weight
+        elif x in (0, last[0]) or y in (0, last[1])       : w = edge_weight
+        else                                              : continue
+        masks[w] |= geom.bit(loc)
+    return [(mask, w) for w, mask in masks.items() if mask]
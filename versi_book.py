@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+""" Opening book for Versi: best moves of early positions, found offline by a deep search.
+
+    python versi_book.py [--size N] [--plies N] [--depth N] [--workers N] FILE
+
+    builds a book of all positions up to `plies` moves into the game, searched to `depth` (see `versi_ai`).
+
+    Positions that are rotations or reflections of each other share an entry: a position is keyed by a 64-bit
+    hash of its canonical form, the smallest of its symmetric (own, opp) bitboard pairs, with `own` the pieces
+    of the side to move. The stored move is in the canonical orientation and mapped back on lookup.
+
+    Book file layout (little-endian):
+
+        header - fixed size, see `header` below
+        slots  - open addressing hash table of `slot` structs: key, move index + 1 (0 for a free slot) and
+                 the search score; lookups probe from slot `key % number of slots`.
+
+    The file is read through a memory map, so that a lookup touches a slot or two rather than loading the book.
+"""
+
+import os
+import sys
+import mmap
+import struct
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+from utils import option
+from versi_engine import bit_geometry, popcount
+from versi_ai import Search
+
+file_magic = b"SGVB\x01"    # book magic and format version
+
+# magic, width, height, number of slots, most pieces of a position in the book
+header     = struct.Struct("<5sHHII")
+slot       = struct.Struct("<QHi")
+load       = 0.5            # highest ratio of entries to slots
+
+
+class Symmetries(object):
+    """ Rotations and reflections of a `width` x `height` board (8 for a square board, 4 otherwise), as tables
+        of the bit each bit index is moved to; `inverse` tables move them back.
+    """
+    def __init__(self, width, height):
+        self.geom  = geom = bit_geometry(width, height)
+        w, h       = width - 1, height - 1
+        maps       = [lambda x, y: (x, y), lambda x, y: (w-x, y), lambda x, y: (x, h-y), lambda x, y: (w-x, h-y)]
+        if width == height:
+            maps  += [lambda x, y: (y, x), lambda x, y: (w-y, x), lambda x, y: (y, h-x), lambda x, y: (w-y, h-x)]
+
+        self.tables, self.inverse = [], []
+        for fn in maps:
+            table, inverse = [0] * (width*height), [0] * (width*height)
+            for loc in geom.locs:
+                x, y = fn(loc.x, loc.y)
+                i, j = loc.y*width + loc.x, y*width + x
+                table[i], inverse[j] = 1 << j, 1 << i
+            self.tables.append(table)
+            self.inverse.append(inverse)
+
+    def transform(self, mask, table):
+        out = 0
+        while mask:
+            low   = mask & -mask
+            out  |= table[low.bit_length() - 1]
+            mask ^= low
+        return out
+
+    def canonical(self, own, opp):
+        """Return (own, opp, n): the canonical form of the position and the number of the symmetry giving it."""
+        return min( (self.transform(own, t), self.transform(opp, t), n) for n, t in enumerate(self.tables) )
+
+
+def position_key(own, opp, nbytes):
+    data = own.to_bytes(nbytes, "little") + opp.to_bytes(nbytes, "little")
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+
+class Book(object):
+    """Opening book file at `path`, read through a memory map."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.width, self.height, self.slots, self.max_pieces = header.unpack_from(self.map, 0)
+        if magic != file_magic:
+            self.close()
+            raise ValueError("%s is not a Versi opening book" % path)
+        self.symmetries = symmetries(self.width, self.height)
+        self.nbytes     = (self.width*self.height + 7) // 8
+
+    def lookup(self, own, opp):
+        """Return (move bit, score) for the side to move with `own` pieces, or None if the position isn't in the book."""
+        if popcount(own | opp) > self.max_pieces:
+            return None
+        sym            = self.symmetries
+        own, opp, n    = sym.canonical(own, opp)
+        key            = position_key(own, opp, self.nbytes)
+        i              = key % self.slots
+        while True:
+            skey, move, score = slot.unpack_from(self.map, header.size + i*slot.size)
+            if not move:
+                return None
+            if skey == key:
+                return sym.inverse[n][move - 1], score
+            i = (i + 1) % self.slots
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_books = {}
+
+def open_book(path):
+    """ Return the `Book` at `path`, opened once per process and shared, e.g. by all games played by a tournament
+        worker; it's closed when the process exits (including pool worker processes, where `atexit` doesn't run).
+    """
+    book = _books.get(path)
+    if book is None:
+        book = _books[path] = Book(path)
+        Finalize(None, book.close, exitpriority=0)
+    return book
+
+def find_book(path, width, height):
+    """ Return the shared `Book` at `path` if there's one for a `width` x `height` board, or None if there's no
+        such file or it's a book of another board size.
+    """
+    if path not in _books:
+        _books[path] = open_book(path) if path and os.path.exists(path) else None
+    book = _books[path]
+    return book if book and (book.width, book.height) == (width, height) else None
+
+_symmetries = {}
+
+def symmetries(width, height):
+    """Return the `Symmetries` shared by all boards of `width` x `height` size."""
+    key = width, height
+    if key not in _symmetries:
+        _symmetries[key] = Symmetries(width, height)
+    return _symmetries[key]
+
+
+def write_book(path, width, height, entries):
+    """Write a book of `entries`, a dict of canonical (own, opp) to (move bit, score), to `path`."""
+    nslots = max(int(len(entries) / load), 1) | 1
+    nbytes = (width*height + 7) // 8
+    table  = [None] * nslots
+    for (own, opp), (move, score) in entries.items():
+        key = position_key(own, opp, nbytes)
+        i   = key % nslots
+        while table[i]:
+            i = (i + 1) % nslots
+        table[i] = (key, move.bit_length(), score)
+
+    max_pieces = max((popcount(own | opp) for own, opp in entries), default=0)
+    with open(path, "wb") as f:
+        f.write(header.pack(file_magic, width, height, nslots, max_pieces))
+        f.write(b''.join(slot.pack(*(entry or (0, 0, 0))) for entry in table))
+
+def opening_positions(width, height, plies):
+    """Canonical (own, opp) positions with the side to move to play, up to `plies` moves into the game."""
+    geom, sym = bit_geometry(width, height), symmetries(width, height)
+    x, y      = width//2 - 1, height//2 - 1
+    bit       = lambda x, y: 1 << (y*width + x)
+    start     = sym.canonical(bit(x, y) | bit(x+1, y+1), bit(x+1, y) | bit(x, y+1))[:2]
+    seen, level = {start}, [start]
+
+    for _ in range(plies):
+        nxt = []
+        for own, opp in level:
+            for move in geom.locs_of(geom.moves(own, opp)):
+                new_own, new_opp = geom.play(geom.bit(move), own, opp)
+                if not geom.moves(new_opp, new_own):
+                    continue                    # passes and finished games are rare this early; leave them out
+                pos = sym.canonical(new_opp, new_own)[:2]
+                if pos not in seen:
+                    seen.add(pos)
+                    nxt.append(pos)
+        level = nxt
+    return [pos for pos in seen if geom.moves(*pos)]
+
+def search_position(width, height, depth, pos):
+    search = Search(width, height, budget=float("inf"), max_depth=depth)
+    move   = search.search(*pos)
+    return pos, (move, search.info.score)
+
+def build(path, width, height, plies=4, depth=4, workers=None, progress=None):
+    """ Search all positions up to `plies` moves into the game to `depth` on `workers` processes and write the
+        book to `path`; return the number of positions. `progress(done, total)` is called as positions are done.
+    """
+    positions = sorted(opening_positions(width, height, plies))
+    entries   = {}
+    with ProcessPoolExecutor(workers) as pool:
+        tasks = [pool.submit(search_position, width, height, depth, pos) for pos in positions]
+        for n, task in enumerate(tasks, 1):
+            pos, entry   = task.result()
+            entries[pos] = entry
+            if progress:
+                progress(n, len(positions))
+    write_book(path, width, height, entries)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    import versi
+    args    = sys.argv[1:]
+    size    = option(args, "--size", versi.size, int)
+    plies   = option(args, "--plies", 4, int)
+    depth   = option(args, "--depth", 4, int)
+    workers = option(args, "--workers", None, int)
+
+    if len(args) != 1:
+        sys.exit(__doc__)
+
+    def progress(done, total):
+        print("\r%d / %d positions" % (done, total), end='', file=sys.stderr)
+        sys.stderr.flush()
+
+    n = build(args[0], size, size, plies, depth, workers, progress)
+    print("\n%s: %d positions" % (args[0], n), file=sys.stderr)
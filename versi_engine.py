@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+""" Bitboard engine for Versi.
+
+    A side's pieces are an int with bit `y*width + x` set for each piece, so that a position is two ints.
+    Moving all pieces of a bitboard one cell in a direction is a shift plus a mask that keeps pieces from
+    wrapping around the board edge; with that, the legal moves of a side and the pieces flipped by a move are
+    found for all cells at once, one direction at a time.
+
+        bit_geometry(w, h) - shared `BitGeometry` of a board size: `moves()`, `flips()`, `locs_of()`
+        VersiBits          - board watcher that keeps the bitboards of a `versi.VersiBoard` in sync
+"""
+
+from utils import first
+from board import dirs8, geometry
+
+try                   : popcount = int.bit_count
+except AttributeError : popcount = lambda n: bin(n).count('1')
+
+
+class BitGeometry(object):
+    """ Shifts and masks of a `width` x `height` board; use `bit_geometry()` to get the shared instance.
+
+        dirs - (shift, mask) for each of `dirs8`: shift is the change of the bit index for one step in the
+               direction, `mask` has the cells a piece can step from without leaving the board.
+    """
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.full = (1 << width*height) - 1
+        self.locs = geometry(width, height).locs
+
+        first_col = sum(1 << y*width for y in range(height))
+        last_col  = first_col << (width - 1)
+        self.dirs = []
+        for dx, dy in dirs8:
+            mask = self.full & ~last_col if dx > 0 else self.full & ~first_col if dx < 0 else self.full
+            self.dirs.append((dy*width + dx, mask))
+
+    def bit(self, loc):
+        return 1 << (loc.y*self.width + loc.x)
+
+    def locs_of(self, mask):
+        """Locations of the set bits of `mask`, in row order."""
+        locs, out = self.locs, []
+        while mask:
+            low = mask & -mask
+            out.append(locs[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def moves(self, own, opp):
+        """Mask of legal moves of the side with pieces `own` against `opp`."""
+        empty, legal = self.full & ~(own | opp), 0
+
+        for shift, mask in self.dirs:
+            # `run` has the pieces of `opp` at distance 1, 2, ... in a line from a piece of `own`
+            opp_m = opp & mask
+            if shift > 0:
+                run = ((own & mask) << shift) & opp_m
+                while run:
+                    legal |= (run << shift) & empty
+                    run    = (run << shift) & opp_m
+            else:
+                shift = -shift
+                run   = ((own & mask) >> shift) & opp_m
+                while run:
+                    legal |= (run >> shift) & empty
+                    run    = (run >> shift) & opp_m
+        return legal
+
+    def flips(self, move, own, opp):
+        """Mask of pieces of `opp` flipped by the side with pieces `own` placing a piece at `move` bit."""
+        flips = 0
+        for shift, mask in self.dirs:
+            opp_m, run = opp & mask, 0
+            if shift > 0:
+                cur = ((move & mask) << shift) & opp_m
+                while cur:
+                    run |= cur
+                    nxt  = cur << shift
+                    if nxt & own:
+                        flips |= run
+                        break
+                    cur = nxt & opp_m
+            else:
+                shift = -shift
+                cur   = ((move & mask) >> shift) & opp_m
+                while cur:
+                    run |= cur
+                    nxt  = cur >> shift
+                    if nxt & own:
+                        flips |= run
+                        break
+                    cur = nxt & opp_m
+        return flips
+
+    def play(self, move, own, opp):
+        """Return (own, opp) after the side with `own` places a piece at `move` bit, with flipped pieces."""
+        flips = self.flips(move, own, opp)
+        return own | move | flips, opp & ~flips
+
+
+_bit_geometries = {}
+
+def bit_geometry(width, height):
+    """Return the `BitGeometry` shared by all boards of `width` x `height` size."""
+    key = width, height
+    if key not in _bit_geometries:
+        _bit_geometries[key] = BitGeometry(width, height)
+    return _bit_geometries[key]
+
+
+class VersiBits(object):
+    """ Board watcher that keeps a bitboard of pieces for each of `chars` (player chars), updated as pieces are
+        placed and flipped; move generation works on the bitboards and the board's tiles are only a view.
+
+        Piece counts are kept in `counts` as cells change owner, and the legal moves mask of each player is
+        cached until the next change, so that scores and repeated move lists cost nothing per `draw()` or turn.
+    """
+    def __init__(self, width, height, chars):
+        self.geom   = bit_geometry(width, height)
+        self.chars  = chars
+        self.bits   = dict.fromkeys(chars, 0)
+        self.counts = dict.fromkeys(chars, 0)
+        self.legal  = {}
+
+    def reset(self, board):
+        self.bits   = dict.fromkeys(self.chars, 0)
+        self.counts = dict.fromkeys(self.chars, 0)
+        self.legal  = {}
+        for loc in board.geom.locs:
+            self.update(board, loc, board[loc])
+
+    def update(self, board, loc, tile):
+        bit, char = self.geom.bit(loc), getattr(tile, "char", None)
+        bits      = self.bits
+        owner     = first(c for c in self.chars if bits[c] & bit)
+        if char not in bits:
+            char = None
+        if owner == char:
+            return
+
+        if owner is not None:
+            bits[owner]        &= ~bit
+            self.counts[owner] -= 1
+        if char is not None:
+            bits[char]        |= bit
+            self.counts[char] += 1
+        self.legal.clear()
+
+    def cell_changed(self, board, loc, old, new):
+        self.update(board, loc, new)
+
+    def tile_changed(self, board, loc, tile, attr, old):
+        self.update(board, loc, tile)
+
+    def clone(self, board):
+        new        = VersiBits(self.geom.width, self.geom.height, self.chars)
+        new.bits   = dict(self.bits)
+        new.counts = dict(self.counts)
+        new.legal  = dict(self.legal)
+        return new
+
+    def sides(self, char):
+        """Return (own, opp) bitboards for the player with `char`."""
+        bits = self.bits
+        return bits[char], sum(b for c, b in bits.items() if c != char)
+
+    def moves(self, char):
+        """Mask of legal moves of player `char`."""
+        try:
+            return self.legal[char]
+        except KeyError:
+            self.legal[char] = mask = self.geom.moves(*self.sides(char))
+            return mask
+
+    def flips(self, char, loc):
+        """Mask of pieces flipped by player `char` moving at `loc`; 0 if it's not a legal move."""
+        own, opp = self.sides(char)
+        bit      = self.geom.bit(loc)
+        if (own | opp) & bit:
+            return 0
+        return self.geom.flips(bit, own, opp)
+
+    def count(self, char):
+        return self.counts[char]
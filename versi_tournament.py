@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+""" Versi self-play tournaments: two AI variants play many games in parallel processes.
+
+    python versi_tournament.py [--games N] [--workers N] [--size N] [--seed N] [--sprt ELO0,ELO1] A B
+
+    A variant is `greedy` (the corner-first, most-captures player) or `search` with optional settings, e.g.
+    `search:depth=4` or `search:time=0.2,depth=6,endgame=12,book=versi.book` (see `versi_ai.Search`); a search
+    variant solves endgames as in `versi` unless `endgame=0` is given, and only uses an opening book if given.
+
+    Game `i` is played with seed `seed + i//2`, and the two games of a seed are played with colours swapped,
+    so that each variant gets the same openings as either side. Greedy and depth-limited search variants play
+    the same games on every run; time-limited searches depend on the speed of the machine.
+
+    Results are from the point of view of A. With `--sprt`, the tournament stops as soon as a sequential
+    probability ratio test accepts either that A is `ELO0` stronger than B (H0) or that it's `ELO1` stronger
+    (H1); games are taken into account in order, so that the stopping point is reproducible as well.
+"""
+
+import os
+import sys
+from copy import copy
+from math import log, log10, sqrt
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer
+
+from utils import Container, option
+import versi
+from versi_ai import Search
+from versi_book import open_book
+
+
+def variant(spec):
+    """ Parse a variant `spec`; return a Container with `name`, and the search `budget`, `depth`, `endgame` and
+        `book` (if any).
+    """
+    kind, _, settings = spec.partition(':')
+    if kind not in ("greedy", "search") or (kind == "greedy" and settings):
+        raise ValueError("Unknown Versi AI variant %r" % spec)
+
+    v = Container(name=spec, search=kind == "search", budget=versi.search_time, depth=versi.search_depth,
+                  endgame=versi.endgame, book=None)
+    for setting in filter(None, settings.split(',')):
+        name, _, val = setting.partition('=')
+        if name == "time"      : v.budget  = float(val)
+        elif name == "depth"   : v.depth   = int(val)
+        elif name == "endgame" : v.endgame = int(val)
+        elif name == "book"    : v.book    = val
+        else                   : raise ValueError("Unknown setting %r in Versi AI variant %r" % (name, spec))
+    return v
+
+def play_game(size, seed, first, second):
+    """ Play a game of `first` variant against `second` on a `size` board in this process; return a Container
+        with `scores` of first and second player, number of `moves` and the `time` taken. Opening books are
+        opened once per process, see `versi_book.open_book()`.
+    """
+    versi.size = size
+    searchers  = [Search(size, size, v.budget, v.depth, endgame=v.endgame, book=v.book and open_book(v.book))
+                  if v.search else None for v in (first, second)]
+    start      = default_timer()
+    result     = versi.play(seed, searchers=searchers)
+    return Container(scores=result.scores, moves=len(versi.versi.moves), time=default_timer() - start)
+
+
+class Tally(object):
+    """Wins, draws and losses of A against B, with piece margins and game lengths."""
+    def __init__(self):
+        self.wins = self.draws = self.losses = 0
+        self.margin = self.moves = self.time = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, own, opp, moves, time):
+        """Add a game that ended with `own` pieces of A and `opp` of B."""
+        if own > opp   : self.wins   += 1
+        elif own < opp : self.losses += 1
+        else           : self.draws  += 1
+        self.margin += own - opp
+        self.moves  += moves
+        self.time   += time
+
+    def score(self):
+        """Average score of A per game, counting a draw as half a win."""
+        return (self.wins + self.draws/2) / self.games
+
+    def variance(self):
+        """Variance of A's score per game."""
+        mean = self.score()
+        return (self.wins * (1 - mean)**2 + self.draws * (0.5 - mean)**2 + self.losses * mean**2) / self.games
+
+    def elo(self):
+        """Return (difference, margin of error) in Elo of A over B, with 95% confidence."""
+        error = 1.96 * sqrt(self.variance() / self.games)
+        mean  = self.score()
+        if not 0 < mean < 1:
+            return elo(mean), float("inf")
+        return elo(mean), (elo(mean + error) - elo(mean - error)) / 2
+
+    def report(self):
+        games = self.games
+        diff, error = self.elo()
+        return ("games: %d   +%d =%d -%d   score: %.1f%%   elo: %+.0f ±%.0f\n"
+                "average margin: %+.1f pieces   average length: %.1f moves   %.0f moves/sec per worker" %
+                (games, self.wins, self.draws, self.losses, 100 * self.score(), diff, error,
+                 self.margin / games, self.moves / games, self.moves / self.time if self.time else 0))
+
+
+class SPRT(object):
+    """ Sequential probability ratio test of H0: A is `elo0` stronger than B, against H1: A is `elo1` stronger,
+        with `alpha` and `beta` error rates; uses the normal approximation of the log-likelihood ratio.
+    """
+    def __init__(self, elo0=0, elo1=10, alpha=0.05, beta=0.05):
+        self.elo0, self.elo1 = elo0, elo1
+        self.lower           = log(beta / (1 - alpha))
+        self.upper           = log((1 - beta) / alpha)
+
+    def llr(self, tally):
+        if not tally.variance():
+            # all games had the same result: count one more win and loss, so that a one-sided match can stop
+            tally = copy(tally)
+            tally.add(1, 0, 0, 0)
+            tally.add(0, 1, 0, 0)
+        s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+        return tally.games * (s1 - s0) * (2 * tally.score() - s0 - s1) / (2 * tally.variance())
+
+    def status(self, tally):
+        """Return "H0" or "H1" if the hypothesis is accepted after the games of `tally`, or None."""
+        llr = self.llr(tally)
+        return "H0" if llr <= self.lower else "H1" if llr >= self.upper else None
+
+    def report(self, tally):
+        return "SPRT elo0=%g elo1=%g: llr %.2f [%.2f, %.2f]" % (self.elo0, self.elo1, self.llr(tally),
+                                                                 self.lower, self.upper)
+
+
+def expected_score(diff):
+    return 1 / (1 + 10**(-diff / 400))
+
+def elo(score):
+    if score <= 0 : return -float("inf")
+    if score >= 1 : return float("inf")
+    return -400 * log10(1/score - 1)
+
+
+def tournament(a, b, games=100, workers=None, size=None, seed=0, sprt=None, progress=None):
+    """ Play up to `games` games of variant `a` against `b` (variants or specs) on `workers` processes (by
+        default, one per CPU); return a Container with the `tally`, the SPRT `status` (if `sprt` is given),
+        the wall-clock `time` taken and `games_sec`.
+
+        `progress(tally)` is called after each game.
+    """
+    a, b     = [variant(v) if isinstance(v, str) else v for v in (a, b)]
+    size     = size or versi.size
+    tally    = Tally()
+    status   = None
+    start    = default_timer()
+
+    def task(i):
+        a_first = not i % 2
+        return (size, seed + i//2) + ((a, b) if a_first else (b, a))
+
+    workers  = workers or os.cpu_count() or 1
+    window   = 2 * workers              # games queued ahead, so that stopping early wastes little
+    futures  = {}
+    queued   = 0
+    with ProcessPoolExecutor(workers) as pool:
+        for i in range(games):
+            while queued < min(i + window, games):
+                futures[queued] = pool.submit(play_game, *task(queued))
+                queued += 1
+
+            game     = futures.pop(i).result()
+            own, opp = game.scores if not i % 2 else reversed(game.scores)
+            tally.add(own, opp, game.moves, game.time)
+            if progress:
+                progress(tally)
+            status = sprt and sprt.status(tally)
+            if status:
+                break
+
+        for f in futures.values():
+            f.cancel()
+
+    elapsed = default_timer() - start
+    return Container(tally=tally, status=status, time=elapsed, games_sec=tally.games / elapsed)
+
+
+if __name__ == "__main__":
+    args    = sys.argv[1:]
+    games   = option(args, "--games", 100, int)
+    workers = option(args, "--workers", None, int)
+    size    = option(args, "--size", None, int)
+    seed    = option(args, "--seed", 0, int)
+    sprt    = option(args, "--sprt")
+
+    if len(args) != 2:
+        sys.exit(__doc__)
+    if sprt:
+        sprt = SPRT(*map(float, sprt.split(',')))
+
+    def progress(tally):
+        print("\r%s: %d games, score %.1f%%" % (' vs '.join(args), tally.games, 100 * tally.score()),
+              end='', file=sys.stderr)
+        sys.stderr.flush()
+
+    result = tournament(args[0], args[1], games, workers, size, seed, sprt, progress)
+    print(file=sys.stderr)
+    print(result.tally.report())
+    if sprt:
+        print(sprt.report(result.tally), "-", result.status or "inconclusive")
+    print("%.1f games/sec" % result.games_sec)
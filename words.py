@@ -2,11 +2,14 @@
 
 # Imports {{{
 import sys
+import random
 from random import choice as rndchoice
 
 from utils import TextInput, sjoin, enumerate1, range1, first, space, nl
+from utils import is_headless, headless_mode, GameOver
 from avkutil import Term
 from commands import BaseCommands
+from inputs import input_from, record_session
 
 
 num_words      = 5
@@ -38,8 +41,10 @@ commands    = {
 # }}}
 
 class Commands(BaseCommands):
-    def __init__(self, term, commands):
-        self.commands = commands
+    commands = commands
+
+    def __init__(self, term, commands=None):
+        self.commands = commands or self.commands
         self.term = term
 
     def move_dir(self, dir):
@@ -128,15 +133,14 @@ class Words(object):
 
     def __init__(self, wordlist):
         self.random_reveals = random_reveals
-        self.words          = set()
+        self.words          = []     # a list rather than a set, so that the order is the same for a given seed
 
         while len(self.words) < num_words:
             word = Word( rndchoice(wordlist).rstrip() )
             if (limit9 and len(word)>9) or len(word) < 3:
                 continue
-            self.words.add(word)
+            self.words.append(word)
 
-        self.words   = list(self.words)
         self.guesses = sum(len(w) for w in self.words) // guesses_divby
         self.current = 0,0
         self.hl_visible = False
@@ -151,6 +155,8 @@ class Words(object):
         return iter(self.words)
 
     def display(self):
+        if is_headless():
+            return
         print(nl*25)
 
         for n, word in enumerate(self.words):
@@ -178,8 +184,9 @@ class Words(object):
     def game_end(self, won):
         self.display()
         msg = self.winmsg % (self.random_reveals*3 + self.guesses) if won else self.losemsg
-        print(msg)
-        sys.exit()
+        if not is_headless():
+            print(msg)
+        raise GameOver(won)
 
 
 class BasicInterface(object):
@@ -190,19 +197,46 @@ class BasicInterface(object):
             words.check_end()
 
     def get_move(self):
-        while True:
-            cmd = term.getch()
-            try:
-                val = commands[cmd]()
-                if val:
-                    return val
-            except KeyError:
-                print("unknown command:", cmd)
-            words.check_end()
+        with term.raw():
+            while True:
+                cmd = term.getch()
+                try:
+                    val = commands[cmd]()
+                    if val:
+                        return val
+                except KeyError:
+                    if not is_headless():
+                        print("unknown command:", cmd)
+                words.check_end()
+
+def setup():
+    """Create the terminal, the words and commands in module globals."""
+    global term, words, commands
+    with open(wordsfn) as f:
+        wordlist = f.readlines()
+    term     = Term()
+    words    = Words(wordlist)
+    commands = Commands(term)
+
+def replay(source, seed=None):
+    """ Replay a session recorded with `--record` from input `source` in headless mode; return True if all
+        words were revealed, False if the player ran out of guesses, or None if the recording ends first.
+    """
+    random.seed(seed)
+    with headless_mode(), input_from(source):
+        setup()
+        try:
+            BasicInterface().run()
+        except GameOver as e:
+            return e.result
+        except (EOFError, SystemExit):
+            return None
 
 
 if __name__ == "__main__":
-    term = Term()
-    words = Words(open(wordsfn).readlines())
-    commands = Commands(term, commands)
-    BasicInterface().run()
+    record_session("words")
+    setup()
+    try:
+        BasicInterface().run()
+    except (KeyboardInterrupt, GameOver):
+        sys.exit()